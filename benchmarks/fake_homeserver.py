@@ -0,0 +1,469 @@
+"""In-process stand-in for a Matrix homeserver.
+
+Implements just enough of the client-server API for Vox: register, login,
+filters, sync (with long-polling, filters, invites and limited timelines),
+createRoom (with power levels), room aliases, join, invite, send, state
+events, /messages and media upload/download (authenticated v1 download only).
+Everything lives in memory; stream tokens are positions in one global event
+log. Use `HomeserverThread` to run it next to code that calls
+``asyncio.run`` itself (such as the CLI).
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+API = "/_matrix/client/v3"
+MEDIA_API = "/_matrix/media/v3"
+MEDIA_DOWNLOAD = "/_matrix/client/v1/media/download"
+
+# Timeline length used when a sync filter does not set one (Synapse's default).
+DEFAULT_TIMELINE_LIMIT = 10
+
+# retry_after_ms sent with injected 429 responses.
+RETRY_AFTER_MS = 20
+
+
+def _error(status: int, errcode: str, message: str) -> web.Response:
+    return web.json_response({"errcode": errcode, "error": message}, status=status)
+
+
+def _matches(event: Dict[str, Any], event_filter: Dict[str, Any]) -> bool:
+    """Apply the ``types``/``not_types`` parts of a Matrix event filter."""
+    types = event_filter.get("types")
+    not_types = event_filter.get("not_types") or []
+    if "*" in not_types or event["type"] in not_types:
+        return False
+    return types is None or event["type"] in types
+
+
+class FakeRoom:
+    """One room: membership, current state and its events in stream order."""
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.joined: Set[str] = set()
+        self.invited: Set[str] = set()
+        self.state: Dict[Tuple[str, str], Tuple[int, Dict[str, Any]]] = {}
+        self.events: List[Tuple[int, Dict[str, Any]]] = []
+        self.power_levels: Dict[str, Any] = {}
+
+    def can_send(self, user_id: str, event_type: str) -> bool:
+        levels = self.power_levels
+        needed = levels.get("events", {}).get(event_type, levels.get("events_default", 0))
+        return levels.get("users", {}).get(user_id, levels.get("users_default", 0)) >= needed
+
+
+class FakeHomeserver:
+    """A single-process, in-memory Matrix homeserver for tests and benchmarks."""
+
+    def __init__(self, domain: str = "127.0.0.1"):
+        self.domain = domain
+        self.passwords: Dict[str, str] = {}
+        self.tokens: Dict[str, str] = {}
+        self.filters: Dict[str, Dict[str, Any]] = {}
+        self.rooms: Dict[str, FakeRoom] = {}
+        self.aliases: Dict[str, str] = {}
+        self.stream: List[Dict[str, Any]] = []
+        self.txns: Dict[Tuple[str, str, str], str] = {}
+        # Uploaded media by media ID: (content type, bytes)
+        self.media: Dict[str, Tuple[str, bytes]] = {}
+        # Requests served, by route name (e.g. "sync", "send")
+        self.requests: Counter = Counter()
+        # Fault injection, by route name: the next N requests are rejected
+        # with 429 M_LIMIT_EXCEEDED (``throttle``), or are handled but answered
+        # with a 502 as if a proxy lost the response (``lose_response``).
+        self.throttle: Counter = Counter()
+        self.lose_response: Counter = Counter()
+        self._ids = itertools.count(1)
+        self._new_events: Optional[asyncio.Condition] = None
+        self.app = web.Application(middlewares=[self._count], client_max_size=1024 ** 3)
+        self.app.add_routes([
+            web.post(f"{API}/register", self.register),
+            web.post(f"{API}/login", self.login),
+            web.post(f"{API}/user/{{user_id}}/filter", self.upload_filter),
+            web.get(f"{API}/sync", self.sync),
+            web.post(f"{API}/createRoom", self.create_room),
+            web.get(f"{API}/directory/room/{{alias}}", self.resolve_alias),
+            web.post(f"{API}/join/{{room}}", self.join),
+            web.post(f"{API}/rooms/{{room_id}}/join", self.join),
+            web.post(f"{API}/rooms/{{room_id}}/invite", self.invite),
+            web.put(f"{API}/rooms/{{room_id}}/send/{{event_type}}/{{txn_id}}", self.send),
+            web.put(f"{API}/rooms/{{room_id}}/state/{{event_type}}", self.put_state),
+            web.put(f"{API}/rooms/{{room_id}}/state/{{event_type}}/{{state_key:.*}}", self.put_state),
+            web.get(f"{API}/rooms/{{room_id}}/messages", self.messages),
+            web.post(f"{MEDIA_API}/upload", self.upload),
+            web.get(f"{MEDIA_DOWNLOAD}/{{server}}/{{media_id}}", self.download),
+        ])
+
+    @web.middleware
+    async def _count(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        route = request.match_info.route.resource
+        name = handler.__name__ if route is not None else "unknown"
+        self.requests[name] += 1
+        if self.throttle[name] > 0:
+            self.throttle[name] -= 1
+            return web.json_response(
+                {"errcode": "M_LIMIT_EXCEEDED", "error": "Too many requests",
+                 "retry_after_ms": RETRY_AFTER_MS},
+                status=429,
+            )
+        response = await handler(request)
+        if self.lose_response[name] > 0:
+            self.lose_response[name] -= 1
+            return _error(502, "M_UNKNOWN", "Bad gateway")
+        return response
+
+    # -- helpers -----------------------------------------------------------
+
+    def _user(self, request: web.Request) -> Optional[str]:
+        token = request.query.get("access_token")
+        header = request.headers.get("Authorization", "")
+        if not token and header.startswith("Bearer "):
+            token = header[len("Bearer "):]
+        return self.tokens.get(token or "")
+
+    def _issue_token(self, user_id: str) -> Dict[str, str]:
+        token = uuid.uuid4().hex
+        self.tokens[token] = user_id
+        return {"user_id": user_id, "access_token": token, "device_id": f"DEV{next(self._ids)}"}
+
+    def _append(
+        self,
+        room: FakeRoom,
+        sender: str,
+        event_type: str,
+        content: Dict[str, Any],
+        state_key: Optional[str] = None,
+        txn_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Add an event to the stream and wake any long-polling syncs."""
+        event: Dict[str, Any] = {
+            "event_id": f"${next(self._ids)}:{self.domain}",
+            "type": event_type,
+            "sender": sender,
+            "content": content,
+            "origin_server_ts": int(time.time() * 1000),
+            "room_id": room.room_id,
+            "unsigned": {},
+        }
+        if txn_id is not None:
+            event["unsigned"]["transaction_id"] = txn_id
+        if state_key is not None:
+            event["state_key"] = state_key
+        self.stream.append(event)
+        position = len(self.stream)
+        room.events.append((position, event))
+        if state_key is not None:
+            room.state[(event_type, state_key)] = (position, event)
+            if event_type == "m.room.member":
+                membership = content.get("membership")
+                room.invited.discard(state_key)
+                room.joined.discard(state_key)
+                if membership == "join":
+                    room.joined.add(state_key)
+                elif membership == "invite":
+                    room.invited.add(state_key)
+        if self._new_events is not None:
+            asyncio.ensure_future(self._notify())
+        return event
+
+    async def _notify(self) -> None:
+        async with self._new_events:
+            self._new_events.notify_all()
+
+    def _room(self, room_id: str) -> Optional[FakeRoom]:
+        return self.rooms.get(self.aliases.get(room_id, room_id))
+
+    def _sync_filter(self, request: web.Request, user_id: str) -> Dict[str, Any]:
+        raw = request.query.get("filter")
+        if not raw:
+            return {}
+        if raw.startswith("{"):
+            return json.loads(raw)
+        return self.filters.get(f"{user_id}/{raw}", {})
+
+    # -- handlers ----------------------------------------------------------
+
+    async def register(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        user_id = f"@{body['username']}:{self.domain}"
+        if user_id in self.passwords:
+            return _error(400, "M_USER_IN_USE", "User ID already taken.")
+        self.passwords[user_id] = body.get("password", "")
+        return web.json_response(self._issue_token(user_id))
+
+    async def login(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        user = body.get("identifier", {}).get("user") or body.get("user", "")
+        user_id = user if user.startswith("@") else f"@{user}:{self.domain}"
+        if self.passwords.get(user_id) != body.get("password"):
+            return _error(403, "M_FORBIDDEN", "Invalid password")
+        return web.json_response(self._issue_token(user_id))
+
+    async def upload_filter(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        if user_id is None:
+            return _error(401, "M_UNKNOWN_TOKEN", "Unknown token")
+        filter_id = str(next(self._ids))
+        self.filters[f"{user_id}/{filter_id}"] = await request.json()
+        return web.json_response({"filter_id": filter_id})
+
+    async def create_room(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        if user_id is None:
+            return _error(401, "M_UNKNOWN_TOKEN", "Unknown token")
+        body = await request.json()
+        alias = None
+        if body.get("room_alias_name"):
+            alias = f"#{body['room_alias_name']}:{self.domain}"
+            if alias in self.aliases:
+                return _error(400, "M_ROOM_IN_USE", "Room alias already taken")
+        room = FakeRoom(f"!{uuid.uuid4().hex[:12]}:{self.domain}")
+        self.rooms[room.room_id] = room
+        if alias:
+            self.aliases[alias] = room.room_id
+        self._append(room, user_id, "m.room.create", {"creator": user_id}, "")
+        self._append(room, user_id, "m.room.member", {"membership": "join"}, user_id)
+        room.power_levels = {"users": {user_id: 100}}
+        room.power_levels.update(body.get("power_level_content_override") or {})
+        self._append(room, user_id, "m.room.power_levels", room.power_levels, "")
+        if body.get("name"):
+            self._append(room, user_id, "m.room.name", {"name": body["name"]}, "")
+        for invitee in body.get("invite", []):
+            self._append(room, user_id, "m.room.member", {"membership": "invite"}, invitee)
+        return web.json_response({"room_id": room.room_id})
+
+    async def resolve_alias(self, request: web.Request) -> web.Response:
+        room_id = self.aliases.get(request.match_info["alias"])
+        if room_id is None:
+            return _error(404, "M_NOT_FOUND", "Room alias not found")
+        return web.json_response({"room_id": room_id, "servers": [self.domain]})
+
+    async def join(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        if user_id is None:
+            return _error(401, "M_UNKNOWN_TOKEN", "Unknown token")
+        room = self._room(request.match_info.get("room") or request.match_info["room_id"])
+        if room is None:
+            return _error(404, "M_NOT_FOUND", "No such room")
+        if user_id not in room.joined:
+            self._append(room, user_id, "m.room.member", {"membership": "join"}, user_id)
+        return web.json_response({"room_id": room.room_id})
+
+    async def invite(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        room = self._room(request.match_info["room_id"])
+        if room is None or user_id not in room.joined:
+            return _error(403, "M_FORBIDDEN", "Not in room")
+        invitee = (await request.json())["user_id"]
+        if invitee in room.joined:
+            return _error(403, "M_FORBIDDEN", f"{invitee} is already in the room")
+        self._append(room, user_id, "m.room.member", {"membership": "invite"}, invitee)
+        return web.json_response({})
+
+    async def send(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        room = self._room(request.match_info["room_id"])
+        if room is None or user_id not in room.joined:
+            return _error(403, "M_FORBIDDEN", "Not in room")
+        if not room.can_send(user_id, request.match_info["event_type"]):
+            return _error(403, "M_FORBIDDEN", "Insufficient power level")
+        key = (user_id, room.room_id, request.match_info["txn_id"])
+        if key not in self.txns:
+            event = self._append(
+                room, user_id, request.match_info["event_type"], await request.json(),
+                txn_id=request.match_info["txn_id"],
+            )
+            self.txns[key] = event["event_id"]
+        return web.json_response({"event_id": self.txns[key]})
+
+    async def put_state(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        room = self._room(request.match_info["room_id"])
+        if room is None or user_id not in room.joined:
+            return _error(403, "M_FORBIDDEN", "Not in room")
+        state_key = request.match_info.get("state_key", "")
+        if state_key.startswith("@") and state_key != user_id:
+            return _error(403, "M_FORBIDDEN", "Cannot set another user's state")
+        event = self._append(
+            room, user_id, request.match_info["event_type"], await request.json(), state_key
+        )
+        return web.json_response({"event_id": event["event_id"]})
+
+    async def upload(self, request: web.Request) -> web.Response:
+        if self._user(request) is None:
+            return _error(401, "M_MISSING_TOKEN", "Missing token")
+        media_id = uuid.uuid4().hex
+        self.media[media_id] = (request.content_type, await request.read())
+        return web.json_response({"content_uri": f"mxc://{self.domain}/{media_id}"})
+
+    async def download(self, request: web.Request) -> web.Response:
+        if self._user(request) is None:
+            return _error(401, "M_MISSING_TOKEN", "Missing token")
+        media = self.media.get(request.match_info["media_id"])
+        if request.match_info["server"] != self.domain or media is None:
+            return _error(404, "M_NOT_FOUND", "Media not found")
+        content_type, body = media
+        return web.Response(body=body, content_type=content_type)
+
+    async def messages(self, request: web.Request) -> web.Response:
+        """Page through a room's events; tokens are stream positions."""
+        user_id = self._user(request)
+        room = self._room(request.match_info["room_id"])
+        if room is None or user_id not in room.joined:
+            return _error(403, "M_FORBIDDEN", "Not in room")
+        backwards = request.query.get("dir", "b") == "b"
+        limit = int(request.query.get("limit", DEFAULT_TIMELINE_LIMIT))
+        event_filter = json.loads(request.query.get("filter", "{}"))
+        start = request.query.get("from")
+        if start is None:
+            start = str(len(self.stream)) if backwards else "0"
+        position = int(start)
+        stop = request.query.get("to")
+
+        if backwards:
+            floor = int(stop) if stop else 0
+            candidates = [pe for pe in reversed(room.events) if floor < pe[0] <= position]
+        else:
+            ceiling = int(stop) if stop else len(self.stream)
+            candidates = [pe for pe in room.events if position < pe[0] <= ceiling]
+        chunk: List[Dict[str, Any]] = []
+        end = position
+        examined = 0
+        for pos, event in candidates:
+            examined += 1
+            end = pos - 1 if backwards else pos
+            if _matches(event, event_filter):
+                chunk.append(event)
+                if len(chunk) == limit:
+                    break
+        response: Dict[str, Any] = {"chunk": chunk, "start": start}
+        if examined < len(candidates):
+            response["end"] = str(end)  # No "end" means nothing further
+        return web.json_response(response)
+
+    async def sync(self, request: web.Request) -> web.Response:
+        user_id = self._user(request)
+        if user_id is None:
+            return _error(401, "M_UNKNOWN_TOKEN", "Unknown token")
+        since = int(request.query.get("since") or 0)
+        timeout = int(request.query.get("timeout") or 0) / 1000
+        sync_filter = self._sync_filter(request, user_id)
+
+        body = self._sync_body(user_id, since, sync_filter)
+        if since and timeout > 0 and not body["rooms"]["join"] and not body["rooms"]["invite"]:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                async with self._new_events:
+                    try:
+                        await asyncio.wait_for(
+                            self._new_events.wait(), deadline - time.monotonic()
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                body = self._sync_body(user_id, since, sync_filter)
+                if body["rooms"]["join"] or body["rooms"]["invite"]:
+                    break
+        return web.json_response(body)
+
+    def _sync_body(
+        self, user_id: str, since: int, sync_filter: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        room_filter = sync_filter.get("room", {})
+        only_rooms = room_filter.get("rooms")
+        not_rooms = room_filter.get("not_rooms") or []
+        timeline_filter = room_filter.get("timeline", {})
+        state_filter = room_filter.get("state", {})
+        limit = timeline_filter.get("limit", DEFAULT_TIMELINE_LIMIT)
+        join: Dict[str, Any] = {}
+        invite: Dict[str, Any] = {}
+
+        for room in self.rooms.values():
+            if only_rooms is not None and room.room_id not in only_rooms:
+                continue
+            if room.room_id in not_rooms:
+                continue
+            if user_id in room.joined:
+                new = [
+                    (pos, e) for pos, e in room.events
+                    if pos > since and _matches(e, timeline_filter)
+                ]
+                timeline = new[-limit:] if limit else []
+                limited = len(new) > len(timeline)
+                first = timeline[0][0] if timeline else len(self.stream) + 1
+                state = [
+                    e for pos, e in room.state.values()
+                    if (since == 0 or (limited and since < pos)) and pos < first
+                    and _matches(e, state_filter)
+                ]
+                if since and not timeline and not state:
+                    continue
+                join[room.room_id] = {
+                    "timeline": {
+                        "events": [e for _, e in timeline],
+                        "limited": limited,
+                        "prev_batch": str(first - 1),
+                    },
+                    "state": {"events": state},
+                    "ephemeral": {"events": []},
+                    "account_data": {"events": []},
+                }
+            elif user_id in room.invited:
+                position, event = room.state[("m.room.member", user_id)]
+                if position > since:
+                    invite[room.room_id] = {"invite_state": {"events": [{
+                        "type": event["type"],
+                        "state_key": event["state_key"],
+                        "sender": event["sender"],
+                        "content": event["content"],
+                    }]}}
+        return {
+            "next_batch": str(len(self.stream)),
+            "rooms": {"join": join, "invite": invite, "leave": {}},
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving on the running loop and return the base URL."""
+        self._new_events = asyncio.Condition()
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound = self._runner.addresses[0]
+        return f"http://{host}:{bound[1]}"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+class HomeserverThread:
+    """Run a FakeHomeserver on its own event loop in a background thread.
+
+    ``with HomeserverThread() as server:`` yields the FakeHomeserver, with
+    its base URL in ``server.url``.
+    """
+
+    def __init__(self, domain: str = "127.0.0.1"):
+        self.server = FakeHomeserver(domain)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def __enter__(self) -> FakeHomeserver:
+        self._thread.start()
+        future = asyncio.run_coroutine_threadsafe(self.server.start(), self._loop)
+        self.server.url = future.result(timeout=10)
+        return self.server
+
+    def __exit__(self, *exc_info: Any) -> None:
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
@@ -0,0 +1,251 @@
+"""Vox benchmark harness.
+
+Runs the CLI and storage hot paths against an in-process fake homeserver and
+prints machine-readable JSON, so results can be compared across releases::
+
+    python -m benchmarks.run --history-size 5000 --contacts 50 --rooms 20 \\
+        --agents 25 --iterations 50 --output results.json
+
+Benchmarks:
+    save_messages   Storage.save_messages, in batches (messages/s)
+    send            `vox send` to an existing room, end to end
+    send_swarm      `--agents` identities sending concurrently from one VoxPool
+    inbox           `vox inbox --timeout 0` with one new message in each of `--rooms` rooms
+    conversation    `vox conversation --limit 50` over `--history-size` messages
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from click.testing import CliRunner
+
+from vox import __version__
+from vox.cli import cli
+from vox.client import VoxClient
+from vox.pool import VoxPool
+from vox.storage import Message, Storage
+
+from .fake_homeserver import HomeserverThread
+
+SAVE_BATCH = 100
+
+
+def summarize(samples: List[float], items_per_sample: int = 1) -> Dict[str, Any]:
+    """Latency statistics (milliseconds) and throughput for timed samples (seconds)."""
+    ordered = sorted(samples)
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "per_sec": round(len(samples) * items_per_sample / total, 1) if total else None,
+    }
+
+
+def timed(fn: Callable[[], Any], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _message(i: int, conversation_id: str, sender: str, recipient: str) -> Message:
+    return Message(
+        from_vox_id=sender,
+        to_vox_id=recipient,
+        timestamp=f"2025-01-01T00:00:00.{i:06d}Z",
+        conversation_id=conversation_id,
+        body=f"benchmark message {i} with some representative text",
+    )
+
+
+class Bench:
+    """One benchmark run: identities on a fake homeserver plus a scratch directory."""
+
+    def __init__(self, args: argparse.Namespace, url: str):
+        self.args = args
+        self.url = url
+        self.root = Path(tempfile.mkdtemp(prefix="vox-bench-"))
+        self.runner = CliRunner()
+        self.me = self.root / "me"
+        self.peers = [self.root / f"peer{i}" for i in range(max(args.contacts, args.rooms, 1))]
+
+    def vox(self, *argv: str) -> str:
+        result = self.runner.invoke(cli, list(argv), env={"VOX_HOME": str(self.me)})
+        if result.exit_code != 0:
+            raise RuntimeError(f"vox {' '.join(argv)} failed: {result.output}")
+        return result.output
+
+    def setup(self) -> None:
+        """Register every identity, add the peers as contacts and open the rooms."""
+        asyncio.run(self._connect())
+        self.vox("inbox", "--timeout", "0")  # Drain the peers' joins
+
+    async def _connect(self) -> None:
+        async def register(home: Path, name: str) -> None:
+            async with VoxClient(home) as client:
+                await client.initialize(name, self.url)
+
+        await register(self.me, "bench_me")
+        await asyncio.gather(*(
+            register(home, f"bench_peer{i}") for i, home in enumerate(self.peers)
+        ))
+        async with VoxClient(self.me) as me:
+            for i in range(len(self.peers)):
+                me.add_contact(f"peer{i}", f"vox_bench_peer{i}")
+            # One room per peer; the peers join by syncing their invites
+            await me.send_batch([
+                {"to": f"peer{i}", "body": "hello"} for i in range(self.args.rooms)
+            ])
+        async with VoxPool() as pool:
+            await asyncio.gather(*(
+                pool.add(home).get_inbox(timeout=0) for home in self.peers[:self.args.rooms]
+            ))
+            for home in self.peers[:self.args.rooms]:
+                # Full Matrix ID, so replies reuse the room stored on auto-join
+                pool.add(home).add_contact("me", "@vox_bench_me:127.0.0.1")
+
+    def bench_save_messages(self) -> Dict[str, Any]:
+        storage = Storage(self.root / "save")
+        messages = [
+            _message(i, "conv_save", "vox_a", "vox_b") for i in range(self.args.history_size)
+        ]
+        batches = [messages[i:i + SAVE_BATCH] for i in range(0, len(messages), SAVE_BATCH)]
+        samples = []
+        for batch in batches:
+            started = time.perf_counter()
+            storage.save_messages("conv_save", "bench", batch)
+            samples.append(time.perf_counter() - started)
+        storage.close()
+        result = summarize(samples, SAVE_BATCH)
+        result["batch_size"] = SAVE_BATCH
+        return result
+
+    def bench_send(self) -> Dict[str, Any]:
+        return summarize(timed(lambda: self.vox("send", "peer0", "ping"), self.args.iterations))
+
+    def bench_send_swarm(self) -> Dict[str, Any]:
+        """Every agent sends `iterations` messages to `me`, all at once."""
+        agents = self.peers[:self.args.agents]
+
+        async def run() -> Tuple[float, Dict[str, int]]:
+            async with VoxPool() as pool:
+                clients = [pool.add(home) for home in agents]
+                started = time.perf_counter()
+                await asyncio.gather(*(
+                    client.send_batch([{"to": "me", "body": "swarm"}] * self.args.iterations)
+                    for client in clients
+                ))
+                return time.perf_counter() - started, dict(pool.scheduler.stats)
+
+        elapsed, stats = asyncio.run(run())
+        total = len(agents) * self.args.iterations
+        return {
+            "agents": len(agents),
+            "messages": total,
+            "seconds": round(elapsed, 3),
+            "per_sec": round(total / elapsed, 1) if elapsed else None,
+            "retries": stats.get("retries", 0),
+            "throttled": stats.get("throttled", 0),
+        }
+
+    def bench_inbox(self) -> Dict[str, Any]:
+        async def fan_in() -> None:
+            async with VoxPool() as pool:
+                await asyncio.gather(*(
+                    pool.add(home).send_message("me", "new")
+                    for home in self.peers[:self.args.rooms]
+                ))
+
+        samples = []
+        for _ in range(self.args.iterations):
+            asyncio.run(fan_in())
+            samples.append(timed(lambda: self.vox("inbox", "--timeout", "0"), 1)[0])
+        result = summarize(samples)
+        result["rooms"] = self.args.rooms
+        return result
+
+    def bench_conversation(self) -> Dict[str, Any]:
+        storage = Storage(self.me)
+        messages = [
+            _message(i, "conv_history", "vox_bench_peer0", "vox_bench_me")
+            for i in range(self.args.history_size)
+        ]
+        for i in range(0, len(messages), SAVE_BATCH):
+            storage.save_messages("conv_history", "peer0", messages[i:i + SAVE_BATCH])
+        storage.close()
+        result = summarize(timed(
+            lambda: self.vox("conversation", "conv_history", "--limit", "50"),
+            self.args.iterations,
+        ))
+        result["history_size"] = self.args.history_size
+        return result
+
+
+BENCHMARKS = ["save_messages", "send", "send_swarm", "inbox", "conversation"]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the selected benchmarks and return the JSON-ready report."""
+    with HomeserverThread() as server:
+        bench = Bench(args, server.url)
+        bench.setup()
+        results = {}
+        for name in args.only or BENCHMARKS:
+            results[name] = getattr(bench, f"bench_{name}")()
+        requests = dict(server.requests)
+    return {
+        "vox_version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "params": {
+            "history_size": args.history_size,
+            "contacts": args.contacts,
+            "rooms": args.rooms,
+            "agents": args.agents,
+            "iterations": args.iterations,
+        },
+        "results": results,
+        "server_requests": requests,
+    }
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history-size", type=int, default=1000, help="Messages in the measured conversation")
+    parser.add_argument("--contacts", type=int, default=10, help="Contacts (and peer identities)")
+    parser.add_argument("--rooms", type=int, default=5, help="Rooms with traffic during inbox")
+    parser.add_argument("--agents", type=int, default=5, help="Concurrent agents for send_swarm")
+    parser.add_argument("--iterations", type=int, default=20, help="Samples per benchmark")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run only this benchmark (repeatable)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    args.rooms = min(args.rooms, args.contacts)
+    args.agents = min(args.agents, args.contacts)
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
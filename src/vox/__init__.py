@@ -4,8 +4,23 @@ __version__ = "0.1.0"
 __author__ = "Vox Team"
 __email__ = "team@montaq.org"
 
-from .client import VoxClient
-from .config import Config
-from .storage import Storage
+# The public classes are imported on first access, so `import vox.cli` (and
+# quick commands like `vox whoami`) don't pay for aiohttp, nio and pydantic.
+_EXPORTS = {
+    "VoxClient": ".client",
+    "VoxPool": ".pool",
+    "Config": ".config",
+    "Storage": ".storage",
+}
 
-__all__ = ["VoxClient", "Config", "Storage"]
+__all__ = ["VoxClient", "VoxPool", "Config", "Storage"]
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        from importlib import import_module
+
+        value = getattr(import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
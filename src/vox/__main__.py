@@ -1,9 +1,6 @@
 """Vox CLI - Agent-to-Agent Communication Protocol."""
 
-import asyncio
-import sys
-from vox.cli import cli
+from vox.cli import main
 
 if __name__ == "__main__":
-    # Run the CLI
-    cli()
+    main()
@@ -1,12 +1,76 @@
 """Vox CLI - Agent-to-Agent Communication Protocol."""
 
-import asyncio
 import json
 import sys
-from pathlib import Path
 import click
-from .client import VoxClient
-from .config import Config
+from .home import CONFIG_FILE, default_vox_home, read_config, read_contacts
+
+# Only click and toml are imported up front. The client (aiohttp, nio), the
+# models (pydantic) and asyncio load inside the commands that need them, so
+# `vox whoami` and `vox contact list` start in a fraction of the time.
+
+
+def _client():
+    from .client import VoxClient
+
+    return VoxClient()
+
+
+def _run(coro):
+    import asyncio
+
+    return asyncio.run(coro)
+
+
+# Async entry points: each command that talks to the homeserver runs as one
+# coroutine in a single event loop, so the client's connection pool is opened
+# and closed on the same loop.
+
+async def _init(username, homeserver):
+    async with _client() as client:
+        return await client.initialize(username, homeserver)
+
+
+async def _send(contact_name, message, conv):
+    async with _client() as client:
+        return await client.send_message(contact_name, message, conv)
+
+
+async def _send_file(contact_name, source, conv, body):
+    async with _client() as client:
+        return await client.send_file(contact_name, source, conv, body)
+
+
+async def _download(url):
+    async with _client() as client:
+        return await client.download_file(url)
+
+
+async def _send_batch(records, concurrency):
+    async with _client() as client:
+        return await client.send_batch(records, concurrency)
+
+
+async def _inbox(from_contact, timeout, wait, min_messages):
+    async with _client() as client:
+        return await client.get_inbox(from_contact, timeout, wait, min_messages)
+
+
+async def _fetch_conversation(client, conversation_id, limit, before, after, contact):
+    try:
+        return await client.get_conversation(conversation_id, limit, before, after, contact)
+    finally:
+        await client.close()
+
+
+async def _discover(query):
+    async with _client() as client:
+        return await client.discover_agents(query)
+
+
+async def _advertise(description):
+    async with _client() as client:
+        await client.advertise(description)
 
 
 @click.group()
@@ -27,10 +91,8 @@ def init(username, homeserver):
     Federation handles cross-server messaging automatically.
     """
     try:
-        client = VoxClient()
-        vox_id = asyncio.run(client.initialize(username, homeserver))
+        vox_id = _run(_init(username, homeserver))
         click.echo(f"✅ Vox ID: {vox_id}")
-        asyncio.run(client.close())
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
         sys.exit(1)
@@ -40,9 +102,7 @@ def init(username, homeserver):
 def whoami():
     """Get current Vox ID."""
     try:
-        client = VoxClient()
-        vox_id = client.whoami()
-        click.echo(vox_id)
+        click.echo(read_config(default_vox_home() / CONFIG_FILE)["vox_id"])
     except FileNotFoundError:
         click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
         sys.exit(4)
@@ -55,7 +115,7 @@ def whoami():
 def status():
     """Get Vox status."""
     try:
-        client = VoxClient()
+        client = _client()
         status_info = client.status()
         click.echo(
             f"Vox ID: {status_info['vox_id']} | "
@@ -82,7 +142,7 @@ def contact():
 def contact_add(name, vox_id):
     """Add a contact."""
     try:
-        client = VoxClient()
+        client = _client()
         client.add_contact(name, vox_id)
         click.echo(f"✅ Contact '{name}' added")
     except FileNotFoundError:
@@ -97,8 +157,7 @@ def contact_add(name, vox_id):
 def contact_list():
     """List all contacts."""
     try:
-        client = VoxClient()
-        contacts = client.list_contacts()
+        contacts = read_contacts(default_vox_home())
         if not contacts:
             click.echo("No contacts found.")
             return
@@ -119,7 +178,7 @@ def contact_list():
 def contact_remove(name):
     """Remove a contact."""
     try:
-        client = VoxClient()
+        client = _client()
         if client.remove_contact(name):
             click.echo(f"✅ Contact '{name}' removed")
         else:
@@ -135,15 +194,35 @@ def contact_remove(name):
 
 @cli.command()
 @click.argument("contact_name", metavar="CONTACT")
-@click.argument("message")
+@click.argument("message", required=False)
 @click.option("--conv", help="Conversation ID for replies")
-def send(contact_name, message, conv):
-    """Send a message to CONTACT (name or raw Matrix ID like @user:server)."""
+@click.option(
+    "--file",
+    "file_path",
+    metavar="PATH",
+    type=click.Path(exists=True, dir_okay=False, allow_dash=True),
+    help="Send a file (- for stdin); MESSAGE, if given, is its caption",
+)
+def send(contact_name, message, conv, file_path):
+    """Send a message or file to CONTACT (name or raw Matrix ID like @user:server)."""
+    from . import daemon as vox_daemon
+
+    if message is None and file_path is None:
+        raise click.UsageError("Give a MESSAGE or --file PATH")
     try:
-        client = VoxClient()
-        conv_id = asyncio.run(client.send_message(contact_name, message, conv))
+        if file_path is not None:
+            # Files stream straight from this process, not through the daemon
+            source = click.get_binary_stream("stdin") if file_path == "-" else file_path
+            conv_id = _run(_send_file(contact_name, source, conv, message))
+            click.echo(f"✅ Sent file to {contact_name} ({conv_id})")
+            return
+        try:
+            conv_id = vox_daemon.call(
+                "send", contact=contact_name, message=message, conversation_id=conv
+            )
+        except vox_daemon.DaemonUnavailable:
+            conv_id = _run(_send(contact_name, message, conv))
         click.echo(f"✅ Sent to {contact_name} ({conv_id})")
-        asyncio.run(client.close())
     except FileNotFoundError:
         click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
         sys.exit(4)
@@ -155,14 +234,103 @@ def send(contact_name, message, conv):
         sys.exit(1)
 
 
+@cli.command("send-batch")
+@click.argument("input_file", metavar="[FILE]", type=click.File("r"), default="-")
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Maximum sends in flight",
+)
+def send_batch(input_file, concurrency):
+    """Send many messages from NDJSON records {"to", "body", "conv"} (stdin by default).
+
+    Prints one NDJSON result per record, in input order, with the event ID or
+    the error. Exits 1 if any message failed.
+    """
+    from . import daemon as vox_daemon
+
+    try:
+        records = []
+        parse_errors = {}
+        for line in input_file:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                parse_errors[len(records)] = f"Invalid record: {e}"
+                record = {}
+            records.append(record)
+
+        try:
+            results = vox_daemon.call("send_batch", records=records, concurrency=concurrency)
+        except vox_daemon.DaemonUnavailable:
+            results = _run(_send_batch(records, concurrency))
+
+        failed = False
+        for index, result in enumerate(results):
+            if index in parse_errors:
+                result = {"to": None, "ok": False, "error": parse_errors[index]}
+            failed = failed or not result["ok"]
+            click.echo(json.dumps({"index": index, **result}))
+        if failed:
+            sys.exit(1)
+    except FileNotFoundError:
+        click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
+        sys.exit(4)
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
 @cli.command()
 @click.option("--from", "from_contact", help="Filter messages from specific contact")
-def inbox(from_contact):
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0),
+    metavar="SECONDS",
+    default=30.0,
+    show_default=True,
+    help="Seconds the server may hold the sync open; 0 returns immediately",
+)
+@click.option(
+    "--wait",
+    type=click.FloatRange(min=0),
+    metavar="[SECONDS]",
+    is_flag=False,
+    flag_value=300.0,
+    default=None,
+    help="Block until messages arrive or SECONDS pass (default 300)",
+)
+@click.option(
+    "--min-messages",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="With --wait, how many messages to wait for",
+)
+def inbox(from_contact, timeout, wait, min_messages):
     """Get conversations with new messages."""
+    from . import daemon as vox_daemon
+    from .storage import Conversation
+
     try:
-        client = VoxClient()
-        conversations = asyncio.run(client.get_inbox(from_contact))
-        asyncio.run(client.close())
+        try:
+            conversations = [
+                Conversation(**c)
+                for c in vox_daemon.call(
+                    "inbox",
+                    from_contact=from_contact,
+                    wait=wait,
+                    min_messages=min_messages,
+                )
+            ]
+        except vox_daemon.DaemonUnavailable:
+            conversations = _run(_inbox(from_contact, timeout, wait, min_messages))
         
         if not conversations:
             click.echo("[]")
@@ -178,7 +346,8 @@ def inbox(from_contact):
                     {
                         "from": msg.from_vox_id,
                         "body": msg.body,
-                        "timestamp": msg.timestamp
+                        "timestamp": msg.timestamp,
+                        **_file_json(msg),
                     }
                     for msg in conv.messages
                 ]
@@ -194,14 +363,112 @@ def inbox(from_contact):
         sys.exit(1)
 
 
+def _file_json(msg):
+    """The ``file`` field of a message with an attachment (else nothing)."""
+    return {"file": msg.attachment.model_dump()} if msg.attachment else {}
+
+
+def _message_json(msg):
+    """Serialize a message the way `vox conversation` prints it."""
+    return {
+        "from": msg.from_vox_id,
+        "body": msg.body,
+        "timestamp": msg.timestamp,
+        "event_id": msg.event_id,
+        **_file_json(msg),
+    }
+
+
+# How long each daemon-backed `vox watch` poll blocks before re-polling.
+WATCH_DAEMON_WAIT = 30.0
+
+
+def _emit_watch(conv):
+    """Write one NDJSON line per message of a newly arrived conversation."""
+    for msg in conv.messages:
+        line = _message_json(msg)
+        line["conversation_id"] = conv.conversation_id
+        line["with"] = conv.with_contact
+        click.echo(json.dumps(line))
+
+
+async def _watch_direct(client, from_contact):
+    try:
+        async for conv in client.watch(from_contact):
+            _emit_watch(conv)
+    finally:
+        await client.close()
+
+
+@cli.command()
+@click.option("--from", "from_contact", help="Only stream messages from this contact")
+def watch(from_contact):
+    """Stream incoming messages as NDJSON (one JSON object per line) until interrupted."""
+    from . import daemon as vox_daemon
+    from .storage import Conversation
+
+    try:
+        try:
+            while True:
+                for c in vox_daemon.call(
+                    "inbox", from_contact=from_contact, wait=WATCH_DAEMON_WAIT
+                ):
+                    _emit_watch(Conversation(**c))
+        except vox_daemon.DaemonUnavailable:
+            _run(_watch_direct(_client(), from_contact))
+    except KeyboardInterrupt:
+        pass
+    except FileNotFoundError:
+        click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
+        sys.exit(4)
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
+def _get_conversation(client, conversation_id, limit=None, before=None, after=None, contact=None):
+    """Fetch a conversation through the daemon if one is running, else directly."""
+    from . import daemon as vox_daemon
+    from .storage import Conversation
+
+    try:
+        conv = vox_daemon.call(
+            "conversation",
+            conversation_id=conversation_id,
+            limit=limit,
+            before=before,
+            after=after,
+            contact=contact,
+        )
+        return Conversation(**conv) if conv else None
+    except vox_daemon.DaemonUnavailable:
+        return _run(_fetch_conversation(client, conversation_id, limit, before, after, contact))
+
+
 @cli.command()
 @click.argument("conversation_id")
-def conversation(conversation_id):
+@click.option("--limit", type=click.IntRange(min=1), help="Return at most N messages (the newest, unless --after is given)")
+@click.option("--before", help="Only messages before this event ID or timestamp")
+@click.option("--after", help="Only messages after this event ID or timestamp")
+@click.option("--ndjson", is_flag=True, help="Stream one JSON message per line")
+@click.option("--contact", help="Who the conversation is with; fetches it from your shared room if not stored locally")
+def conversation(conversation_id, limit, before, after, ndjson, contact):
     """Get full conversation history."""
     try:
-        client = VoxClient()
-        conv = asyncio.run(client.get_conversation(conversation_id))
-        asyncio.run(client.close())
+        client = _client()
+        if ndjson:
+            if not client.has_local_conversation(conversation_id):
+                conv = _get_conversation(client, conversation_id, contact=contact)
+                if conv is None:
+                    click.echo(f"❌ Conversation '{conversation_id}' not found", err=True)
+                    sys.exit(3)
+            for msg in client.iter_conversation(conversation_id, limit, before, after):
+                line = _message_json(msg)
+                line["conversation_id"] = conversation_id
+                click.echo(json.dumps(line))
+            return
+
+        conv = _get_conversation(client, conversation_id, limit, before, after, contact)
         
         if conv is None:
             click.echo(f"❌ Conversation '{conversation_id}' not found", err=True)
@@ -211,20 +478,85 @@ def conversation(conversation_id):
         conv_data = {
             "conversation_id": conv.conversation_id,
             "with": conv.with_contact,
-            "messages": [
-                {
-                    "from": msg.from_vox_id,
-                    "body": msg.body,
-                    "timestamp": msg.timestamp
-                }
-                for msg in conv.messages
-            ]
+            "messages": [_message_json(msg) for msg in conv.messages]
         }
         
         click.echo(json.dumps(conv_data, indent=2))
     except FileNotFoundError:
         click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
         sys.exit(4)
+    except ValueError as e:
+        click.echo(f"❌ {e}", err=True)
+        sys.exit(3)
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument("url", metavar="MXC_URI")
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help="Copy the file here (- for stdout) instead of printing its cached path",
+)
+def download(url, output):
+    """Fetch a received file (the "url" of a message's "file") into the local cache.
+
+    Prints the cached path. Each file is downloaded once and cached by its
+    SHA-256, so repeated downloads are free.
+    """
+    import shutil
+
+    try:
+        path = _run(_download(url))
+        if output == "-":
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, click.get_binary_stream("stdout"))
+        elif output:
+            shutil.copyfile(path, output)
+        else:
+            click.echo(str(path))
+    except FileNotFoundError:
+        click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
+        sys.exit(4)
+    except ValueError as e:
+        click.echo(f"❌ {e}", err=True)
+        sys.exit(3)
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument("query")
+@click.option("--contact", help="Only conversations with this contact")
+@click.option("--conv", "conversation_id", help="Only this conversation")
+@click.option("--since", help="Only messages at or after this timestamp")
+@click.option("--until", help="Only messages at or before this timestamp")
+@click.option("--limit", type=click.IntRange(min=1), default=20, show_default=True, help="Results per page")
+@click.option("--offset", type=click.IntRange(min=0), default=0, show_default=True, help="Results to skip")
+def search(query, contact, conversation_id, since, until, limit, offset):
+    """Search local message history, best matches first."""
+    try:
+        client = _client()
+        results = client.search(query, contact, conversation_id, since, until, limit, offset)
+        click.echo(json.dumps(
+            [
+                {
+                    "conversation_id": r.message.conversation_id,
+                    "with": r.with_contact,
+                    "score": round(r.score, 4),
+                    **_message_json(r.message),
+                }
+                for r in results
+            ],
+            indent=2,
+        ))
+    except ValueError as e:
+        click.echo(f"❌ {e}", err=True)
+        sys.exit(1)
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
         sys.exit(1)
@@ -234,10 +566,13 @@ def conversation(conversation_id):
 @click.argument("query")
 def discover(query):
     """Search for agents in directory."""
+    from . import daemon as vox_daemon
+
     try:
-        client = VoxClient()
-        agents = asyncio.run(client.discover_agents(query))
-        asyncio.run(client.close())
+        try:
+            agents = vox_daemon.call("discover", query=query)
+        except vox_daemon.DaemonUnavailable:
+            agents = _run(_discover(query))
         click.echo(json.dumps(agents, indent=2))
     except FileNotFoundError:
         click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
@@ -251,10 +586,13 @@ def discover(query):
 @click.option("--description", required=True, help="Agent description")
 def advertise(description):
     """List agent in public directory."""
+    from . import daemon as vox_daemon
+
     try:
-        client = VoxClient()
-        asyncio.run(client.advertise(description))
-        asyncio.run(client.close())
+        try:
+            vox_daemon.call("advertise", description=description)
+        except vox_daemon.DaemonUnavailable:
+            _run(_advertise(description))
         click.echo("✅ Listed in directory")
     except FileNotFoundError:
         click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
@@ -264,6 +602,66 @@ def advertise(description):
         sys.exit(1)
 
 
+@cli.group()
+def daemon():
+    """Run a background daemon that keeps one Matrix connection open.
+
+    While it runs, send/inbox/conversation/discover/advertise are served over
+    a local Unix socket instead of connecting and syncing on every call.
+    """
+    pass
+
+
+@daemon.command("start")
+def daemon_start():
+    """Run the daemon in the foreground (background it with '&' or a service manager)."""
+    from . import daemon as vox_daemon
+
+    try:
+        client = _client()
+        server = vox_daemon.VoxDaemon(client)
+        click.echo(f"✅ Vox daemon listening on {server.socket_path}", err=True)
+        _run(server.run())
+    except FileNotFoundError:
+        click.echo("❌ Not initialized. Run 'vox init' first.", err=True)
+        sys.exit(4)
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
+@daemon.command("status")
+def daemon_status():
+    """Check whether the daemon is running."""
+    from . import daemon as vox_daemon
+
+    try:
+        info = vox_daemon.call("ping")
+        click.echo(f"Daemon running for {info['vox_id']} (pid {info['pid']})")
+    except vox_daemon.DaemonUnavailable:
+        click.echo("Daemon not running")
+        sys.exit(3)
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
+@daemon.command("stop")
+def daemon_stop():
+    """Stop the running daemon."""
+    from . import daemon as vox_daemon
+
+    try:
+        vox_daemon.call("shutdown")
+        click.echo("✅ Daemon stopped")
+    except vox_daemon.DaemonUnavailable:
+        click.echo("❌ Daemon not running", err=True)
+        sys.exit(3)
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
 def main():
     """Main entry point for Vox CLI."""
     cli()
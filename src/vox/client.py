@@ -1,13 +1,23 @@
 """Main Vox client."""
 
 import asyncio
+import time
 import uuid
 import secrets
+import sys
 import aiohttp
-from typing import Optional, List, Dict, Any
+from pathlib import Path
+from typing import Optional, AsyncIterator, BinaryIO, Iterator, List, Dict, Any, Union
 from .config import Config, VOX_HOMESERVER, VOX_DOMAIN
-from .storage import Storage, Conversation
-from .matrix_backend import MatrixBackend
+from .home import CONFIG_FILE
+from .storage import Storage, Conversation, Message, SearchResult, merge_conversations
+from .matrix_backend import DEFAULT_INBOX_TIMEOUT, MatrixBackend
+from .scheduler import RequestScheduler
+from .transport import DEFAULT_POOL_LIMIT, DEFAULT_POOL_LIMIT_PER_HOST, create_session
+
+# When a repeated sync comes back empty faster than this (e.g. the server is
+# erroring), pause before retrying rather than spinning.
+MIN_SYNC_INTERVAL = 1.0
 
 
 class VoxClient:
@@ -15,24 +25,66 @@ class VoxClient:
     
     Uses real Matrix registration — each `vox init` creates a real account
     on the homeserver and returns a real access token.
+
+    All HTTP traffic (registration, login and the Matrix backend) goes over
+    one keep-alive connection pool, created on first use. Pass ``session`` to
+    share a pool the caller owns; ``pool_limit`` and ``pool_limit_per_host``
+    size the pool the client creates itself. Use ``async with`` (or call
+    `close`) so the pool is released on the loop that opened it.
+
+    Every homeserver request is paced and retried by ``scheduler`` (see
+    `RequestScheduler`); pass one to share rate limits and counters between
+    clients.
+
+    Everything for the identity — config, contacts, history — lives under
+    ``vox_home``; only when it is omitted is ``$VOX_HOME`` (or ``~/.vox``)
+    used, so clients for different homes can share one process.
     """
     
-    def __init__(self, vox_home: Optional[str] = None):
+    def __init__(
+        self,
+        vox_home: Optional[str] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        pool_limit: int = DEFAULT_POOL_LIMIT,
+        pool_limit_per_host: int = DEFAULT_POOL_LIMIT_PER_HOST,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
         self.storage = Storage(vox_home)
+        self.config_path = self.storage.vox_home / CONFIG_FILE
         self.config: Optional[Config] = None
         self.backend: Optional[MatrixBackend] = None
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self._session = session
+        self._owns_session = session is None
+        self.scheduler = scheduler or RequestScheduler()
+
+    async def __aenter__(self) -> "VoxClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        """Return the HTTP connection pool, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = create_session(self.pool_limit, self.pool_limit_per_host)
+            self._owns_session = True
+        return self._session
     
     def _ensure_config(self) -> Config:
         """Ensure config is loaded. Does NOT create the Matrix backend."""
         if self.config is None:
-            self.config = Config.load()
+            self.config = Config.load(self.config_path)
         return self.config
     
     def _ensure_backend(self) -> MatrixBackend:
         """Ensure the Matrix backend is initialized (lazy)."""
         config = self._ensure_config()
         if self.backend is None:
-            self.backend = MatrixBackend(config, self.storage)
+            self.backend = MatrixBackend(
+                config, self.storage, session=self._ensure_session(), scheduler=self.scheduler
+            )
         return self.backend
     
     async def initialize(
@@ -76,35 +128,39 @@ class VoxClient:
             "inhibit_login": False,
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(register_url, json=payload) as resp:
-                data = await resp.json()
-                
-                if resp.status == 200:
-                    access_token = data["access_token"]
-                    user_id = data["user_id"]
-                    device_id = data["device_id"]
-                elif resp.status == 400 and data.get("errcode") == "M_USER_IN_USE":
-                    # Username taken — re-login only if we already have the password
-                    # stored from a previous init of this exact account.
-                    try:
-                        existing = Config.load()
-                        stored_password = getattr(existing, "password", None)
-                    except FileNotFoundError:
-                        stored_password = None
-
-                    if stored_password and existing.vox_id == vox_id and existing.homeserver == server:
-                        access_token, user_id, device_id = await self._login(
-                            server, vox_id, stored_password
-                        )
-                    else:
-                        raise Exception(
-                            f"Username '{vox_id}' is already taken. "
-                            "Run 'vox init --username <different-name>' to pick another."
-                        )
-                else:
-                    error = data.get("error", f"HTTP {resp.status}")
-                    raise Exception(f"Registration failed: {error}")
+        session = self._ensure_session()
+        resp = await self.scheduler.request(
+            server.rstrip('/'), lambda: session.post(register_url, json=payload), idempotent=False
+        )
+        async with resp:
+            data = await resp.json()
+            status = resp.status
+
+        if status == 200:
+            access_token = data["access_token"]
+            user_id = data["user_id"]
+            device_id = data["device_id"]
+        elif status == 400 and data.get("errcode") == "M_USER_IN_USE":
+            # Username taken — re-login only if we already have the password
+            # stored from a previous init of this exact account.
+            try:
+                existing = Config.load(self.config_path)
+                stored_password = getattr(existing, "password", None)
+            except FileNotFoundError:
+                stored_password = None
+
+            if stored_password and existing.vox_id == vox_id and existing.homeserver == server:
+                access_token, user_id, device_id = await self._login(
+                    server, vox_id, stored_password
+                )
+            else:
+                raise Exception(
+                    f"Username '{vox_id}' is already taken. "
+                    "Run 'vox init --username <different-name>' to pick another."
+                )
+        else:
+            error = data.get("error", f"HTTP {status}")
+            raise Exception(f"Registration failed: {error}")
         
         # Step 2: Save config with real credentials (including password for future re-auth)
         self.config = Config(
@@ -116,7 +172,7 @@ class VoxClient:
             password=password,
         )
         
-        self.config.save()
+        self.config.save(self.config_path)
         
         return vox_id
     
@@ -135,15 +191,16 @@ class VoxClient:
             "password": password,
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(login_url, json=payload) as resp:
-                data = await resp.json()
-                
-                if resp.status == 200:
-                    return data["access_token"], data["user_id"], data["device_id"]
-                else:
-                    error = data.get("error", f"HTTP {resp.status}")
-                    raise Exception(f"Login failed: {error}")
+        session = self._ensure_session()
+        resp = await self.scheduler.request(
+            homeserver.rstrip('/'), lambda: session.post(login_url, json=payload), idempotent=False
+        )
+        async with resp:
+            data = await resp.json()
+            if resp.status == 200:
+                return data["access_token"], data["user_id"], data["device_id"]
+            error = data.get("error", f"HTTP {resp.status}")
+            raise Exception(f"Login failed: {error}")
     
     def whoami(self) -> str:
         """Get current Vox ID."""
@@ -173,6 +230,24 @@ class VoxClient:
         """Remove a contact."""
         return self.storage.remove_contact(name)
     
+    def _resolve_contact(self, contact: str) -> str:
+        """Map a contact name or raw Matrix ID (@user:server) to a Vox ID."""
+        if contact.startswith("@") and ":" in contact:
+            # Raw Matrix ID passed directly — auto-save using the localpart as name
+            vox_id = contact
+            name = contact.lstrip("@").split(":")[0]
+            if not self.storage.get_contact(name):
+                self.storage.add_contact(name, vox_id)
+            return vox_id
+
+        vox_id = self.storage.get_contact(contact)
+        if vox_id is None:
+            raise ValueError(
+                f"Contact '{contact}' not found. "
+                "Pass a full Matrix ID (@user:server) or add with 'vox contact add'."
+            )
+        return vox_id
+
     async def send_message(
         self,
         contact: str,
@@ -181,37 +256,203 @@ class VoxClient:
     ) -> str:
         """Send a message to a contact name or a raw Matrix ID (@user:server)."""
         backend = self._ensure_backend()
-
-        if contact.startswith("@") and ":" in contact:
-            # Raw Matrix ID passed directly — auto-save using the localpart as name
-            vox_id = contact
-            name = contact.lstrip("@").split(":")[0]
-            if not self.storage.get_contact(name):
-                self.storage.add_contact(name, vox_id)
-        else:
-            vox_id = self.storage.get_contact(contact)
-            if vox_id is None:
-                raise ValueError(
-                    f"Contact '{contact}' not found. "
-                    "Pass a full Matrix ID (@user:server) or add with 'vox contact add'."
-                )
+        vox_id = self._resolve_contact(contact)
 
         await backend.initialize()
         conv_id = await backend.send_message(vox_id, message, conversation_id)
         return conv_id
+
+    async def send_file(
+        self,
+        contact: str,
+        source: Union[str, Path, BinaryIO],
+        conversation_id: Optional[str] = None,
+        body: Optional[str] = None,
+        filename: Optional[str] = None,
+    ) -> str:
+        """Send a file (a path, or a binary stream such as stdin) to a contact.
+
+        The upload is streamed in chunks; content sent before is not
+        uploaded again. ``body`` is the message text (default: the file name).
+        """
+        backend = self._ensure_backend()
+        vox_id = self._resolve_contact(contact)
+
+        await backend.initialize()
+        return await backend.send_file(vox_id, source, conversation_id, body, filename)
+
+    async def download_file(self, url: str) -> Path:
+        """Return the local path of a received mxc:// file, downloading it once."""
+        backend = self._ensure_backend()
+        await backend.initialize()
+        return await backend.download_file(url)
+
+    async def send_batch(
+        self, records: List[Dict[str, Any]], concurrency: int = 8
+    ) -> List[Dict[str, Any]]:
+        """Send many messages over one connection.
+
+        Args:
+            records: ``{"to": contact, "body": text, "conv": conversation_id}``
+                dicts; ``conv`` is optional.
+            concurrency: Maximum number of requests in flight.
+
+        Returns:
+            One result per record, in order: ``{"to", "ok": True,
+            "conversation_id", "event_id"}`` or ``{"to", "ok": False, "error"}``.
+        """
+        backend = self._ensure_backend()
+        results: List[Dict[str, Any]] = [{"to": r.get("to")} for r in records]
+        items = []
+        positions = []
+        for i, record in enumerate(records):
+            if not record.get("to") or not isinstance(record.get("body"), str):
+                results[i].update(ok=False, error="Record needs 'to' and 'body'")
+                continue
+            try:
+                vox_id = self._resolve_contact(record["to"])
+            except ValueError as e:
+                results[i].update(ok=False, error=str(e))
+                continue
+            items.append((vox_id, record["body"], record.get("conv")))
+            positions.append(i)
+
+        if items:
+            await backend.initialize()
+            sent = await backend.send_batch(items, concurrency)
+            for i, outcome in zip(positions, sent):
+                if isinstance(outcome, Message):
+                    results[i].update(
+                        ok=True,
+                        conversation_id=outcome.conversation_id,
+                        event_id=outcome.event_id,
+                    )
+                else:
+                    results[i].update(ok=False, error=str(outcome))
+        return results
     
-    async def get_inbox(self, from_contact: Optional[str] = None) -> List[Conversation]:
-        """Get conversations with new messages."""
+    async def get_inbox(
+        self,
+        from_contact: Optional[str] = None,
+        timeout: float = DEFAULT_INBOX_TIMEOUT,
+        wait: Optional[float] = None,
+        min_messages: int = 1,
+    ) -> List[Conversation]:
+        """Get conversations with new messages.
+
+        Args:
+            from_contact: Only return conversations with this contact.
+            timeout: Seconds the homeserver may hold a sync open waiting for
+                new events. 0 checks for new messages and returns immediately.
+            wait: If set, keep syncing until at least ``min_messages`` messages
+                have arrived or ``wait`` seconds have passed. Failed syncs are
+                reported on stderr and retried until then.
+            min_messages: Message count that ends a ``wait``.
+
+        Without ``wait``, a failed sync raises.
+        """
+        backend = self._ensure_backend()
+        await backend.initialize()
+        if wait is None:
+            return await backend.get_inbox(from_contact, timeout)
+
+        deadline = time.monotonic() + wait
+        conversations: List[Conversation] = []
+        received = 0
+        while True:
+            started = time.monotonic()
+            remaining = max(0.0, deadline - started)
+            batch = await self._sync_once(backend, from_contact, remaining)
+            conversations.extend(batch)
+            received += sum(len(conv.messages) for conv in batch)
+            if received >= min_messages or time.monotonic() >= deadline:
+                break
+            elapsed = time.monotonic() - started
+            if not batch and elapsed < MIN_SYNC_INTERVAL:
+                await asyncio.sleep(min(MIN_SYNC_INTERVAL - elapsed, deadline - time.monotonic()))
+        return merge_conversations(conversations)
+
+    async def watch(
+        self,
+        from_contact: Optional[str] = None,
+        timeout: float = DEFAULT_INBOX_TIMEOUT,
+    ) -> AsyncIterator[Conversation]:
+        """Keep one sync loop running and yield new messages as they arrive.
+
+        Each sync yields one Conversation per conversation holding only the
+        messages that just arrived. The sync token and local history are
+        persisted after every sync, so a restarted watcher resumes where it
+        stopped. A failed sync is reported on stderr and retried.
+        """
         backend = self._ensure_backend()
         await backend.initialize()
-        return await backend.get_inbox(from_contact)
+        while True:
+            started = time.monotonic()
+            batch = await self._sync_once(backend, from_contact, timeout)
+            for conv in batch:
+                yield conv
+            elapsed = time.monotonic() - started
+            if not batch and elapsed < MIN_SYNC_INTERVAL:
+                await asyncio.sleep(MIN_SYNC_INTERVAL - elapsed)
     
-    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
-        """Get full conversation history."""
+    @staticmethod
+    async def _sync_once(
+        backend: MatrixBackend, from_contact: Optional[str], timeout: float
+    ) -> List[Conversation]:
+        """One sync for a polling loop: a failure is reported and yields nothing."""
+        try:
+            return await backend.get_inbox(from_contact, timeout)
+        except Exception as e:
+            print(f"Sync error (retrying): {e}", file=sys.stderr)
+            return []
+
+    async def get_conversation(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        contact: Optional[str] = None,
+    ) -> Optional[Conversation]:
+        """Get conversation history.
+
+        ``limit``, ``before`` and ``after`` select a single page; cursors are
+        exclusive and may be an event ID or a timestamp. ``contact`` names
+        who the conversation is with, so one not yet in local history can be
+        fetched from the room shared with them.
+        """
+        vox_id = self._resolve_contact(contact) if contact else None
         backend = self._ensure_backend()
         await backend.initialize()
-        return await backend.get_conversation(conversation_id)
+        return await backend.get_conversation(conversation_id, limit, before, after, vox_id)
+
+    def has_local_conversation(self, conversation_id: str) -> bool:
+        """Check whether a conversation is already in local history."""
+        return self.storage.has_conversation(conversation_id)
+
+    def iter_conversation(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Iterator[Message]:
+        """Stream a page of locally stored conversation history."""
+        return self.storage.iter_history(conversation_id, limit, before, after)
     
+    def search(
+        self,
+        query: str,
+        contact: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[SearchResult]:
+        """Full-text search over locally stored message history (no network)."""
+        return self.storage.search(query, contact, conversation_id, since, until, limit, offset)
+
     async def discover_agents(self, query: str) -> List[Dict[str, str]]:
         """Search for agents."""
         backend = self._ensure_backend()
@@ -225,6 +466,10 @@ class VoxClient:
         await backend.advertise_agent(description)
     
     async def close(self) -> None:
-        """Close the client."""
+        """Close the client and, if it created it, the connection pool."""
         if self.backend:
             await self.backend.close()
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.storage.close()
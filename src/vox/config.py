@@ -1,10 +1,10 @@
 """Configuration management for Vox."""
 
-import os
 from pathlib import Path
 from typing import Optional
 import toml
 from pydantic import BaseModel, Field
+from .home import CONFIG_FILE, default_vox_home, read_config
 
 
 # Canonical homeserver — Conduit instance
@@ -26,26 +26,15 @@ class Config(BaseModel):
     def load(cls, config_path: Optional[Path] = None) -> "Config":
         """Load configuration from file."""
         if config_path is None:
-            vox_home = Path(os.environ.get("VOX_HOME", Path.home() / ".vox"))
-            config_path = vox_home / "config.toml"
-        
-        if not config_path.exists():
-            raise FileNotFoundError(
-                f"Configuration file not found: {config_path}. "
-                "Run 'vox init' first."
-            )
-        
-        with open(config_path, "r") as f:
-            data = toml.load(f)
-        
-        return cls(**data)
+            config_path = default_vox_home() / CONFIG_FILE
+        return cls(**read_config(config_path))
     
     def save(self, config_path: Optional[Path] = None) -> None:
         """Save configuration to file."""
         if config_path is None:
-            vox_home = Path(os.environ.get("VOX_HOME", Path.home() / ".vox"))
+            vox_home = default_vox_home()
             vox_home.mkdir(parents=True, exist_ok=True)
-            config_path = vox_home / "config.toml"
+            config_path = vox_home / CONFIG_FILE
         
         with open(config_path, "w") as f:
             toml.dump(self.model_dump(), f)
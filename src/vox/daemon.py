@@ -0,0 +1,241 @@
+"""Long-lived Vox daemon serving CLI commands over a Unix domain socket.
+
+The daemon keeps one authenticated Matrix connection and a continuous sync
+loop, so CLI calls skip the per-process startup, TLS handshake and initial
+sync. Messages picked up by the sync loop are held until the next ``inbox``
+request. The wire protocol is one JSON object per line in each direction.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+from .home import default_vox_home
+
+# `call` is the CLI's fast path, so the client and models are imported only
+# once a daemon is actually constructed.
+if TYPE_CHECKING:
+    from .client import VoxClient
+    from .storage import Conversation
+
+SOCKET_NAME = "daemon.sock"
+
+# Largest single request/response line accepted on the socket.
+MAX_LINE = 16 * 1024 * 1024
+
+
+class DaemonUnavailable(Exception):
+    """Raised when no daemon is listening for this Vox home."""
+
+
+def socket_path(vox_home: Optional[Path] = None) -> Path:
+    """Return the daemon socket path for a Vox home."""
+    return default_vox_home(vox_home) / SOCKET_NAME
+
+
+def call(command: str, vox_home: Optional[Path] = None, **args: Any) -> Any:
+    """Run a command on the daemon and return its result.
+
+    Raises:
+        DaemonUnavailable: If no daemon is running (the caller should fall
+            back to the direct path).
+        ValueError / FileNotFoundError / Exception: Re-raised from the daemon
+            so callers can handle them exactly like the direct path.
+    """
+    path = socket_path(vox_home)
+    if not hasattr(socket, "AF_UNIX") or not path.exists():
+        raise DaemonUnavailable(str(path))
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(str(path))
+        except (ConnectionRefusedError, FileNotFoundError) as e:
+            # Stale socket left behind by a daemon that did not shut down cleanly
+            raise DaemonUnavailable(str(path)) from e
+
+        request = {"command": command, "args": args}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline(MAX_LINE)
+    finally:
+        sock.close()
+
+    if not line:
+        raise Exception("Daemon closed the connection without a response")
+    response = json.loads(line)
+    if response.get("ok"):
+        return response.get("result")
+
+    error = response.get("error", "Unknown daemon error")
+    if response.get("type") == "ValueError":
+        raise ValueError(error)
+    if response.get("type") == "FileNotFoundError":
+        raise FileNotFoundError(error)
+    raise Exception(error)
+
+
+class VoxDaemon:
+    """Serve Vox commands for one identity over a Unix domain socket."""
+
+    def __init__(self, client: Optional["VoxClient"] = None):
+        if client is None:
+            from .client import VoxClient
+
+            client = VoxClient()
+        self.client = client
+        self.socket_path = socket_path(self.client.storage.vox_home)
+        self._pending: List["Conversation"] = []
+        self._stop: Optional[asyncio.Event] = None
+        self._arrived: Optional[asyncio.Event] = None
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+            "ping": self._ping,
+            "send": self._send,
+            "send_batch": self._send_batch,
+            "inbox": self._inbox,
+            "conversation": self._conversation,
+            "discover": self._discover,
+            "advertise": self._advertise,
+            "shutdown": self._shutdown,
+        }
+
+    async def run(self) -> None:
+        """Connect, start the sync loop and serve until shut down."""
+        self._stop = asyncio.Event()
+        self._arrived = asyncio.Event()
+        config = self.client._ensure_config()
+        backend = self.client._ensure_backend()
+        await backend.initialize()
+
+        if self.socket_path.exists():
+            try:
+                call("ping", self.client.storage.vox_home)
+                raise Exception(f"Daemon already running for {config.vox_id}")
+            except DaemonUnavailable:
+                self.socket_path.unlink()
+
+        server = await asyncio.start_unix_server(
+            self._handle, path=str(self.socket_path), limit=MAX_LINE
+        )
+        os.chmod(self.socket_path, 0o600)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # Not on the main thread (e.g. embedded) — rely on "shutdown"
+
+        sync_task = asyncio.ensure_future(self._sync_loop())
+        try:
+            await self._stop.wait()
+        finally:
+            sync_task.cancel()
+            server.close()
+            await server.wait_closed()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            await self.client.close()
+
+    async def _sync_loop(self) -> None:
+        """Continuously sync and queue new conversations for `inbox`."""
+        async for conv in self.client.watch():
+            self._pending.append(conv)
+            self._arrived.set()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answer a single JSON request on a client connection."""
+        try:
+            line = await reader.readline()
+            request = json.loads(line)
+            handler = self._handlers.get(request.get("command"))
+            if handler is None:
+                raise ValueError(f"Unknown daemon command '{request.get('command')}'")
+            result = await handler(request.get("args") or {})
+            response = {"ok": True, "result": result}
+        except Exception as e:
+            response = {"ok": False, "error": str(e), "type": type(e).__name__}
+        writer.write(json.dumps(response).encode() + b"\n")
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _ping(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return {"vox_id": self.client.whoami(), "pid": os.getpid()}
+
+    async def _send(self, args: Dict[str, Any]) -> str:
+        return await self.client.send_message(
+            args["contact"], args["message"], args.get("conversation_id")
+        )
+
+    async def _send_batch(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await self.client.send_batch(args["records"], args.get("concurrency") or 8)
+
+    def _matches(self, conv: "Conversation", from_contact: Optional[str]) -> bool:
+        return from_contact is None or conv.with_contact == from_contact
+
+    async def _inbox(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Hand out queued conversations; ones filtered out stay queued.
+
+        The sync loop is always running, so ``timeout`` is moot here; ``wait``
+        blocks until ``min_messages`` matching messages are queued or it
+        expires.
+        """
+        from_contact = args.get("from_contact")
+        wait = args.get("wait")
+        min_messages = args.get("min_messages") or 1
+        if wait is not None:
+            deadline = time.monotonic() + wait
+            while sum(
+                len(c.messages) for c in self._pending if self._matches(c, from_contact)
+            ) < min_messages:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+        from .storage import merge_conversations
+
+        taken: List["Conversation"] = []
+        kept: List["Conversation"] = []
+        for conv in self._pending:
+            if self._matches(conv, from_contact):
+                taken.append(conv)
+            else:
+                kept.append(conv)
+        self._pending = kept
+        return [c.model_dump() for c in merge_conversations(taken)]
+
+    async def _conversation(self, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Served from local history, which the sync loop keeps current; a
+        # miss pages the conversation's room and never syncs.
+        conv = await self.client.get_conversation(
+            args["conversation_id"],
+            args.get("limit"),
+            args.get("before"),
+            args.get("after"),
+            args.get("contact"),
+        )
+        return conv.model_dump() if conv else None
+
+    async def _discover(self, args: Dict[str, Any]) -> List[Dict[str, str]]:
+        return await self.client.discover_agents(args["query"])
+
+    async def _advertise(self, args: Dict[str, Any]) -> None:
+        await self.client.advertise(args["description"])
+
+    async def _shutdown(self, args: Dict[str, Any]) -> None:
+        if self._stop is not None:
+            self._stop.set()
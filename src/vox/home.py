@@ -0,0 +1,46 @@
+"""Vox home directory layout.
+
+Kept free of the network and model stack (aiohttp, nio, pydantic) so quick
+commands such as ``vox whoami`` and ``vox contact list`` can read identity
+files without importing it.
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import toml
+
+CONFIG_FILE = "config.toml"
+CONTACTS_FILE = "contacts.toml"
+
+
+def default_vox_home(vox_home: Optional[Union[str, Path]] = None) -> Path:
+    """Return ``vox_home`` if given, else ``$VOX_HOME``, else ``~/.vox``."""
+    if vox_home is not None:
+        return Path(vox_home)
+    return Path(os.environ.get("VOX_HOME", Path.home() / ".vox"))
+
+
+def read_config(config_path: Path) -> Dict[str, Any]:
+    """Read a config.toml without validating it.
+
+    Raises:
+        FileNotFoundError: If the identity has not been initialized.
+    """
+    if not config_path.exists():
+        raise FileNotFoundError(
+            f"Configuration file not found: {config_path}. "
+            "Run 'vox init' first."
+        )
+    with open(config_path, "r") as f:
+        return toml.load(f)
+
+
+def read_contacts(vox_home: Path) -> Dict[str, str]:
+    """Read the contacts of a Vox home (empty if there are none yet)."""
+    contacts_file = vox_home / CONTACTS_FILE
+    if not contacts_file.exists():
+        return {}
+    with open(contacts_file, "r") as f:
+        return toml.load(f)
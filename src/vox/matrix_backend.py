@@ -1,36 +1,204 @@
 """Matrix backend integration for Vox."""
 
+import asyncio
+import hashlib
+import json
+import mimetypes
+import sys
 import uuid
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-from nio import AsyncClient, RoomMessageText, RoomPreset
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Any, Tuple, Union
+from urllib.parse import quote
+import aiohttp
+from nio import (
+    JoinResponse,
+    MessageDirection,
+    RoomCreateResponse,
+    RoomMessageFile,
+    RoomMessagesResponse,
+    RoomMessageText,
+    RoomPreset,
+    RoomPutStateResponse,
+    RoomResolveAliasResponse,
+    RoomSendResponse,
+    RoomVisibility,
+    SyncError,
+    SyncResponse,
+    UploadFilterResponse,
+)
 from .config import Config
-from .storage import Storage, Message, Conversation
+from .media import CHUNK_SIZE, CacheWriter, cache_stream, file_chunks, hash_file, mxc_path
+from .scheduler import RequestScheduler, ScheduledAsyncClient
+from .storage import Attachment, DirectoryEntry, Storage, Message, Conversation
+from .transport import REQUEST_TIMEOUT, create_session
+
+
+# Default number of invited rooms joined in parallel during an inbox sync.
+DEFAULT_JOIN_CONCURRENCY = 10
+
+# Default long-poll time (seconds) for an inbox sync.
+DEFAULT_INBOX_TIMEOUT = 30.0
+
+# Max timeline events per room in one inbox sync.
+INBOX_TIMELINE_LIMIT = 50
+
+# Rooms backfilled in parallel when a sync returns limited timelines, the
+# page size / page cap for each room's /messages backfill per sync, and how
+# many syncs in a row a gap may fail without progress before it is dropped.
+DEFAULT_BACKFILL_CONCURRENCY = 5
+BACKFILL_PAGE_SIZE = 100
+BACKFILL_MAX_PAGES = 50
+BACKFILL_MAX_ERRORS = 3
+
+# Timeline events Vox turns into messages: text and file (m.file) messages.
+MESSAGE_EVENTS = (RoomMessageText, RoomMessageFile)
+
+# Media uploads and downloads may take longer than one request's timeout in
+# total; only stalls (no bytes for REQUEST_TIMEOUT seconds) abort them.
+MEDIA_TIMEOUT = aiohttp.ClientTimeout(
+    total=None, sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT
+)
+
+# Server-side sync filter for the inbox: only message timelines, invites and
+# (lazy-loaded) membership. Presence, account data, receipts/typing and all
+# other state are dropped by the homeserver instead of parsed and discarded.
+INBOX_SYNC_FILTER = {
+    "presence": {"not_types": ["*"]},
+    "account_data": {"not_types": ["*"]},
+    "room": {
+        "state": {"types": ["m.room.member"], "lazy_load_members": True},
+        "timeline": {
+            "types": ["m.room.message"],
+            "limit": INBOX_TIMELINE_LIMIT,
+            "lazy_load_members": True,
+        },
+        "ephemeral": {"not_types": ["*"]},
+        "account_data": {"not_types": ["*"]},
+    },
+}
+
+# The agent directory is a public room with this alias on the homeserver. Each
+# agent's listing is an AGENT_EVENT_TYPE state event keyed by its Matrix user
+# ID, so the room state is the directory and only its owner can change it.
+DIRECTORY_ALIAS = "vox-directory"
+AGENT_EVENT_TYPE = "org.vox.agent"
+# Power level needed for any other event in the directory room: no member
+# but its creator has it, so members cannot post messages there.
+DIRECTORY_EVENTS_DEFAULT = 100
+
+# Max directory updates fetched per refresh; older ones arrive as room state.
+DIRECTORY_TIMELINE_LIMIT = 100
+
+
+def directory_sync_filter(room_id: str) -> Dict[str, Any]:
+    """Sync filter that returns only agent listings from the directory room."""
+    return {
+        "presence": {"not_types": ["*"]},
+        "account_data": {"not_types": ["*"]},
+        "room": {
+            "rooms": [room_id],
+            "state": {"types": [AGENT_EVENT_TYPE]},
+            "timeline": {"types": [AGENT_EVENT_TYPE], "limit": DIRECTORY_TIMELINE_LIMIT},
+            "ephemeral": {"not_types": ["*"]},
+            "account_data": {"not_types": ["*"]},
+        },
+    }
 
 
 class MatrixBackend:
     """Matrix backend for Vox communication."""
     
-    def __init__(self, config: Config, storage: Storage):
+    def __init__(
+        self,
+        config: Config,
+        storage: Storage,
+        join_concurrency: int = DEFAULT_JOIN_CONCURRENCY,
+        session: Optional[aiohttp.ClientSession] = None,
+        backfill_concurrency: int = DEFAULT_BACKFILL_CONCURRENCY,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        """Create the backend.
+
+        With ``session``, nio sends its requests over that shared connection
+        pool (which the caller owns and closes); otherwise nio opens its own.
+        ``backfill_concurrency`` bounds how many rooms with a limited sync
+        timeline are backfilled at once. Every request is paced and retried by
+        ``scheduler`` (a private one if omitted).
+        """
         self.config = config
         self.storage = storage
-        self.client = AsyncClient(
+        self.join_concurrency = join_concurrency
+        self.backfill_concurrency = backfill_concurrency
+        # Invited rooms whose auto-join failed, with the error (room_id -> error)
+        self.join_failures: Dict[str, str] = {}
+        self.client = ScheduledAsyncClient(
             homeserver=config.homeserver,
+            user=config.user_id or "",
+            device_id=config.device_id,
+            scheduler=scheduler,
         )
         self.client.access_token = config.access_token
+        self._shared_session = session is not None
+        if session is not None:
+            self.client.client_session = session
         self._initialized = False
     
     async def initialize(self) -> None:
-        """Initialize the Matrix client (no-op after first call)."""
+        """Initialize the Matrix client (no-op after first call).
+
+        No network round-trip happens here: sending only needs the access
+        token and the cached room ID. Commands that need room state sync on
+        demand through `_sync`, resuming from the stored sync token.
+        """
         if self._initialized:
             return
-        try:
-            await self.client.sync()
-            self._initialized = True
-        except Exception as e:
-            # Conduit/nio sometimes have validation issues on first sync, ignore for now
-            print(f"Initial sync warning: {e}")
-            self._initialized = True
+        if not self.config.access_token:
+            raise Exception("No access token in config. Run 'vox init' first.")
+        self._initialized = True
+
+    async def _sync(self, timeout: int, since: Optional[str]):
+        """Sync from ``since`` with the inbox filter.
+
+        ``timeout`` is the server-side long-poll time in milliseconds.
+        """
+        sync_filter = self._inbox_filter()
+        filter_id = await self._inbox_filter_id(sync_filter)
+        return await self.client.sync(
+            timeout=timeout,
+            sync_filter=filter_id or sync_filter,
+            since=since,
+        )
+
+    def _inbox_filter(self) -> Dict[str, Any]:
+        """The inbox filter, leaving out the directory room once it is known."""
+        directory = self._cached_directory_room()
+        if directory is None:
+            return INBOX_SYNC_FILTER
+        room = dict(INBOX_SYNC_FILTER["room"], not_rooms=[directory])
+        return dict(INBOX_SYNC_FILTER, room=room)
+
+    async def _inbox_filter_id(self, sync_filter: Dict[str, Any]) -> Optional[str]:
+        """Return the registered ID for an inbox filter, uploading it on first use.
+
+        The ID is cached in storage keyed by account and filter definition, so
+        it is uploaded once per account and again only if the filter changes.
+        Returns None if the upload fails; callers then send the filter inline.
+        """
+        user_id = self.config.user_id or self._to_matrix_id(self.config.vox_id)
+        definition = json.dumps(sync_filter, sort_keys=True)
+        fingerprint = hashlib.sha256(f"{user_id}\n{definition}".encode()).hexdigest()[:16]
+
+        filter_id = self.storage.get_sync_filter_id(fingerprint)
+        if filter_id:
+            return filter_id
+
+        response = await self.client.upload_filter(user_id=user_id, **sync_filter)
+        if not isinstance(response, UploadFilterResponse):
+            print(f"Filter upload warning (using inline filter): {response}", file=sys.stderr)
+            return None
+        self.storage.set_sync_filter_id(fingerprint, response.filter_id)
+        return response.filter_id
     
     async def send_message(
         self, 
@@ -44,168 +212,706 @@ class MatrixBackend:
         
         # Get (or lazily create) the persistent per-contact room
         room_id = await self._get_or_create_room(to_vox_id)
-        
-        # Send the message
+        msg = await self._send_event(room_id, to_vox_id, body, conversation_id)
+
+        # Save sent message to local history
+        self.storage.save_messages(conversation_id, self._contact_name(to_vox_id), [msg])
+        self.storage.index_conversations({conversation_id: room_id})
+        return conversation_id
+
+    async def send_batch(
+        self,
+        items: List[Tuple[str, str, Optional[str]]],
+        concurrency: int = 8,
+    ) -> List[Union[Message, Exception]]:
+        """Send many ``(to_vox_id, body, conversation_id)`` messages concurrently.
+
+        Each recipient's room is resolved once and new room mappings are
+        written in one batch, at most ``concurrency`` requests are in flight,
+        and every sent message is written to history in one transaction at
+        the end. Returns the sent Message or the exception for each item, in
+        input order.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        new_rooms: Dict[str, str] = {}
+
+        async def resolve(to_vox_id: str) -> str:
+            async with semaphore:
+                return await self._get_or_create_room(to_vox_id, new_rooms)
+
+        recipients = list(dict.fromkeys(to_vox_id for to_vox_id, _, _ in items))
+        resolved = await asyncio.gather(
+            *(resolve(to_vox_id) for to_vox_id in recipients), return_exceptions=True
+        )
+        if new_rooms:
+            self.storage.set_rooms(new_rooms)
+        rooms = dict(zip(recipients, resolved))
+
+        async def send(to_vox_id: str, body: str, conversation_id: Optional[str]) -> Message:
+            room_id = rooms[to_vox_id]
+            if isinstance(room_id, BaseException):
+                raise room_id
+            async with semaphore:
+                return await self._send_event(
+                    room_id, to_vox_id, body, conversation_id or f"conv_{uuid.uuid4().hex[:8]}"
+                )
+
+        results = await asyncio.gather(*(send(*item) for item in items), return_exceptions=True)
+
+        groups: Dict[str, Tuple[str, str, List[Message]]] = {}
+        indexed: Dict[str, str] = {}
+        for (to_vox_id, _, _), result in zip(items, results):
+            if isinstance(result, Message):
+                indexed[result.conversation_id] = rooms[to_vox_id]
+                if result.conversation_id not in groups:
+                    groups[result.conversation_id] = (
+                        result.conversation_id, self._contact_name(result.to_vox_id), []
+                    )
+                groups[result.conversation_id][2].append(result)
+        if groups:
+            self.storage.save_message_groups(list(groups.values()))
+            self.storage.index_conversations(indexed)
+        return list(results)
+
+    async def _send_event(
+        self,
+        room_id: str,
+        to_vox_id: str,
+        body: str,
+        conversation_id: str,
+        attachment: Optional[Attachment] = None,
+    ) -> Message:
+        """Send one Vox message event to a room and return it as a Message.
+
+        With ``attachment`` the event is an ``m.file`` pointing at the
+        uploaded media. The returned local echo carries the same timestamp
+        and transaction ID as the event, so the server copy seen on a later
+        sync reconciles with it in history instead of being stored twice.
+        """
+        txn_id = uuid.uuid4().hex
+        timestamp = datetime.utcnow().isoformat() + "Z"
         content = {
             "msgtype": "m.text",
             "body": body,
             "vox": {
                 "from": self.config.vox_id,
                 "to": to_vox_id,
-                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "timestamp": timestamp,
                 "conversation_id": conversation_id,
+                "txn_id": txn_id,
             }
         }
+        if attachment is not None:
+            content.update({
+                "msgtype": "m.file",
+                "filename": attachment.name,
+                "url": attachment.url,
+                "info": {"size": attachment.size, "mimetype": attachment.mimetype},
+            })
+            content["vox"]["sha256"] = attachment.sha256
         
-        await self.client.room_send(
+        response = await self.client.room_send(
             room_id=room_id,
             message_type="m.room.message",
-            content=content
+            content=content,
+            tx_id=txn_id,
         )
+        if not isinstance(response, RoomSendResponse):
+            raise Exception(f"Send failed: {getattr(response, 'message', response)}")
 
-        # Save sent message to local history
-        msg = Message(
+        return Message(
             from_vox_id=self.config.vox_id,
             to_vox_id=to_vox_id,
-            timestamp=datetime.utcnow().isoformat() + "Z",
+            timestamp=timestamp,
             conversation_id=conversation_id,
-            body=body
+            body=body,
+            event_id=response.event_id,
+            txn_id=txn_id,
+            attachment=attachment,
         )
-        with_contact = "unknown"
-        contacts = self.storage.get_contacts()
-        for name, v_id in contacts.items():
-            if v_id == to_vox_id:
-                with_contact = name
-                break
 
-        self.storage.save_messages(conversation_id, with_contact, [msg])
+    async def send_file(
+        self,
+        to_vox_id: str,
+        source: Union[str, Path, BinaryIO],
+        conversation_id: Optional[str] = None,
+        body: Optional[str] = None,
+        filename: Optional[str] = None,
+        mimetype: Optional[str] = None,
+    ) -> str:
+        """Upload a file (a path, or a binary stream such as stdin) and send it.
+
+        The file is read in chunks and streamed to the media repository. A
+        stream is first copied into the media cache, since its size and hash
+        must be known before uploading. Content already uploaded (same
+        SHA-256) is not uploaded again; the event reuses its mxc:// URI.
+        """
+        if conversation_id is None:
+            conversation_id = f"conv_{uuid.uuid4().hex[:8]}"
+        room_id = await self._get_or_create_room(to_vox_id)
+
+        loop = asyncio.get_running_loop()
+        if isinstance(source, (str, Path)):
+            path = Path(source)
+            filename = filename or path.name
+            sha256, size = await loop.run_in_executor(None, hash_file, path)
+        else:
+            sha256, size, path = await loop.run_in_executor(
+                None, cache_stream, source, self.storage.media_dir
+            )
+            filename = filename or "file"
+        mimetype = mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        url = self.storage.find_media_url(sha256)
+        if url is None:
+            url = await self._upload(path, filename, mimetype, size)
+            self.storage.record_media(url, sha256, size, mimetype, verified=True)
+
+        attachment = Attachment(
+            url=url, name=filename, size=size, mimetype=mimetype, sha256=sha256
+        )
+        msg = await self._send_event(
+            room_id, to_vox_id, body or filename, conversation_id, attachment
+        )
+        self.storage.save_messages(conversation_id, self._contact_name(to_vox_id), [msg])
+        self.storage.index_conversations({conversation_id: room_id})
         return conversation_id
-    
-    async def get_inbox(self, from_contact: Optional[str] = None) -> List[Conversation]:
-        """Get conversations with new messages."""
+
+    async def download_file(self, url: str) -> Path:
+        """Return the cached path of an mxc:// file, downloading it if needed.
+
+        Files are cached under their SHA-256, so a file whose content is
+        already cached (sent by us, or downloaded via any URI) costs no
+        request. Downloads are streamed to disk and checked against the hash
+        the sender announced.
+        """
+        expected = self.storage.get_media_sha256(url)
+        if expected and self.storage.media_path(expected).exists():
+            return self.storage.media_path(expected)
+
+        media = mxc_path(url)
+        response = await self._media_request(
+            "GET", f"/_matrix/client/v1/media/download/{media}"
+        )
+        if response.status in (404, 405) and await self._errcode(response) in (None, "M_UNRECOGNIZED"):
+            # Homeserver predates authenticated media
+            response.release()
+            response = await self._media_request("GET", f"/_matrix/media/v3/download/{media}")
+
+        async with response:
+            if response.status != 200:
+                raise Exception(f"Download failed: {await self._error_message(response)}")
+            mimetype = response.content_type
+            writer = CacheWriter(self.storage.media_dir)
+            try:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    writer.write(chunk)
+            except BaseException:
+                writer.discard()
+                raise
+        if expected and writer.digest.hexdigest() != expected:
+            writer.discard()
+            raise Exception(f"Download failed: {url} does not match its SHA-256")
+        sha256, path = writer.commit()
+        self.storage.record_media(url, sha256, writer.size, mimetype, verified=True)
+        return path
+
+    async def _upload(self, path: Path, filename: str, mimetype: str, size: int) -> str:
+        """Stream a file to the media repository and return its mxc:// URI."""
+        response = await self._media_request(
+            "POST",
+            f"/_matrix/media/v3/upload?filename={quote(filename)}",
+            body=path,
+            headers={"Content-Type": mimetype, "Content-Length": str(size)},
+        )
+        async with response:
+            if response.status != 200:
+                raise Exception(f"Upload failed: {await self._error_message(response)}")
+            data = await response.json(content_type=None)
+        return data["content_uri"]
+
+    async def _media_request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Path] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> aiohttp.ClientResponse:
+        """Send a media request through the scheduler, reusing nio's session.
+
+        A ``body`` file is re-read from the start on every attempt, so
+        uploads can be retried like any other request.
+        """
+        if self.client.client_session is None:
+            self.client.client_session = create_session()
+        session = self.client.client_session
+        homeserver = self.client.homeserver.rstrip("/")
+        headers = {**(headers or {}), "Authorization": f"Bearer {self.config.access_token}"}
+        return await self.client.scheduler.request(
+            homeserver,
+            lambda: session.request(
+                method,
+                homeserver + path,
+                data=file_chunks(body) if body is not None else None,
+                headers=headers,
+                timeout=MEDIA_TIMEOUT,
+            ),
+        )
+
+    @staticmethod
+    async def _errcode(response: aiohttp.ClientResponse) -> Optional[str]:
         try:
-            sync_token = self.storage.get_sync_token() or ""
-            
-            response = await self.client.sync(
-                timeout=30000,
-                since=sync_token if sync_token else None
+            return (await response.json(content_type=None)).get("errcode")
+        except Exception:
+            return None
+
+    @staticmethod
+    async def _error_message(response: aiohttp.ClientResponse) -> str:
+        try:
+            return (await response.json(content_type=None)).get("error") or f"HTTP {response.status}"
+        except Exception:
+            return f"HTTP {response.status}"
+
+    def _contact_name(self, vox_id: str) -> str:
+        """Map a Vox ID back to its contact name ("unknown" if not a contact)."""
+        return self.storage.find_contact_name(vox_id, self._server_domain()) or "unknown"
+    
+    async def get_inbox(
+        self, from_contact: Optional[str] = None, timeout: float = DEFAULT_INBOX_TIMEOUT
+    ) -> List[Conversation]:
+        """Get conversations with new messages.
+
+        ``timeout`` is how long (in seconds) the homeserver may hold the sync
+        open waiting for new events; 0 returns immediately. A failed sync
+        raises; nothing is saved and the sync token stays put.
+        """
+        since = self.storage.get_sync_token() or None
+        response = await self._sync(int(timeout * 1000), since)
+        if isinstance(response, SyncError):
+            raise Exception(f"Sync failed: {response.message}")
+
+        conversations = []
+
+        # Auto-join invited rooms and persist the room mapping so replies
+        # don't need an extra alias-resolution round-trip.
+        if response.rooms.invite:
+            await self._join_invites(response.rooms.invite)
+
+        # Anyone in the directory room could post messages there; they are
+        # not conversations (the filter drops them once the room is known).
+        directory = self._cached_directory_room()
+        rooms = {
+            room_id: room_info
+            for room_id, room_info in response.rooms.join.items()
+            if room_id != directory
+        }
+        next_batch = response.next_batch
+
+        # A limited timeline skipped events since the last sync; fetch
+        # them so they are not lost when the sync token moves past them.
+        timelines = {
+            room_id: list(room_info.timeline.events)
+            for room_id, room_info in rooms.items()
+            if getattr(room_info, "timeline", None)
+        }
+        # Gaps left over from earlier syncs go first: they are older.
+        pending = self.storage.get_backfill_gaps()
+        jobs: List[Tuple[str, str, str, int]] = [
+            (room_id, gap["start"], gap["end"], gap.get("errors", 0))
+            for room_id, room_gaps in pending.items()
+            for gap in room_gaps
+        ]
+        jobs.extend(
+            (room_id, room_info.timeline.prev_batch, since, 0)
+            for room_id, room_info in rooms.items()
+            if since and room_id in timelines
+            and room_info.timeline.limited and room_info.timeline.prev_batch
+        )
+        remaining: Dict[str, List[Dict[str, Any]]] = {}
+        if jobs:
+            results = await self._backfill([job[:3] for job in jobs])
+            backfilled: Dict[str, List[Any]] = {}
+            for (room_id, start, end, errors), (events, resume, failed) in zip(jobs, results):
+                backfilled.setdefault(room_id, []).extend(events)
+                if resume is None:
+                    continue
+                # Whatever was fetched is delivered now; the rest of the gap
+                # is resumed next sync from the oldest position reached.
+                errors = errors + 1 if failed and resume == start else 0
+                if errors >= BACKFILL_MAX_ERRORS:
+                    print(
+                        f"Giving up backfill for {room_id} after {errors} failed attempts",
+                        file=sys.stderr,
+                    )
+                    continue
+                remaining.setdefault(room_id, []).append(
+                    {"start": resume, "end": end, "errors": errors}
+                )
+            for room_id, events in backfilled.items():
+                timelines[room_id] = events + timelines.get(room_id, [])
+
+        # One pass per timeline, bucketing messages by conversation: a
+        # per-contact room carries every thread with that contact.
+        groups: Dict[str, Tuple[str, List[Message]]] = {}
+        for room_id, events in timelines.items():
+            room_conv_id = f"conv_{room_id.replace('!', '').replace(':', '_')[:12]}"
+            for event in events:
+                if isinstance(event, MESSAGE_EVENTS):
+                    message = self._event_message(event, room_conv_id)
+                    groups.setdefault(message.conversation_id, (room_id, []))[1].append(message)
+
+        batch = []
+        indexed: Dict[str, str] = {}
+        for conv_id, (room_id, messages) in groups.items():
+            with_contact = self._conversation_contact(room_id, messages)
+            batch.append((conv_id, with_contact, messages))
+            indexed[conv_id] = room_id
+            if from_contact is None or with_contact == from_contact:
+                conversations.append(Conversation(
+                    conversation_id=conv_id,
+                    with_contact=with_contact,
+                    messages=messages,
+                ))
+        if batch:
+            self.storage.save_message_groups(batch)
+
+        if indexed:
+            self.storage.index_conversations(indexed, next_batch)
+
+        # Record unfilled gaps before moving the sync token past them
+        if remaining or pending:
+            self.storage.set_backfill_gaps(remaining)
+        self.storage.set_sync_token(next_batch)
+        
+        return conversations
+    
+    def _event_message(self, event: Any, default_conversation_id: str) -> Message:
+        """Convert a Vox text or file message event into a Message."""
+        content = event.source.get("content", {})
+        vox_data = content.get("vox", {})
+        attachment = None
+        if isinstance(event, RoomMessageFile):
+            info = content.get("info") or {}
+            attachment = Attachment(
+                url=event.url,
+                name=content.get("filename") or event.body,
+                size=info.get("size"),
+                mimetype=info.get("mimetype"),
+                sha256=vox_data.get("sha256"),
             )
-            
-            conversations = []
-            
-            # Auto-join invited rooms and persist the room mapping so replies
-            # don't need an extra alias-resolution round-trip.
-            if hasattr(response, 'rooms') and response.rooms.invite:
-                for inv_room_id, inv_info in response.rooms.invite.items():
-                    await self.client.join(inv_room_id)
-                    print(f"Auto-joined room: {inv_room_id}")
-                    # Extract the inviter's user ID from the invite state events
-                    inviter = None
+        return Message(
+            from_vox_id=vox_data.get("from", event.sender),
+            to_vox_id=vox_data.get("to", self.config.vox_id),
+            timestamp=str(vox_data.get("timestamp", event.server_timestamp)),
+            conversation_id=vox_data.get("conversation_id", default_conversation_id),
+            body=event.body,
+            event_id=event.event_id,
+            txn_id=vox_data.get("txn_id")
+            or event.source.get("unsigned", {}).get("transaction_id"),
+            attachment=attachment,
+        )
+
+    async def _backfill(
+        self, gaps: List[Tuple[str, str, str]]
+    ) -> List[Tuple[List[Any], Optional[str], bool]]:
+        """Fetch the message events each gap skipped, oldest first.
+
+        ``gaps`` holds ``(room_id, start, end)``: usually the timeline's
+        ``prev_batch`` and the token the sync started from. Each gap is paged
+        backwards from ``start`` to ``end``, at most ``BACKFILL_MAX_PAGES``
+        pages per call and ``backfill_concurrency`` gaps at once. Each result
+        is ``(events, resume, failed)``: ``resume`` is None once the gap is
+        filled, otherwise the oldest position reached, and ``failed`` says an
+        error (rather than the page cap) stopped it.
+        """
+        semaphore = asyncio.Semaphore(self.backfill_concurrency)
+
+        async def fetch(
+            room_id: str, start: str, end: str
+        ) -> Tuple[List[Any], Optional[str], bool]:
+            events: List[Any] = []
+            token = start
+            async with semaphore:
+                for _ in range(BACKFILL_MAX_PAGES):
                     try:
-                        for event in inv_info.invite_state.events:
-                            sender = getattr(event, "sender", None)
-                            if sender and sender != (self.config.user_id or self._to_matrix_id(self.config.vox_id)):
-                                inviter = sender
-                                break
-                    except Exception:
-                        pass
-                    if inviter and not self.storage.get_room(inviter):
-                        self.storage.set_room(inviter, inv_room_id)
-
-            # Process joined rooms
-            if hasattr(response, 'rooms') and response.rooms:
-                rooms = response.rooms.join
-            else:
-                rooms = {}
-            
-            for room_id, room_info in rooms.items():
-                # First pass: find if any message in the timeline has a conversation_id
-                # or if we have a way to derive it from the room
-                room_conv_id = None
-                if hasattr(room_info, 'timeline') and room_info.timeline:
-                    for event in room_info.timeline.events:
-                        if isinstance(event, RoomMessageText):
-                            v_data = event.source.get("content", {}).get("vox", {})
-                            if v_data.get("conversation_id"):
-                                room_conv_id = v_data.get("conversation_id")
-                                break
-                
-                if not room_conv_id:
-                    room_conv_id = f"conv_{room_id.replace('!', '').replace(':', '_')[:12]}"
-
-                # Second pass: process messages
-                messages = []
-                if hasattr(room_info, 'timeline') and room_info.timeline:
-                    for event in room_info.timeline.events:
-                        if isinstance(event, RoomMessageText):
-                            content = event.source.get("content", {})
-                            vox_data = content.get("vox", {})
-                            
-                            from_id = vox_data.get("from", event.sender)
-                            to_id = vox_data.get("to", self.config.vox_id)
-                            ts = vox_data.get("timestamp", event.server_timestamp)
-                            
-                            # Use the unified room_conv_id
-                            conv_id = vox_data.get("conversation_id", room_conv_id)
-
-                            message = Message(
-                                from_vox_id=from_id,
-                                to_vox_id=to_id,
-                                timestamp=str(ts),
-                                conversation_id=conv_id,
-                                body=event.body
-                            )
-                            messages.append(message)
-                
-                if messages:
-                    # Get the contact name from room members or latest message
-                    with_contact = self._extract_contact_from_room(room_id, messages)
-                    
-                    # Save to local history
-                    self.storage.save_messages(messages[0].conversation_id, with_contact, messages)
-                    
-                    if from_contact is None or with_contact == from_contact:
-                        conversation = Conversation(
-                            conversation_id=messages[0].conversation_id,
-                            with_contact=with_contact,
-                            messages=messages
+                        response = await self.client.room_messages(
+                            room_id,
+                            start=token,
+                            end=end,
+                            direction=MessageDirection.back,
+                            limit=BACKFILL_PAGE_SIZE,
+                            message_filter={"types": ["m.room.message"]},
                         )
-                        conversations.append(conversation)
-            
-            # Update sync token if available
-            if hasattr(response, 'next_batch'):
-                self.storage.set_sync_token(response.next_batch)
-            
-            return conversations
-        except Exception as e:
-            # For now, return empty list on sync errors
-            print(f"Sync error (this is normal for Conduit servers): {e}")
-            return []
-    
-    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
-        """Get full conversation history."""
-        # Check local history first
-        history = self.storage.get_history(conversation_id)
-        if history:
-            return history
-            
-        # Fallback: check inbox (which will sync and save)
-        conversations = await self.get_inbox()
-        for conv in conversations:
-            if conv.conversation_id == conversation_id:
-                return conv
-        return None
+                    except Exception as e:
+                        response = e
+                    if not isinstance(response, RoomMessagesResponse):
+                        message = getattr(response, "message", response)
+                        print(f"Backfill failed for {room_id}: {message}", file=sys.stderr)
+                        return events[::-1], token, True
+                    events.extend(response.chunk)
+                    if not response.chunk or not response.end or response.end == token:
+                        return events[::-1], None, False
+                    token = response.end
+            print(
+                f"Backfill for {room_id} paused after {BACKFILL_MAX_PAGES} pages",
+                file=sys.stderr,
+            )
+            return events[::-1], token, False
+
+        return await asyncio.gather(*(fetch(*gap) for gap in gaps))
+
+    async def _join_invites(self, invites: Dict[str, Any]) -> None:
+        """Join invited rooms concurrently and store the inviter -> room mappings.
+
+        At most ``join_concurrency`` joins are in flight. A failed join is
+        recorded in ``join_failures`` and does not stop the others; all new
+        mappings are written in one batch at the end.
+        """
+        own_id = self.config.user_id or self._to_matrix_id(self.config.vox_id)
+        semaphore = asyncio.Semaphore(self.join_concurrency)
+
+        async def join(room_id: str, info: Any) -> Optional[Tuple[str, str]]:
+            async with semaphore:
+                try:
+                    response = await self.client.join(room_id)
+                except Exception as e:
+                    response = e
+            if not isinstance(response, JoinResponse):
+                error = str(getattr(response, "message", response))
+                self.join_failures[room_id] = error
+                print(f"Auto-join failed for {room_id}: {error}", file=sys.stderr)
+                return None
+            self.join_failures.pop(room_id, None)
+            print(f"Auto-joined room: {room_id}", file=sys.stderr)
+
+            # Extract the inviter's user ID from the invite state events
+            try:
+                for event in info.invite_state:
+                    sender = getattr(event, "sender", None)
+                    if sender and sender != own_id:
+                        return sender, room_id
+            except Exception:
+                pass
+            return None
+
+        joined = await asyncio.gather(*(join(r, i) for r, i in invites.items()))
+        new_rooms: Dict[str, str] = {}
+        for mapping in joined:
+            if mapping and not self.storage.get_room(mapping[0]):
+                new_rooms.setdefault(*mapping)
+        if new_rooms:
+            self.storage.set_rooms(new_rooms)
+
+    async def get_conversation(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        contact: Optional[str] = None,
+    ) -> Optional[Conversation]:
+        """Get conversation history, optionally a single page of it.
+
+        Local history is used when it has the conversation. Otherwise one
+        room is paged through and the conversation's messages are saved
+        first: the indexed room if there is one, else the room shared with
+        ``contact`` (a Vox ID) when given. Other rooms are never searched, and
+        the inbox sync token is untouched, so nothing is consumed from the
+        inbox.
+        """
+        if not self.storage.has_conversation(conversation_id):
+            await self._fetch_conversation(conversation_id, contact)
+        return self.storage.get_history(conversation_id, limit, before, after)
+
+    async def _fetch_conversation(self, conversation_id: str, contact: Optional[str]) -> None:
+        """Page through a conversation's room, if known, and save its messages."""
+        indexed = self.storage.get_conversation_room(conversation_id)
+        if indexed is not None:
+            room_id, token = indexed
+        else:
+            room_id = self._contact_room(contact) if contact else None
+            if room_id is None:
+                return
+            token = None
+        messages = await self._room_conversation(room_id, token, conversation_id)
+        if not messages:
+            return
+        self.storage.save_messages(
+            conversation_id, self._conversation_contact(room_id, messages), messages
+        )
+        self.storage.index_conversations({conversation_id: room_id})
+
+    def _contact_room(self, vox_id: str) -> Optional[str]:
+        """Return the cached room shared with a contact, if any.
+
+        Rooms we created are stored by Vox ID, rooms joined from an invite by
+        the inviter's Matrix ID.
+        """
+        return self.storage.get_room(vox_id) or self.storage.get_room(self._to_matrix_id(vox_id))
+
+    async def _room_conversation(
+        self, room_id: str, token: Optional[str], conversation_id: str
+    ) -> List[Message]:
+        """Page backwards through a room from ``token``, oldest message first."""
+        messages: List[Message] = []
+        for _ in range(BACKFILL_MAX_PAGES):
+            response = await self.client.room_messages(
+                room_id,
+                start=token,
+                direction=MessageDirection.back,
+                limit=BACKFILL_PAGE_SIZE,
+                message_filter={"types": ["m.room.message"]},
+            )
+            if not isinstance(response, RoomMessagesResponse):
+                raise Exception(
+                    f"Failed to fetch conversation: {getattr(response, 'message', response)}"
+                )
+            messages.extend(
+                self._event_message(event, conversation_id)
+                for event in response.chunk
+                if isinstance(event, MESSAGE_EVENTS)
+                and event.source.get("content", {}).get("vox", {}).get("conversation_id")
+                == conversation_id
+            )
+            if not response.chunk or not response.end or response.end == token:
+                break
+            token = response.end
+        messages.reverse()
+        return messages
     
     async def discover_agents(self, query: str) -> List[Dict[str, str]]:
-        """Search for agents in directory."""
-        # This would integrate with a Matrix room-based directory
-        # For now, return empty list
-        return []
-    
+        """Search for agents in the directory.
+
+        The local snapshot is brought up to date with one incremental sync of
+        the directory room, then queried locally. If the refresh fails the
+        (possibly stale) snapshot is still searched.
+        """
+        try:
+            await self._refresh_directory()
+        except Exception as e:
+            print(f"Directory refresh warning (using cached directory): {e}", file=sys.stderr)
+        return [entry.model_dump() for entry in self.storage.search_directory(query)]
+
     async def advertise_agent(self, description: str) -> None:
         """List agent in public directory."""
-        # This would post to a Matrix room-based directory
-        pass
+        room_id = await self._directory_room_id(create=True)
+        user_id = self.config.user_id or self._to_matrix_id(self.config.vox_id)
+        response = await self.client.room_put_state(
+            room_id,
+            AGENT_EVENT_TYPE,
+            {"vox_id": self.config.vox_id, "description": description},
+            state_key=user_id,
+        )
+        if not isinstance(response, RoomPutStateResponse):
+            raise Exception(f"Advertise failed: {getattr(response, 'message', response)}")
+        self.storage.update_directory([
+            DirectoryEntry(user_id=user_id, vox_id=self.config.vox_id, description=description)
+        ])
+
+    async def _refresh_directory(self) -> None:
+        """Apply directory changes since the last refresh to the local snapshot.
+
+        The first refresh receives every listing as room state; later ones
+        resume from the stored directory sync token and receive only changed
+        listings. This token is separate from the inbox sync token, so
+        refreshing never consumes inbox messages.
+        """
+        room_id = await self._directory_room_id(create=False)
+        if room_id is None:
+            return  # Nobody has advertised on this homeserver yet
+
+        # nio falls back to the client's own (inbox) token when since is
+        # empty and advances it after every sync, so clear it for this call
+        # and put it back afterwards: the first refresh must be a full sync,
+        # and the inbox position must not move.
+        inbox_tokens = (self.client.next_batch, self.client.loaded_sync_token)
+        self.client.next_batch = None
+        self.client.loaded_sync_token = None
+        try:
+            response = await self.client.sync(
+                timeout=0,
+                sync_filter=directory_sync_filter(room_id),
+                since=self.storage.get_directory_sync_token(),
+            )
+        finally:
+            self.client.next_batch, self.client.loaded_sync_token = inbox_tokens
+        if not isinstance(response, SyncResponse):
+            raise Exception(f"Directory sync failed: {getattr(response, 'message', response)}")
+
+        listings: Dict[str, Dict[str, Any]] = {}
+        room = response.rooms.join.get(room_id)
+        if room is not None:
+            # State precedes the timeline, so later listings overwrite earlier ones
+            for event in list(room.state) + list(room.timeline.events):
+                source = getattr(event, "source", {})
+                if source.get("type") == AGENT_EVENT_TYPE and source.get("state_key"):
+                    listings[source["state_key"]] = source.get("content") or {}
+
+        entries = [
+            DirectoryEntry(
+                user_id=user_id,
+                vox_id=str(content["vox_id"]),
+                description=str(content.get("description", "")),
+            )
+            for user_id, content in listings.items()
+            if content.get("vox_id")
+        ]
+        removed = [user_id for user_id, content in listings.items() if not content.get("vox_id")]
+        self.storage.update_directory(entries, removed)
+        self.storage.set_directory_sync_token(response.next_batch)
+
+    async def _directory_room_id(self, create: bool) -> Optional[str]:
+        """Return the directory room ID, joining (or creating) it on first use.
+
+        The room ID is cached in the room map under the directory alias.
+        Returns None if the room does not exist and ``create`` is False.
+        """
+        full_alias = self._directory_alias()
+        room_id = self.storage.get_room(full_alias)
+        if room_id:
+            return room_id
+
+        resolve = await self.client.room_resolve_alias(full_alias)
+        if isinstance(resolve, RoomResolveAliasResponse):
+            room_id = resolve.room_id
+        elif not create:
+            return None
+        else:
+            response = await self.client.room_create(
+                visibility=RoomVisibility.public,
+                alias=DIRECTORY_ALIAS,
+                name="Vox Directory",
+                topic="Directory of Vox agents",
+                preset=RoomPreset.public_chat,
+                # Members may only write their own listing, not messages
+                power_level_override={
+                    "events_default": DIRECTORY_EVENTS_DEFAULT,
+                    "events": {AGENT_EVENT_TYPE: 0},
+                },
+            )
+            if isinstance(response, RoomCreateResponse):
+                room_id = response.room_id
+            else:
+                # Another agent may have created it first
+                resolve = await self.client.room_resolve_alias(full_alias)
+                if not isinstance(resolve, RoomResolveAliasResponse):
+                    raise Exception(
+                        f"Could not create directory room: {getattr(response, 'message', response)}"
+                    )
+                room_id = resolve.room_id
+
+        join = await self.client.join(room_id)
+        if not isinstance(join, JoinResponse):
+            raise Exception(f"Could not join directory room: {getattr(join, 'message', join)}")
+        self.storage.set_room(full_alias, room_id)
+        return room_id
+
+    def _directory_alias(self) -> str:
+        return f"#{DIRECTORY_ALIAS}:{self._server_domain()}"
+
+    def _cached_directory_room(self) -> Optional[str]:
+        """The directory room ID if this agent has joined it, without a lookup."""
+        return self.storage.get_room(self._directory_alias())
     
     def _server_domain(self) -> str:
         """Extract the bare domain from the configured homeserver URL."""
@@ -235,7 +941,17 @@ class MatrixBackend:
         a, b = sorted([own_local, other_local])
         return f"vox-dm-{a}-{b}"
 
-    async def _get_or_create_room(self, to_vox_id: str) -> str:
+    def _remember_room(
+        self, to_vox_id: str, room_id: str, new_rooms: Optional[Dict[str, str]]
+    ) -> None:
+        if new_rooms is None:
+            self.storage.set_room(to_vox_id, room_id)
+        else:
+            new_rooms[to_vox_id] = room_id
+
+    async def _get_or_create_room(
+        self, to_vox_id: str, new_rooms: Optional[Dict[str, str]] = None
+    ) -> str:
         """Return the persistent Matrix room ID for a contact.
 
         Rooms are per-contact and identified by a deterministic alias so they
@@ -243,6 +959,9 @@ class MatrixBackend:
         so federated invites (e.g. matrix.org users) don't break room creation
         on Conduit.  The room is marked is_direct so Matrix clients show it in
         the DMs section.
+
+        A newly resolved mapping is saved at once, or added to ``new_rooms``
+        when given so the caller can write several in one batch.
         """
         # Fast path: local storage already has the room
         existing_room_id = self.storage.get_room(to_vox_id)
@@ -259,8 +978,8 @@ class MatrixBackend:
             if hasattr(resolve, "room_id") and resolve.room_id:
                 room_id = resolve.room_id
                 await self.client.join(room_id)
-                self.storage.set_room(to_vox_id, room_id)
-                print(f"Rejoined existing room {room_id} via alias {full_alias}")
+                self._remember_room(to_vox_id, room_id, new_rooms)
+                print(f"Rejoined existing room {room_id} via alias {full_alias}", file=sys.stderr)
                 # Re-invite in case the previous attempt never sent the invite
                 try:
                     await self.client.room_invite(room_id=room_id, user_id=invite_user_id)
@@ -286,34 +1005,38 @@ class MatrixBackend:
             else:
                 raise Exception(f"Unexpected room_create response: {response}")
 
-            self.storage.set_room(to_vox_id, room_id)
-            print(f"Created room {room_id} with alias {full_alias}")
+            self._remember_room(to_vox_id, room_id, new_rooms)
+            print(f"Created room {room_id} with alias {full_alias}", file=sys.stderr)
 
             # Invite separately so federated users work correctly
             try:
                 await self.client.room_invite(room_id=room_id, user_id=invite_user_id)
             except Exception as e:
-                print(f"Invite warning (room still created): {e}")
+                print(f"Invite warning (room still created): {e}", file=sys.stderr)
 
             return room_id
         except Exception as e:
-            print(f"Room creation error: {e}")
-            return f"!demo_{uuid.uuid4().hex[:8]}:localhost"
+            raise Exception(f"Room creation failed for {to_vox_id}: {e}") from e
     
+    def _conversation_contact(self, room_id: str, messages: List[Message]) -> str:
+        """Name the other party of a conversation, even if we sent every message."""
+        if all(m.from_vox_id == self.config.vox_id for m in messages):
+            return self._contact_name(messages[0].to_vox_id)
+        return self._extract_contact_from_room(room_id, messages)
+
     def _extract_contact_from_room(self, room_id: str, messages: List[Message]) -> str:
         """Extract contact name from room information."""
         # For now, use the vox_id from first message that's not from self
         for message in messages:
             if message.from_vox_id != self.config.vox_id:
-                # Try to find contact name
-                contacts = self.storage.get_contacts()
-                for name, vox_id in contacts.items():
-                    if vox_id == message.from_vox_id:
-                        return name
-                return message.from_vox_id
+                name = self.storage.find_contact_name(message.from_vox_id, self._server_domain())
+                return name or message.from_vox_id
         
         return "unknown"
     
     async def close(self) -> None:
-        """Close the Matrix client."""
+        """Close the Matrix client (a shared session is left to its owner)."""
+        if self._shared_session:
+            self.client.client_session = None
+            return
         await self.client.close()
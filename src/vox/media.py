@@ -0,0 +1,90 @@
+"""Streaming helpers for the content-addressed media cache."""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Tuple
+from urllib.parse import quote
+
+# Bytes read or written per chunk when hashing, uploading and downloading.
+CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(path: Path) -> Tuple[str, int]:
+    """Return the SHA-256 hex digest and size of a file, read in chunks."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class CacheWriter:
+    """Write a stream into the cache under its SHA-256, chunk by chunk.
+
+    Data goes to a temporary file in ``media_dir`` while it is hashed;
+    `commit` renames it to ``media_dir / <sha256>`` (or drops it if that
+    content is already cached) and `discard` removes it.
+    """
+
+    def __init__(self, media_dir: Path):
+        media_dir.mkdir(parents=True, exist_ok=True)
+        self.media_dir = media_dir
+        self.digest = hashlib.sha256()
+        self.size = 0
+        fd, name = tempfile.mkstemp(dir=media_dir, prefix=".partial-")
+        self._file = os.fdopen(fd, "wb")
+        self._tmp = Path(name)
+
+    def write(self, chunk: bytes) -> None:
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        self._file.write(chunk)
+
+    def commit(self) -> Tuple[str, Path]:
+        """Finish the file; return its SHA-256 and cached path."""
+        self._file.close()
+        sha256 = self.digest.hexdigest()
+        path = self.media_dir / sha256
+        if path.exists():
+            self._tmp.unlink()
+        else:
+            os.replace(self._tmp, path)
+        return sha256, path
+
+    def discard(self) -> None:
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def cache_stream(stream: BinaryIO, media_dir: Path) -> Tuple[str, int, Path]:
+    """Copy a binary stream (e.g. stdin) into the cache; return sha256, size, path."""
+    writer = CacheWriter(media_dir)
+    try:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            writer.write(chunk)
+    except BaseException:
+        writer.discard()
+        raise
+    sha256, path = writer.commit()
+    return sha256, writer.size, path
+
+
+async def file_chunks(path: Path) -> AsyncIterator[bytes]:
+    """Yield a file's contents in chunks, for a streamed request body."""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            yield chunk
+
+
+def mxc_path(url: str) -> str:
+    """Turn ``mxc://server/media_id`` into ``server/media_id`` for download URLs."""
+    if not url.startswith("mxc://"):
+        raise ValueError(f"Not an mxc:// URI: {url}")
+    server, _, media_id = url[len("mxc://"):].partition("/")
+    if not server or not media_id:
+        raise ValueError(f"Not an mxc:// URI: {url}")
+    return f"{quote(server, safe='')}/{quote(media_id, safe='')}"
@@ -0,0 +1,169 @@
+"""Host many Vox identities in one asyncio process."""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import aiohttp
+
+from .client import VoxClient
+from .scheduler import RequestScheduler
+from .storage import Conversation
+from .transport import DEFAULT_POOL_LIMIT, DEFAULT_POOL_LIMIT_PER_HOST, create_session
+
+# Default number of inbox syncs in flight across the whole pool.
+DEFAULT_SYNC_CONCURRENCY = 16
+
+# Default minimum seconds between two inbox syncs of the same identity.
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class VoxPool:
+    """A set of Vox identities sharing one connection pool and sync scheduler.
+
+    Each identity is a `VoxClient` for an explicit Vox home directory; none of
+    them read ``$VOX_HOME``. All clients send over one HTTP connection pool
+    through one `RequestScheduler` (so rate limits are shared), and `watch` syncs every identity's inbox from a fixed number of worker
+    tasks instead of one long-poll loop per identity, so the per-identity cost
+    is its storage plus a slot in the sync queue.
+
+    Must be used from a running event loop::
+
+        async with VoxPool() as pool:
+            alice = pool.add("/srv/agents/alice")
+            await alice.send_message("bob", "hi")
+            async for client, conv in pool.watch():
+                ...
+    """
+
+    def __init__(
+        self,
+        pool_limit: int = DEFAULT_POOL_LIMIT,
+        pool_limit_per_host: int = DEFAULT_POOL_LIMIT_PER_HOST,
+        sync_concurrency: int = DEFAULT_SYNC_CONCURRENCY,
+        sync_timeout: float = 0.0,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        """Create an empty pool.
+
+        Args:
+            pool_limit: Total HTTP connections shared by all identities.
+            pool_limit_per_host: Per-homeserver cap (0 = no separate cap).
+            sync_concurrency: Inbox syncs in flight at once during `watch`.
+            sync_timeout: Long-poll seconds per sync; the default 0 polls, so
+                a worker never sits idle on one quiet identity.
+            poll_interval: Minimum seconds between syncs of one identity.
+            scheduler: Paces and retries every identity's requests; its
+                ``stats`` cover the whole pool.
+        """
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.sync_concurrency = sync_concurrency
+        self.sync_timeout = sync_timeout
+        self.poll_interval = poll_interval
+        self.scheduler = scheduler or RequestScheduler()
+        self.clients: Dict[Path, VoxClient] = {}
+        # Last sync error per identity (cleared by its next successful sync)
+        self.sync_errors: Dict[Path, str] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._due: Optional["asyncio.Queue[VoxClient]"] = None
+
+    async def __aenter__(self) -> "VoxPool":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = create_session(self.pool_limit, self.pool_limit_per_host)
+        return self._session
+
+    def add(self, vox_home: Union[str, Path]) -> VoxClient:
+        """Return the client for a Vox home, adding it to the pool if new.
+
+        Adding an identity while `watch` is running schedules it right away.
+        """
+        home = Path(vox_home).expanduser().resolve()
+        client = self.clients.get(home)
+        if client is None:
+            client = VoxClient(home, session=self._ensure_session(), scheduler=self.scheduler)
+            self.clients[home] = client
+            if self._due is not None:
+                self._due.put_nowait(client)
+        return client
+
+    async def remove(self, vox_home: Union[str, Path]) -> bool:
+        """Close an identity's client and drop it from the pool."""
+        home = Path(vox_home).expanduser().resolve()
+        client = self.clients.pop(home, None)
+        if client is None:
+            return False
+        self.sync_errors.pop(home, None)
+        await client.close()
+        return True
+
+    async def watch(
+        self, from_contact: Optional[str] = None
+    ) -> AsyncIterator[Tuple[VoxClient, Conversation]]:
+        """Sync every identity's inbox and yield ``(client, conversation)`` pairs.
+
+        ``sync_concurrency`` workers take identities from a shared queue; an
+        identity goes back on the queue ``poll_interval`` seconds after its
+        last sync started. Sync tokens and history are saved per identity
+        after each sync, exactly as `VoxClient.watch` does.
+        """
+        if self._due is not None:
+            raise RuntimeError("VoxPool.watch is already running")
+        self._due = asyncio.Queue()
+        arrived: "asyncio.Queue[Tuple[VoxClient, Conversation]]" = asyncio.Queue()
+        for client in self.clients.values():
+            self._due.put_nowait(client)
+        workers: List["asyncio.Future[None]"] = [
+            asyncio.ensure_future(self._sync_worker(arrived, from_contact))
+            for _ in range(self.sync_concurrency)
+        ]
+        try:
+            while True:
+                yield await arrived.get()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._due = None
+
+    async def _sync_worker(
+        self,
+        arrived: "asyncio.Queue[Tuple[VoxClient, Conversation]]",
+        from_contact: Optional[str],
+    ) -> None:
+        """Sync identities from the due queue one at a time, forever."""
+        loop = asyncio.get_running_loop()
+        due = self._due
+        while True:
+            client = await due.get()
+            home = client.storage.vox_home
+            if self.clients.get(home) is not client:
+                continue  # Removed from the pool since it was queued
+            started = time.monotonic()
+            try:
+                batch = await client.get_inbox(from_contact, self.sync_timeout)
+                self.sync_errors.pop(home, None)
+            except Exception as e:
+                batch = []
+                self.sync_errors[home] = str(e)
+            for conv in batch:
+                arrived.put_nowait((client, conv))
+            delay = max(0.0, self.poll_interval - (time.monotonic() - started))
+            loop.call_later(delay, due.put_nowait, client)
+
+    async def close(self) -> None:
+        """Close every client, then the shared connection pool."""
+        clients = list(self.clients.values())
+        self.clients.clear()
+        await asyncio.gather(*(client.close() for client in clients))
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,199 @@
+"""Rate-limit aware pacing and retries for homeserver requests."""
+
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiohttp
+from nio import AsyncClient, AsyncClientConfig
+
+# Requests per second sent to one homeserver, and the burst allowed above
+# that rate after a quiet period. A rate of 0 disables pacing.
+DEFAULT_RATE = 100.0
+DEFAULT_BURST = 200
+
+# Retries of one request after a rate limit or transient error.
+DEFAULT_MAX_RETRIES = 5
+
+# Default exponential backoff (seconds): retry n waits a random time in
+# [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)].
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+# Wait (seconds) after a 429 that carries no retry_after_ms.
+DEFAULT_RETRY_AFTER = 5.0
+
+# Statuses worth retrying: the server is overloaded or a proxy lost it.
+RETRYABLE_STATUSES = frozenset({500, 502, 503, 504})
+
+# Methods that are safe to repeat after a transient error. Matrix sends are
+# PUTs with a client transaction ID, so a repeated send is deduplicated by the
+# homeserver; POSTs (room creation, registration) are only retried when the
+# server rate-limited them, i.e. did not process them.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+
+class _TokenBucket:
+    """Per-homeserver pacing: a token bucket that a 429 can pause."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _reserve(self) -> float:
+        """Take a token (possibly on credit); return seconds until it is due."""
+        now = time.monotonic()
+        wait = max(0.0, self.paused_until - now)
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+        return wait
+
+    async def acquire(self) -> bool:
+        """Wait for this request's turn; return whether it had to wait."""
+        wait = self._reserve()
+        waited = wait > 0
+        while wait > 0:
+            await asyncio.sleep(wait)
+            # A 429 may have paused the homeserver while we slept
+            wait = self.paused_until - time.monotonic()
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request to this homeserver for ``seconds``."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RequestScheduler:
+    """Paces and retries every request Vox sends to its homeservers.
+
+    Each homeserver gets a token bucket of ``rate`` requests per second (with
+    bursts up to ``burst``). A 429 / ``M_LIMIT_EXCEEDED`` pauses that
+    homeserver's bucket for the server's ``retry_after_ms``, so concurrent
+    requests back off together, and the request is then retried. Connection
+    errors, timeouts and 5xx responses are retried with jittered exponential
+    backoff when the request is safe to repeat.
+
+    ``stats`` counts ``requests`` (attempts sent), ``retries``, ``throttled``
+    (429s received) and ``paced`` (requests delayed by the bucket) for
+    monitoring. One scheduler can be shared by many clients.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats: Counter = Counter()
+        self._buckets: Dict[str, _TokenBucket] = {}
+
+    def _bucket(self, homeserver: str) -> _TokenBucket:
+        bucket = self._buckets.get(homeserver)
+        if bucket is None:
+            bucket = self._buckets[homeserver] = _TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the ``attempt``-th retry (0-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    async def _retry_after(response: aiohttp.ClientResponse) -> float:
+        """Seconds a 429 response asks us to wait."""
+        try:
+            data = await response.json(content_type=None)
+            retry_after_ms = data.get("retry_after_ms")
+            if retry_after_ms is not None:
+                return float(retry_after_ms) / 1000
+        except Exception:
+            pass
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return DEFAULT_RETRY_AFTER
+
+    async def request(
+        self,
+        homeserver: str,
+        send: Callable[[], Awaitable[aiohttp.ClientResponse]],
+        idempotent: bool = True,
+    ) -> aiohttp.ClientResponse:
+        """Send a request through the homeserver's pacing and retry policy.
+
+        ``send`` performs one attempt and is called again for each retry.
+        Transient failures are only retried when ``idempotent``; rate-limited
+        requests always are. Once retries run out the last response is
+        returned (or the last error raised) for the caller to report.
+        """
+        bucket = self._bucket(homeserver)
+        attempt = 0
+        while True:
+            if await bucket.acquire():
+                self.stats["paced"] += 1
+            self.stats["requests"] += 1
+            try:
+                response = await send()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+            else:
+                if response.status == 429:
+                    self.stats["throttled"] += 1
+                    if attempt >= self.max_retries:
+                        return response
+                    retry_after = await self._retry_after(response)
+                    bucket.pause(retry_after)
+                    # Spread the herd that was paused together
+                    delay = retry_after + random.uniform(0, self.backoff_base)
+                elif response.status in RETRYABLE_STATUSES and idempotent:
+                    if attempt >= self.max_retries:
+                        return response
+                    delay = self.backoff(attempt)
+                else:
+                    return response
+                response.release()
+            self.stats["retries"] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+class ScheduledAsyncClient(AsyncClient):
+    """A nio client whose every HTTP request goes through a RequestScheduler.
+
+    nio's own 429 and timeout retry loops are turned off so the scheduler is
+    the only place requests are paced and retried.
+    """
+
+    def __init__(self, *args, scheduler: Optional[RequestScheduler] = None, **kwargs):
+        kwargs.setdefault(
+            "config", AsyncClientConfig(max_limit_exceeded=0, max_timeouts=0)
+        )
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or RequestScheduler()
+
+    async def send(self, method, path, data=None, headers=None, trace_context=None, timeout=None):
+        parent = super().send
+        # Streamed bodies (uploads) cannot be replayed
+        replayable = data is None or isinstance(data, (str, bytes))
+        return await self.scheduler.request(
+            self.homeserver.rstrip("/"),
+            lambda: parent(method, path, data, headers, trace_context, timeout),
+            idempotent=replayable and method.upper() in IDEMPOTENT_METHODS,
+        )
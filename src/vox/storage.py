@@ -2,10 +2,20 @@
 
 import os
 import json
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 import toml
 from pydantic import BaseModel
+from .home import CONTACTS_FILE, default_vox_home
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, atomic renames only
+    fcntl = None
 
 
 class Contact(BaseModel):
@@ -14,6 +24,15 @@ class Contact(BaseModel):
     vox_id: str
 
 
+class Attachment(BaseModel):
+    """A file sent through the homeserver's media repository."""
+    url: str
+    name: str
+    size: Optional[int] = None
+    mimetype: Optional[str] = None
+    sha256: Optional[str] = None
+
+
 class Message(BaseModel):
     """Message model."""
     from_vox_id: str
@@ -21,6 +40,9 @@ class Message(BaseModel):
     timestamp: str
     conversation_id: str
     body: str
+    event_id: Optional[str] = None
+    txn_id: Optional[str] = None
+    attachment: Optional[Attachment] = None
 
 
 class Conversation(BaseModel):
@@ -30,62 +52,381 @@ class Conversation(BaseModel):
     messages: List[Message]
 
 
+class DirectoryEntry(BaseModel):
+    """An agent listed in the Vox directory."""
+    user_id: str
+    vox_id: str
+    description: str
+
+
+class SearchResult(BaseModel):
+    """A message matching a history search, with its relevance score."""
+    with_contact: str
+    message: Message
+    score: float
+
+
+def merge_conversations(conversations: List[Conversation]) -> List[Conversation]:
+    """Merge conversations with the same ID, keeping first-seen order."""
+    merged: Dict[str, Conversation] = {}
+    for conv in conversations:
+        if conv.conversation_id in merged:
+            merged[conv.conversation_id].messages.extend(conv.messages)
+        else:
+            merged[conv.conversation_id] = conv.model_copy(
+                update={"messages": list(conv.messages)}
+            )
+    return list(merged.values())
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    """Write a file via a temp file in the same directory and an atomic rename.
+
+    Readers see either the old or the new contents, never a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _atomic_write_toml(path: Path, data: Dict[str, Any]) -> None:
+    """Write TOML atomically (see `_atomic_write`)."""
+    _atomic_write(path, toml.dumps(data))
+
+
+def parse_timestamp_ms(timestamp: str) -> int:
+    """Parse a timestamp to milliseconds since the epoch.
+
+    Accepts the ISO-8601 strings Vox puts in events (naive ones are UTC) and
+    integer milliseconds such as ``origin_server_ts``. Raises ValueError for
+    anything else.
+    """
+    value = str(timestamp).strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(
+            f"Invalid timestamp '{timestamp}': expected ISO-8601 or epoch milliseconds"
+        ) from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def timestamp_ms(timestamp: str) -> int:
+    """Normalize a stored message timestamp to milliseconds since the epoch.
+
+    Like `parse_timestamp_ms`, except anything unparseable sorts first (0)
+    so one malformed event cannot break saving or reading history.
+    """
+    try:
+        return parse_timestamp_ms(timestamp)
+    except ValueError:
+        return 0
+
+
+def _dedupe_key(msg: Message) -> str:
+    """Identity of a message for deduplication.
+
+    The Vox transaction ID is set on both the local echo of a sent message and
+    its server copy, so it is preferred; then the Matrix event ID; messages
+    from before either existed fall back to timestamp and body.
+    """
+    return msg.txn_id or msg.event_id or f"{msg.timestamp}\x1f{msg.body}"
+
+
+def _attachment(column: Optional[str]) -> Optional[Attachment]:
+    return Attachment.model_validate_json(column) if column else None
+
+
+def _canonical_vox_id(vox_id: str, domain: Optional[str]) -> str:
+    """Qualify a bare Vox ID (vox_x) as @vox_x:domain so both forms compare equal."""
+    if vox_id.startswith("@") and ":" in vox_id:
+        return vox_id
+    if domain:
+        return f"@{vox_id.lstrip('@')}:{domain}"
+    return vox_id
+
+
+_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    with_contact TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    event_id TEXT,
+    txn_id TEXT,
+    from_vox_id TEXT NOT NULL,
+    to_vox_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    ts_ms INTEGER NOT NULL DEFAULT 0,
+    body TEXT NOT NULL,
+    attachment TEXT,
+    UNIQUE (conversation_id, dedupe_key)
+);
+CREATE TABLE IF NOT EXISTS conversation_rooms (
+    conversation_id TEXT PRIMARY KEY,
+    room_id TEXT NOT NULL,
+    pagination_token TEXT
+);
+CREATE TABLE IF NOT EXISTS media (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER,
+    mimetype TEXT,
+    verified INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS directory (
+    user_id TEXT PRIMARY KEY,
+    vox_id TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+"""
+
+# Created after _migrate_schema so older databases have the columns first.
+_HISTORY_INDEXES = """
+DROP INDEX IF EXISTS idx_messages_conversation;
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_time
+    ON messages (conversation_id, ts_ms, seq);
+CREATE INDEX IF NOT EXISTS idx_media_sha256 ON media (sha256, verified);
+"""
+
+# Full-text indexes over message bodies and directory listings, kept current
+# by triggers (messages are never updated in place; directory rows are).
+_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+    USING fts5(body, content='messages', content_rowid='seq');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, body) VALUES (new.seq, new.body);
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS directory_fts
+    USING fts5(vox_id, description, content='directory', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS directory_fts_insert AFTER INSERT ON directory BEGIN
+    INSERT INTO directory_fts (rowid, vox_id, description)
+        VALUES (new.rowid, new.vox_id, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS directory_fts_delete AFTER DELETE ON directory BEGIN
+    INSERT INTO directory_fts (directory_fts, rowid, vox_id, description)
+        VALUES ('delete', old.rowid, old.vox_id, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS directory_fts_update AFTER UPDATE ON directory BEGIN
+    INSERT INTO directory_fts (directory_fts, rowid, vox_id, description)
+        VALUES ('delete', old.rowid, old.vox_id, old.description);
+    INSERT INTO directory_fts (rowid, vox_id, description)
+        VALUES (new.rowid, new.vox_id, new.description);
+END;
+"""
+
+
 class Storage:
     """Local storage manager for Vox."""
     
     def __init__(self, vox_home: Optional[Path] = None):
-        if vox_home is None:
-            vox_home = Path(os.environ.get("VOX_HOME", Path.home() / ".vox"))
-        
-        self.vox_home = vox_home
+        self.vox_home = default_vox_home(vox_home)
         self.vox_home.mkdir(parents=True, exist_ok=True)
         
-        self.contacts_file = self.vox_home / "contacts.toml"
+        self.contacts_file = self.vox_home / CONTACTS_FILE
         self.rooms_file = self.vox_home / "rooms.toml"
         self.history_file = self.vox_home / "history.toml"
+        self.history_db_file = self.vox_home / "history.db"
         self.sync_token_file = self.vox_home / "sync_token"
+        self.sync_filter_file = self.vox_home / "sync_filter.toml"
+        self.directory_sync_token_file = self.vox_home / "directory_sync_token"
+        self.backfill_gaps_file = self.vox_home / "backfill_gaps.toml"
+        self.lock_file = self.vox_home / ".lock"
+        self.media_dir = self.vox_home / "media"
+        self._lock_depth = 0
         
+        self._db: Optional[sqlite3.Connection] = None
+        self._fts = False
+        # Contacts cache: forward map, the file stamp it was loaded at, and
+        # reverse (canonical vox_id -> name) indexes per homeserver domain.
+        self._contacts: Optional[Dict[str, str]] = None
+        self._contacts_stamp: Optional[Tuple[int, int, int]] = None
+        self._contacts_by_id: Dict[Optional[str], Dict[str, str]] = {}
+        # Rooms cache (vox_id -> room_id) and the file stamp it was loaded at.
+        self._rooms: Optional[Dict[str, str]] = None
+        self._rooms_stamp: Optional[Tuple[int, int, int]] = None
         self._ensure_contacts_file()
     
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the Vox home's advisory lock.
+
+        Every file mutation takes this lock (as a re-read, modify and atomic
+        rename), so concurrent `vox` processes sharing a home never lose each
+        other's updates. Hold it explicitly to apply several mutations
+        together; it is re-entrant within one Storage. Reads don't need it.
+        """
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        with open(self.lock_file, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
     def _ensure_contacts_file(self) -> None:
         """Ensure contacts file exists."""
-        if not self.contacts_file.exists():
-            with open(self.contacts_file, "w") as f:
-                toml.dump({}, f)
-        if not self.rooms_file.exists():
-            with open(self.rooms_file, "w") as f:
-                toml.dump({}, f)
+        if self.contacts_file.exists() and self.rooms_file.exists():
+            return
+        with self.locked():
+            for path in (self.contacts_file, self.rooms_file):
+                if not path.exists():
+                    _atomic_write_toml(path, {})
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """Message history database, opened (and migrated) on first use."""
+        if self._db is None:
+            # SQLite does its own locking; wait out other processes' writes
+            self._db = sqlite3.connect(str(self.history_db_file), timeout=30.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_HISTORY_SCHEMA)
+            self._migrate_schema()
+            self._db.executescript(_HISTORY_INDEXES)
+            self._ensure_search_index()
+            self._migrate_history_toml()
+        return self._db
+
+    def _migrate_schema(self) -> None:
+        """Bring a history database created by an older version up to date."""
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(messages)")}
+        if "txn_id" not in columns:
+            with self._db:
+                self._db.execute("ALTER TABLE messages ADD COLUMN txn_id TEXT")
+        if "attachment" not in columns:
+            with self._db:
+                self._db.execute("ALTER TABLE messages ADD COLUMN attachment TEXT")
+        if "ts_ms" not in columns:
+            with self._db:
+                self._db.execute(
+                    "ALTER TABLE messages ADD COLUMN ts_ms INTEGER NOT NULL DEFAULT 0"
+                )
+                self._db.executemany(
+                    "UPDATE messages SET ts_ms = ? WHERE seq = ?",
+                    [
+                        (timestamp_ms(ts), seq)
+                        for seq, ts in self._db.execute("SELECT seq, timestamp FROM messages")
+                    ],
+                )
+
+    def _ensure_search_index(self) -> None:
+        """Create the full-text indexes, building any new one from existing rows."""
+        existed = {
+            row[0] for row in self._db.execute(
+                "SELECT name FROM sqlite_master WHERE name IN ('messages_fts', 'directory_fts')"
+            )
+        }
+        try:
+            self._db.executescript(_SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 — search falls back to substring matching
+            self._fts = False
+            return
+        with self._db:
+            for table in ("messages_fts", "directory_fts"):
+                if table not in existed:
+                    self._db.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+        self._fts = True
+
+    def _migrate_history_toml(self) -> None:
+        """Import a legacy history.toml into the database, then retire it."""
         if not self.history_file.exists():
-            with open(self.history_file, "w") as f:
-                toml.dump({"conversations": {}}, f)
+            return
+        with self.locked():
+            if not self.history_file.exists():
+                return  # Another process migrated it while we waited
+            with open(self.history_file, "r") as f:
+                data = toml.load(f)
+            self.save_message_groups([
+                (conv_id, conv_data["with_contact"], [Message(**m) for m in conv_data["messages"]])
+                for conv_id, conv_data in data.get("conversations", {}).items()
+            ])
+            self.history_file.rename(self.history_file.with_suffix(".toml.migrated"))
     
+    def _file_stamp(self, path: Path) -> Tuple[int, int, int]:
+        # Atomic writes replace the file, so the inode changes on every write
+        stat = path.stat()
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_contacts(self) -> Dict[str, str]:
+        """Return the cached contacts, re-reading contacts.toml only if it changed."""
+        stamp = self._file_stamp(self.contacts_file)
+        if self._contacts is None or stamp != self._contacts_stamp:
+            with open(self.contacts_file, "r") as f:
+                self._contacts = toml.load(f)
+            self._contacts_stamp = stamp
+            self._contacts_by_id = {}
+        return self._contacts
+
+    def _write_contacts(self, contacts: Dict[str, str]) -> None:
+        _atomic_write_toml(self.contacts_file, contacts)
+        self._contacts = contacts
+        self._contacts_stamp = self._file_stamp(self.contacts_file)
+        self._contacts_by_id = {}
+
     def add_contact(self, name: str, vox_id: str) -> None:
         """Add a contact."""
-        contacts = self.get_contacts()
-        contacts[name] = vox_id
-        
-        with open(self.contacts_file, "w") as f:
-            toml.dump(contacts, f)
+        with self.locked():
+            contacts = dict(self._load_contacts())
+            contacts[name] = vox_id
+            self._write_contacts(contacts)
     
     def get_contacts(self) -> Dict[str, str]:
         """Get all contacts."""
-        with open(self.contacts_file, "r") as f:
-            return toml.load(f)
+        return dict(self._load_contacts())
     
     def get_contact(self, name: str) -> Optional[str]:
         """Get a specific contact."""
-        contacts = self.get_contacts()
-        return contacts.get(name)
+        return self._load_contacts().get(name)
+
+    def find_contact_name(self, vox_id: str, domain: Optional[str] = None) -> Optional[str]:
+        """Reverse-look up the contact name for a Vox ID.
+
+        With ``domain`` (the homeserver domain), bare ``vox_x`` IDs and full
+        ``@vox_x:domain`` Matrix IDs match each other. If several contacts
+        share an ID the first one wins.
+        """
+        contacts = self._load_contacts()
+        index = self._contacts_by_id.get(domain)
+        if index is None:
+            index = {}
+            for name, contact_id in contacts.items():
+                index.setdefault(_canonical_vox_id(contact_id, domain), name)
+            self._contacts_by_id[domain] = index
+        return index.get(_canonical_vox_id(vox_id, domain))
     
     def remove_contact(self, name: str) -> bool:
         """Remove a contact."""
-        contacts = self.get_contacts()
-        if name in contacts:
+        with self.locked():
+            contacts = dict(self._load_contacts())
+            if name not in contacts:
+                return False
             del contacts[name]
-            with open(self.contacts_file, "w") as f:
-                toml.dump(contacts, f)
+            self._write_contacts(contacts)
             return True
-        return False
     
     def get_sync_token(self) -> Optional[str]:
         """Get the last sync token."""
@@ -97,79 +438,459 @@ class Storage:
     
     def set_sync_token(self, token: str) -> None:
         """Set the sync token."""
-        with open(self.sync_token_file, "w") as f:
-            f.write(token)
+        with self.locked():
+            _atomic_write(self.sync_token_file, token)
     
+    def get_sync_filter_id(self, fingerprint: str) -> Optional[str]:
+        """Get the server-side filter ID registered for a filter fingerprint."""
+        if not self.sync_filter_file.exists():
+            return None
+        with open(self.sync_filter_file, "r") as f:
+            return toml.load(f).get(fingerprint)
+
+    def set_sync_filter_id(self, fingerprint: str, filter_id: str) -> None:
+        """Remember the server-side filter ID for a filter fingerprint."""
+        with self.locked():
+            filters = {}
+            if self.sync_filter_file.exists():
+                with open(self.sync_filter_file, "r") as f:
+                    filters = toml.load(f)
+            filters[fingerprint] = filter_id
+            _atomic_write_toml(self.sync_filter_file, filters)
+
+    def get_backfill_gaps(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the history gaps still to be backfilled, per room.
+
+        Each gap is a dict with ``start`` (the oldest position reached so
+        far), ``end`` (the position to page back to) and ``errors`` (failed
+        attempts in a row without progress), oldest gap first.
+        """
+        if not self.backfill_gaps_file.exists():
+            return {}
+        with open(self.backfill_gaps_file, "r") as f:
+            return toml.load(f)
+
+    def set_backfill_gaps(self, gaps: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Replace the set of gaps still waiting for a backfill."""
+        with self.locked():
+            if gaps:
+                _atomic_write_toml(self.backfill_gaps_file, gaps)
+            elif self.backfill_gaps_file.exists():
+                self.backfill_gaps_file.unlink()
+
+    def get_directory_sync_token(self) -> Optional[str]:
+        """Get the sync token the directory snapshot was last refreshed at."""
+        if not self.directory_sync_token_file.exists():
+            return None
+        with open(self.directory_sync_token_file, "r") as f:
+            return f.read().strip() or None
+
+    def set_directory_sync_token(self, token: str) -> None:
+        """Set the directory sync token."""
+        with self.locked():
+            _atomic_write(self.directory_sync_token_file, token)
+
+    def _load_rooms(self) -> Dict[str, str]:
+        """Return the cached room map, re-reading rooms.toml only if it changed."""
+        stamp = self._file_stamp(self.rooms_file)
+        if self._rooms is None or stamp != self._rooms_stamp:
+            with open(self.rooms_file, "r") as f:
+                self._rooms = toml.load(f)
+            self._rooms_stamp = stamp
+        return self._rooms
+
     def get_room(self, vox_id: str) -> Optional[str]:
         """Get the room ID for a specific Vox ID."""
-        with open(self.rooms_file, "r") as f:
-            rooms = toml.load(f)
-            return rooms.get(vox_id)
+        return self._load_rooms().get(vox_id)
             
     def set_room(self, vox_id: str, room_id: str) -> None:
         """Set the room ID for a specific Vox ID."""
-        with open(self.rooms_file, "r") as f:
-            rooms = toml.load(f)
-        rooms[vox_id] = room_id
-        with open(self.rooms_file, "w") as f:
-            toml.dump(rooms, f)
+        self.set_rooms({vox_id: room_id})
+
+    def set_rooms(self, rooms: Dict[str, str]) -> None:
+        """Set several Vox ID -> room ID mappings with a single atomic write."""
+        if all(self._load_rooms().get(vox_id) == room_id for vox_id, room_id in rooms.items()):
+            return
+        with self.locked():
+            updated = {**self._load_rooms(), **rooms}  # re-read under the lock
+            _atomic_write_toml(self.rooms_file, updated)
+            self._rooms = updated
+            self._rooms_stamp = self._file_stamp(self.rooms_file)
 
     def save_messages(self, conversation_id: str, with_contact: str, messages: List[Message]) -> None:
-        """Save messages to local history."""
-        with open(self.history_file, "r") as f:
-            data = toml.load(f)
-            
-        if conversation_id not in data["conversations"]:
-            data["conversations"][conversation_id] = {
-                "with_contact": with_contact,
-                "messages": []
-            }
-            
-        existing_messages = data["conversations"][conversation_id]["messages"]
-        added = False
-        for msg in messages:
-            msg_dict = msg.model_dump()
-            # Simple deduplication by timestamp and body
-            if not any(m["timestamp"] == msg_dict["timestamp"] and m["body"] == msg_dict["body"] for m in existing_messages):
-                existing_messages.append(msg_dict)
-                added = True
-        
-        if added:
-            # Sort messages by timestamp
-            existing_messages.sort(key=lambda x: str(x["timestamp"]))
-            with open(self.history_file, "w") as f:
-                toml.dump(data, f)
-                
-    def get_history(self, conversation_id: str) -> Optional[Conversation]:
-        """Get local conversation history."""
-        with open(self.history_file, "r") as f:
-            data = toml.load(f)
-            
-        conv_data = data["conversations"].get(conversation_id)
-        if not conv_data:
+        """Save messages to local history.
+
+        Messages are deduplicated exactly by a unique index on their
+        transaction or event ID and kept in order by an index on their
+        normalized millisecond timestamp, so each insert is a single indexed
+        append regardless of history size. When the server copy of a locally sent
+        message arrives, it fills in the event ID of the stored local echo
+        instead of adding a second row.
+        """
+        self.save_message_groups([(conversation_id, with_contact, messages)])
+
+    def save_message_groups(self, groups: List[Tuple[str, str, List[Message]]]) -> None:
+        """Save messages for several conversations in a single transaction.
+
+        ``groups`` holds ``(conversation_id, with_contact, messages)`` tuples.
+        """
+        with self.db:
+            for conversation_id, with_contact, messages in groups:
+                self.db.execute(
+                    "INSERT OR IGNORE INTO conversations (conversation_id, with_contact) VALUES (?, ?)",
+                    (conversation_id, with_contact),
+                )
+                self.db.executemany(
+                    "INSERT INTO messages "
+                    "(conversation_id, dedupe_key, event_id, txn_id, from_vox_id, to_vox_id, "
+                    "timestamp, ts_ms, body, attachment) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (conversation_id, dedupe_key) "
+                    "DO UPDATE SET event_id = COALESCE(messages.event_id, excluded.event_id)",
+                    [
+                        (
+                            conversation_id,
+                            _dedupe_key(msg),
+                            msg.event_id,
+                            msg.txn_id,
+                            msg.from_vox_id,
+                            msg.to_vox_id,
+                            msg.timestamp,
+                            timestamp_ms(msg.timestamp),
+                            msg.body,
+                            msg.attachment.model_dump_json() if msg.attachment else None,
+                        )
+                        for msg in messages
+                    ],
+                )
+                # Remember announced hashes so a download can find a cached copy
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO media (url, sha256, size, mimetype) VALUES (?, ?, ?, ?)",
+                    [
+                        (a.url, a.sha256, a.size, a.mimetype)
+                        for a in (msg.attachment for msg in messages)
+                        if a is not None and a.sha256
+                    ],
+                )
+
+    def has_conversation(self, conversation_id: str) -> bool:
+        """Check whether a conversation exists in local history."""
+        return self._conversation_contact(conversation_id) is not None
+
+    def index_conversations(
+        self, rooms: Dict[str, str], pagination_token: Optional[str] = None
+    ) -> None:
+        """Record the room each conversation lives in.
+
+        ``rooms`` maps conversation ID to room ID. ``pagination_token`` is a
+        stream position at or after the conversation's latest known event
+        (None for "the room's latest event"); backwards pagination from it
+        reaches the conversation without walking newer traffic first.
+        """
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO conversation_rooms (conversation_id, room_id, pagination_token) "
+                "VALUES (?, ?, ?) "
+                "ON CONFLICT (conversation_id) DO UPDATE SET "
+                "room_id = excluded.room_id, pagination_token = excluded.pagination_token",
+                [(conv_id, room_id, pagination_token) for conv_id, room_id in rooms.items()],
+            )
+
+    def get_conversation_room(self, conversation_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Return ``(room_id, pagination_token)`` for an indexed conversation."""
+        row = self.db.execute(
+            "SELECT room_id, pagination_token FROM conversation_rooms WHERE conversation_id = ?",
+            (conversation_id,),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _conversation_contact(self, conversation_id: str) -> Optional[str]:
+        row = self.db.execute(
+            "SELECT with_contact FROM conversations WHERE conversation_id = ?",
+            (conversation_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _cursor_key(self, conversation_id: str, cursor: str, after: bool) -> Tuple[int, int]:
+        """Resolve a pagination cursor to a (ts_ms, seq) sort key.
+
+        Cursors starting with ``$`` are Matrix event IDs and resolve to that
+        exact message; anything else is treated as a timestamp boundary.
+        """
+        if cursor.startswith("$"):
+            row = self.db.execute(
+                "SELECT ts_ms, seq FROM messages WHERE conversation_id = ? AND event_id = ?",
+                (conversation_id, cursor),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Cursor event '{cursor}' not found in '{conversation_id}'")
+            return row[0], row[1]
+        # Timestamp cursors exclude every message at that timestamp.
+        return parse_timestamp_ms(cursor), (2 ** 62 if after else -1)
+
+    def iter_history(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Iterator[Message]:
+        """Stream a page of a conversation's messages in timestamp order.
+
+        Messages are yielded as rows are read instead of being collected
+        first. ``before`` and ``after`` are exclusive cursors (an event ID or
+        a timestamp). With ``limit`` the page holds the newest messages, or the
+        oldest ones following ``after`` when that cursor is given.
+        """
+        clauses = ["conversation_id = ?"]
+        params: List[Any] = [conversation_id]
+        if after is not None:
+            clauses.append("(ts_ms, seq) > (?, ?)")
+            params.extend(self._cursor_key(conversation_id, after, after=True))
+        if before is not None:
+            clauses.append("(ts_ms, seq) < (?, ?)")
+            params.extend(self._cursor_key(conversation_id, before, after=False))
+
+        newest_first = limit is not None and after is None
+        direction = "DESC" if newest_first else "ASC"
+        query = (
+            "SELECT from_vox_id, to_vox_id, timestamp, body, event_id, txn_id, attachment "
+            "FROM messages "
+            f"WHERE {' AND '.join(clauses)} "
+            f"ORDER BY ts_ms {direction}, seq {direction}"
+        )
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        rows: Any = self.db.execute(query, params)
+        if newest_first:
+            # A tail page is read newest-first; flip it back (at most `limit` rows).
+            rows = reversed(rows.fetchall())
+        for from_vox_id, to_vox_id, timestamp, body, event_id, txn_id, attachment in rows:
+            yield Message(
+                from_vox_id=from_vox_id,
+                to_vox_id=to_vox_id,
+                timestamp=timestamp,
+                conversation_id=conversation_id,
+                body=body,
+                event_id=event_id,
+                txn_id=txn_id,
+                attachment=_attachment(attachment),
+            )
+
+    def get_history(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Optional[Conversation]:
+        """Get local conversation history, optionally a single page of it."""
+        with_contact = self._conversation_contact(conversation_id)
+        if with_contact is None:
             return None
             
         return Conversation(
             conversation_id=conversation_id,
-            with_contact=conv_data["with_contact"],
-            messages=[Message(**m) for m in conv_data["messages"]]
+            with_contact=with_contact,
+            messages=list(self.iter_history(conversation_id, limit, before, after))
         )
 
+    def search(
+        self,
+        query: str,
+        contact: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[SearchResult]:
+        """Search message bodies across all conversations.
+
+        Every word of ``query`` must appear. Results are ranked by BM25
+        relevance (newest first among equals) and paginated with ``limit``
+        and ``offset``. ``since``/``until`` are inclusive timestamps.
+        """
+        terms = query.split()
+        if not terms:
+            raise ValueError("Search query is empty")
+
+        db = self.db  # opening the database also detects FTS5 support
+        clauses: List[str] = []
+        params: List[Any] = []
+        if self._fts:
+            source = "messages_fts JOIN messages m ON m.seq = messages_fts.rowid"
+            score = "-bm25(messages_fts)"
+            clauses.append("messages_fts MATCH ?")
+            params.append(" ".join('"' + term.replace('"', '""') + '"' for term in terms))
+        else:
+            source = "messages m"
+            score = "0.0"
+            for term in terms:
+                clauses.append("m.body LIKE ? ESCAPE '\\'")
+                escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                params.append(f"%{escaped}%")
+        if contact is not None:
+            clauses.append("c.with_contact = ?")
+            params.append(contact)
+        if conversation_id is not None:
+            clauses.append("m.conversation_id = ?")
+            params.append(conversation_id)
+        if since is not None:
+            clauses.append("m.ts_ms >= ?")
+            params.append(parse_timestamp_ms(since))
+        if until is not None:
+            clauses.append("m.ts_ms <= ?")
+            params.append(parse_timestamp_ms(until))
+
+        rows = db.execute(
+            "SELECT m.conversation_id, c.with_contact, m.from_vox_id, m.to_vox_id, "
+            f"m.timestamp, m.body, m.event_id, m.txn_id, m.attachment, {score} AS score "
+            f"FROM {source} JOIN conversations c ON c.conversation_id = m.conversation_id "
+            f"WHERE {' AND '.join(clauses)} "
+            "ORDER BY score DESC, m.ts_ms DESC, m.seq DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        )
+        return [
+            SearchResult(
+                with_contact=with_contact,
+                score=score_value,
+                message=Message(
+                    from_vox_id=from_vox_id,
+                    to_vox_id=to_vox_id,
+                    timestamp=timestamp,
+                    conversation_id=conv_id,
+                    body=body,
+                    event_id=event_id,
+                    txn_id=txn_id,
+                    attachment=_attachment(attachment),
+                ),
+            )
+            for (
+                conv_id, with_contact, from_vox_id, to_vox_id,
+                timestamp, body, event_id, txn_id, attachment, score_value,
+            ) in rows
+        ]
+
+    def media_path(self, sha256: str) -> Path:
+        """Where the media cache keeps the file with this SHA-256."""
+        return self.media_dir / sha256
+
+    def record_media(
+        self,
+        url: str,
+        sha256: str,
+        size: Optional[int] = None,
+        mimetype: Optional[str] = None,
+        verified: bool = False,
+    ) -> None:
+        """Remember the content hash of an mxc:// URI.
+
+        ``verified`` marks hashes we computed ourselves (uploads and
+        downloads); others are what a sender claimed and are only trusted to
+        find an already-cached copy. A claim never overwrites a verified hash.
+        """
+        with self.db:
+            self.db.execute(
+                "INSERT INTO media (url, sha256, size, mimetype, verified) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET sha256 = excluded.sha256, "
+                "size = excluded.size, mimetype = excluded.mimetype, verified = excluded.verified "
+                "WHERE excluded.verified OR NOT media.verified",
+                (url, sha256, size, mimetype, int(verified)),
+            )
+
+    def get_media_sha256(self, url: str) -> Optional[str]:
+        """Return the known (possibly claimed) SHA-256 of an mxc:// URI."""
+        row = self.db.execute("SELECT sha256 FROM media WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def find_media_url(self, sha256: str) -> Optional[str]:
+        """Return an mxc:// URI verified to hold the content with this SHA-256."""
+        row = self.db.execute(
+            "SELECT url FROM media WHERE sha256 = ? AND verified = 1 LIMIT 1", (sha256,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def update_directory(
+        self, entries: List[DirectoryEntry], removed: Optional[List[str]] = None
+    ) -> None:
+        """Apply directory changes (upserts and removed user IDs) in one transaction."""
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO directory (user_id, vox_id, description) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET "
+                "vox_id = excluded.vox_id, description = excluded.description",
+                [(e.user_id, e.vox_id, e.description) for e in entries],
+            )
+            self.db.executemany(
+                "DELETE FROM directory WHERE user_id = ?", [(u,) for u in removed or []]
+            )
+
+    def search_directory(self, query: str, limit: int = 50) -> List[DirectoryEntry]:
+        """Find directory entries whose Vox ID or description matches ``query``.
+
+        Every word of ``query`` must prefix a word of the entry (so "anal"
+        matches "vox_analyst"); best matches come first. Without FTS5 each
+        word need only appear somewhere. An empty query lists the snapshot.
+        """
+        terms = query.split()
+        db = self.db  # opening the database also detects FTS5 support
+        if not terms:
+            rows = db.execute(
+                "SELECT user_id, vox_id, description FROM directory "
+                "ORDER BY vox_id LIMIT ?",
+                (limit,),
+            )
+        elif self._fts:
+            rows = db.execute(
+                "SELECT d.user_id, d.vox_id, d.description "
+                "FROM directory_fts JOIN directory d ON d.rowid = directory_fts.rowid "
+                "WHERE directory_fts MATCH ? "
+                "ORDER BY bm25(directory_fts), d.vox_id LIMIT ?",
+                (" ".join('"' + t.replace('"', '""') + '"*' for t in terms), limit),
+            )
+        else:
+            clauses = []
+            params: List[Any] = []
+            for term in terms:
+                clauses.append("(vox_id || ' ' || description) LIKE ? ESCAPE '\\'")
+                escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                params.append(f"%{escaped}%")
+            rows = db.execute(
+                "SELECT user_id, vox_id, description FROM directory "
+                f"WHERE {' AND '.join(clauses)} ORDER BY vox_id LIMIT ?",
+                params + [limit],
+            )
+        return [
+            DirectoryEntry(user_id=user_id, vox_id=vox_id, description=description)
+            for user_id, vox_id, description in rows
+        ]
+
     def get_all_conversations(self) -> List[Conversation]:
         """Get all stored conversations."""
-        with open(self.history_file, "r") as f:
-            data = toml.load(f)
+        rows = self.db.execute(
+            "SELECT conversation_id, with_contact FROM conversations"
+        ).fetchall()
             
         results = []
-        for conv_id, conv_data in data["conversations"].items():
+        for conv_id, with_contact in rows:
             results.append(Conversation(
                 conversation_id=conv_id,
-                with_contact=conv_data["with_contact"],
-                messages=[Message(**m) for m in conv_data["messages"]]
+                with_contact=with_contact,
+                messages=list(self.iter_history(conv_id))
             ))
         return results
 
     def clear_sync_token(self) -> None:
         """Clear the sync token."""
-        if self.sync_token_file.exists():
-            self.sync_token_file.unlink()
+        with self.locked():
+            if self.sync_token_file.exists():
+                self.sync_token_file.unlink()
+
+    def close(self) -> None:
+        """Close the history database."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
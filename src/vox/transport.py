@@ -0,0 +1,37 @@
+"""Shared HTTP connection pool for Vox."""
+
+import aiohttp
+
+# Total connections kept open across all hosts, and per host (0 = no per-host cap).
+DEFAULT_POOL_LIMIT = 100
+DEFAULT_POOL_LIMIT_PER_HOST = 0
+
+# Seconds resolved homeserver addresses are cached.
+DNS_CACHE_TTL = 300
+
+# Seconds an idle connection is kept open for reuse.
+KEEPALIVE_TIMEOUT = 60.0
+
+# Default total time (seconds) for one request. Matrix requests made through
+# nio pass their own timeout, so long-poll syncs are not cut short by this.
+REQUEST_TIMEOUT = 60.0
+
+
+def create_session(
+    limit: int = DEFAULT_POOL_LIMIT,
+    limit_per_host: int = DEFAULT_POOL_LIMIT_PER_HOST,
+) -> aiohttp.ClientSession:
+    """Create a keep-alive HTTP session with a DNS cache and bounded pool.
+
+    Must be called while the event loop that will use it is running.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+    )
@@ -0,0 +1,218 @@
+"""Tests for the benchmark harness and its fake homeserver."""
+
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from nio import RoomSendError
+
+from benchmarks.fake_homeserver import HomeserverThread
+from benchmarks.run import BENCHMARKS, parse_args, run
+from vox.client import VoxClient
+from vox.scheduler import RequestScheduler
+
+
+class TestBenchmarks:
+    """End-to-end checks against the in-process fake homeserver."""
+
+    def test_message_round_trip(self):
+        """Test real clients register, send, auto-join and receive via the fake server."""
+        async def scenario(url):
+            alice = VoxClient(Path(tempfile.mkdtemp()))
+            bob = VoxClient(Path(tempfile.mkdtemp()))
+            await alice.initialize("alice", url)
+            await bob.initialize("bob", url)
+            alice.add_contact("bob", "vox_bob")
+            conv_id = await alice.send_message("bob", "hello bob")
+            await bob.get_inbox(timeout=0)  # joins the invite
+            await alice.send_message("bob", "second", conv_id)
+            inbox = await bob.get_inbox(timeout=0)
+            await alice.close()
+            await bob.close()
+            return conv_id, inbox
+
+        with HomeserverThread() as server:
+            conv_id, inbox = asyncio.run(scenario(server.url))
+
+        assert [c.conversation_id for c in inbox] == [conv_id]
+        assert [m.body for m in inbox[0].messages] == ["second"]
+
+    def test_unsynced_conversation_fetched_from_contact_room(self):
+        """Test a conversation not yet synced or indexed is found in the contact's room."""
+        async def scenario(url):
+            alice = VoxClient(Path(tempfile.mkdtemp()))
+            bob = VoxClient(Path(tempfile.mkdtemp()))
+            await alice.initialize("alice", url)
+            await bob.initialize("bob", url)
+            alice.add_contact("bob", "vox_bob")
+            await alice.send_message("bob", "hello bob")
+            await bob.get_inbox(timeout=0)  # joins the invite
+            conv_id = await alice.send_message("bob", "new thread")
+            missing = await bob.get_conversation(conv_id)
+            conv = await bob.get_conversation(conv_id, contact="@vox_alice:127.0.0.1")
+            await alice.close()
+            await bob.close()
+            return missing, conv
+
+        with HomeserverThread() as server:
+            missing, conv = asyncio.run(scenario(server.url))
+
+        assert missing is None
+        assert [m.body for m in conv.messages] == ["new thread"]
+
+    def test_directory_room_never_reaches_the_inbox(self):
+        """Test members cannot post to the directory, and its messages are not inbox traffic."""
+        async def scenario(url):
+            alice = VoxClient(Path(tempfile.mkdtemp()))
+            bob = VoxClient(Path(tempfile.mkdtemp()))
+            await alice.initialize("alice", url)
+            await bob.initialize("bob", url)
+            await alice.advertise("Summarizes papers")
+            await bob.discover_agents("papers")
+            await alice.get_inbox(timeout=0)
+            await bob.get_inbox(timeout=0)
+            directory = bob._ensure_backend()._cached_directory_room()
+            content = {"msgtype": "m.text", "body": "buy now", "vox": {"conversation_id": "conv_spam"}}
+            spam = await bob._ensure_backend().client.room_send(directory, "m.room.message", content)
+            # The creator may still post; nobody's inbox shows it
+            await alice._ensure_backend().client.room_send(directory, "m.room.message", content)
+            inboxes = [await alice.get_inbox(timeout=0), await bob.get_inbox(timeout=0)]
+            await alice.close()
+            await bob.close()
+            return spam, inboxes
+
+        with HomeserverThread() as server:
+            spam, inboxes = asyncio.run(scenario(server.url))
+
+        assert isinstance(spam, RoomSendError)
+        assert inboxes == [[], []]
+
+    def test_limited_sync_backfilled(self):
+        """Test messages beyond one sync's timeline limit are backfilled, in order."""
+        async def scenario(url):
+            alice = VoxClient(Path(tempfile.mkdtemp()))
+            bob = VoxClient(Path(tempfile.mkdtemp()))
+            await alice.initialize("alice", url)
+            await bob.initialize("bob", url)
+            alice.add_contact("bob", "vox_bob")
+            conv_id = await alice.send_message("bob", "0")
+            await bob.get_inbox(timeout=0)
+            await alice.send_batch([
+                {"to": "bob", "body": str(i), "conv": conv_id}
+                for i in range(1, 121)
+            ])
+            inbox = await bob.get_inbox(timeout=0)
+            again = await bob.get_inbox(timeout=0)
+            await alice.close()
+            await bob.close()
+            return inbox, again
+
+        with HomeserverThread() as server:
+            inbox, again = asyncio.run(scenario(server.url))
+
+        assert [m.body for m in inbox[0].messages] == [str(i) for i in range(1, 121)]
+        assert again == []
+
+    def test_send_survives_rate_limits_and_lost_responses(self):
+        """Test throttled and retried sends arrive exactly once."""
+        async def scenario(server):
+            alice = VoxClient(Path(tempfile.mkdtemp()), scheduler=RequestScheduler(backoff_base=0.01))
+            bob = VoxClient(Path(tempfile.mkdtemp()))
+            await alice.initialize("alice", server.url)
+            await bob.initialize("bob", server.url)
+            alice.add_contact("bob", "vox_bob")
+            conv_id = await alice.send_message("bob", "hello bob")
+            await bob.get_inbox(timeout=0)
+            server.throttle["send"] = 2
+            server.lose_response["send"] = 1
+            await alice.send_message("bob", "second", conv_id)
+            inbox = await bob.get_inbox(timeout=0)
+            stats = dict(alice.scheduler.stats)
+            await alice.close()
+            await bob.close()
+            return inbox, stats
+
+        with HomeserverThread() as server:
+            inbox, stats = asyncio.run(scenario(server))
+
+        assert [m.body for m in inbox[0].messages] == ["second"]
+        assert stats["throttled"] == 2
+        assert stats["retries"] == 3
+
+    def test_file_round_trip_is_content_addressed(self):
+        """Test files upload once per content and download lazily, once."""
+        data = os.urandom(300 * 1024)
+        source = Path(tempfile.mkdtemp()) / "report.bin"
+        source.write_bytes(data)
+
+        async def scenario(server):
+            alice = VoxClient(Path(tempfile.mkdtemp()))
+            bob = VoxClient(Path(tempfile.mkdtemp()))
+            await alice.initialize("alice", server.url)
+            await bob.initialize("bob", server.url)
+            alice.add_contact("bob", "vox_bob")
+            conv_id = await alice.send_message("bob", "hello bob")
+            await bob.get_inbox(timeout=0)  # joins the invite
+            await alice.send_file("bob", source, conv_id, body="Q3 numbers")
+            await alice.send_file("bob", io.BytesIO(data), conv_id, filename="copy.bin")
+            inbox = await bob.get_inbox(timeout=0)
+            downloads = server.requests["download"]
+            first = await bob.download_file(inbox[0].messages[0].attachment.url)
+            second = await bob.download_file(inbox[0].messages[1].attachment.url)
+            await alice.close()
+            await bob.close()
+            return inbox, downloads, first, second
+
+        with HomeserverThread() as server:
+            inbox, downloads, first, second = asyncio.run(scenario(server))
+            uploads = server.requests["upload"]
+            fetched = server.requests["download"]
+
+        files = [m.attachment for m in inbox[0].messages]
+        assert [m.body for m in inbox[0].messages] == ["Q3 numbers", "copy.bin"]
+        assert [f.name for f in files] == ["report.bin", "copy.bin"]
+        assert files[0].url == files[1].url
+        assert files[0].size == len(data)
+        assert uploads == 1
+        assert (downloads, fetched) == (0, 1)
+        assert first == second
+        assert first.read_bytes() == data
+        assert first.name == hashlib.sha256(data).hexdigest()
+
+    def test_directory_round_trip(self):
+        """Test advertise/discover through the directory room on the fake server."""
+        async def scenario(url):
+            alice = VoxClient(Path(tempfile.mkdtemp()))
+            bob = VoxClient(Path(tempfile.mkdtemp()))
+            await alice.initialize("alice", url)
+            await bob.initialize("bob", url)
+            await alice.advertise("Translates legal documents")
+            first = await bob.discover_agents("transl")
+            await alice.advertise("Summarizes papers")
+            second = await bob.discover_agents("transl")
+            third = await bob.discover_agents("summ")
+            await alice.close()
+            await bob.close()
+            return first, second, third
+
+        with HomeserverThread() as server:
+            first, second, third = asyncio.run(scenario(server.url))
+
+        assert [a["vox_id"] for a in first] == ["vox_alice"]
+        assert second == []
+        assert [a["description"] for a in third] == ["Summarizes papers"]
+
+    def test_report_is_json_ready(self):
+        """Test a tiny run covers every benchmark and records the parameters."""
+        report = run(parse_args([
+            "--history-size", "20", "--contacts", "2", "--rooms", "2",
+            "--agents", "2", "--iterations", "2",
+        ]))
+
+        assert set(report["results"]) == set(BENCHMARKS)
+        assert report["params"]["history_size"] == 20
+        assert report["results"]["send"]["count"] == 2
+        assert report["server_requests"]["send"] > 0
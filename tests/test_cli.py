@@ -4,6 +4,8 @@ import pytest
 import tempfile
 import json
 import os
+import subprocess
+import sys
 from pathlib import Path
 from unittest.mock import patch, AsyncMock, MagicMock
 from click.testing import CliRunner
@@ -213,3 +215,181 @@ class TestCLI:
         result = self.runner.invoke(cli, ["--version"])
         assert result.exit_code == 0
         assert "0.1.0" in result.output
+    
+    @patch("vox.client.VoxClient.initialize")
+    @patch("vox.client.VoxClient.close")
+    def test_conversation_ndjson_page(self, mock_close, mock_init):
+        """Test vox conversation streams a page of local history as NDJSON."""
+        from vox.storage import Storage, Message
+        
+        with self.runner.isolated_filesystem():
+            vox_home = self._set_vox_home()
+            
+            async def side_effect(username=None, homeserver=None):
+                return _mock_initialize(username, homeserver)
+            
+            mock_init.side_effect = side_effect
+            mock_close.return_value = None
+            
+            self.runner.invoke(cli, ["init", "--username", "test_user"])
+            storage = Storage(Path(vox_home))
+            storage.save_messages("conv_abc", "alice", [
+                Message(
+                    from_vox_id="vox_alice",
+                    to_vox_id="vox_test_user",
+                    timestamp=f"2025-01-01T12:00:0{i}Z",
+                    conversation_id="conv_abc",
+                    body=f"m{i}",
+                    event_id=f"$e{i}",
+                )
+                for i in range(4)
+            ])
+            storage.close()
+            
+            result = self.runner.invoke(
+                cli, ["conversation", "conv_abc", "--ndjson", "--limit", "2", "--before", "$e3"]
+            )
+            assert result.exit_code == 0
+            lines = [json.loads(line) for line in result.output.splitlines()]
+            assert [line["body"] for line in lines] == ["m1", "m2"]
+            assert lines[0]["conversation_id"] == "conv_abc"
+    
+    @patch("vox.client.VoxClient.watch")
+    @patch("vox.client.VoxClient.close")
+    def test_watch_emits_ndjson(self, mock_close, mock_watch):
+        """Test vox watch prints one JSON object per incoming message."""
+        from vox.storage import Conversation, Message
+        
+        async def watch(from_contact=None):
+            yield Conversation(
+                conversation_id="conv_abc",
+                with_contact="alice",
+                messages=[
+                    Message(
+                        from_vox_id="vox_alice",
+                        to_vox_id="vox_test_user",
+                        timestamp=f"2025-01-01T12:00:0{i}Z",
+                        conversation_id="conv_abc",
+                        body=f"m{i}",
+                    )
+                    for i in range(2)
+                ],
+            )
+        
+        with self.runner.isolated_filesystem():
+            self._set_vox_home()
+            mock_watch.side_effect = watch
+            mock_close.return_value = None
+            
+            result = self.runner.invoke(cli, ["watch"])
+            assert result.exit_code == 0
+            lines = [json.loads(line) for line in result.output.splitlines()]
+            assert [line["body"] for line in lines] == ["m0", "m1"]
+            assert lines[0]["with"] == "alice"
+    
+    @patch("vox.client.VoxClient.send_batch")
+    @patch("vox.client.VoxClient.close")
+    def test_send_batch_reports_ndjson(self, mock_close, mock_batch):
+        """Test vox send-batch prints one result per record and flags bad lines."""
+        with self.runner.isolated_filesystem():
+            self._set_vox_home()
+            mock_batch.return_value = [
+                {"to": "alice", "ok": True, "conversation_id": "conv_1", "event_id": "$1"},
+                {"to": None, "ok": False, "error": "Record needs 'to' and 'body'"},
+            ]
+            mock_close.return_value = None
+            
+            result = self.runner.invoke(
+                cli, ["send-batch"], input='{"to": "alice", "body": "hi", "conv": "conv_1"}\nnot json\n'
+            )
+            assert result.exit_code == 1
+            lines = [json.loads(line) for line in result.output.splitlines()]
+            assert lines[0] == {"index": 0, "to": "alice", "ok": True, "conversation_id": "conv_1", "event_id": "$1"}
+            assert lines[1]["ok"] is False
+            assert lines[1]["error"].startswith("Invalid record")
+    
+    @patch("vox.client.VoxClient.send_file")
+    @patch("vox.client.VoxClient.close")
+    def test_send_file_from_stdin(self, mock_close, mock_send_file):
+        """Test vox send --file - streams stdin and needs a message or a file."""
+        with self.runner.isolated_filesystem():
+            self._set_vox_home()
+            sent = {}
+
+            async def side_effect(contact, source, conv=None, body=None):
+                sent.update(contact=contact, data=source.read(), body=body)
+                return "conv_1"
+
+            mock_send_file.side_effect = side_effect
+            mock_close.return_value = None
+
+            result = self.runner.invoke(
+                cli, ["send", "alice", "nightly dump", "--file", "-"], input=b"\x00\x01binary"
+            )
+            assert result.exit_code == 0
+            assert "✅ Sent file to alice (conv_1)" in result.output
+            assert sent == {"contact": "alice", "data": b"\x00\x01binary", "body": "nightly dump"}
+
+            result = self.runner.invoke(cli, ["send", "alice"])
+            assert result.exit_code == 2
+
+    def test_search_command(self):
+        """Test vox search returns ranked local matches as JSON."""
+        from vox.storage import Storage, Message
+        
+        with self.runner.isolated_filesystem():
+            vox_home = self._set_vox_home()
+            storage = Storage(Path(vox_home))
+            storage.save_messages("conv_abc", "analyst", [
+                Message(
+                    from_vox_id="vox_analyst",
+                    to_vox_id="vox_test_user",
+                    timestamp="2025-01-01T12:00:00Z",
+                    conversation_id="conv_abc",
+                    body="Q4 numbers look strong",
+                ),
+            ])
+            storage.close()
+            
+            result = self.runner.invoke(cli, ["search", "q4", "--contact", "analyst"])
+            assert result.exit_code == 0
+            hits = json.loads(result.output)
+            assert hits[0]["with"] == "analyst"
+            assert hits[0]["body"] == "Q4 numbers look strong"
+
+
+# Generous ceiling for importing vox.cli (it was ~0.7s with the Matrix stack)
+CLI_IMPORT_BUDGET_US = 250_000
+
+HEAVY_MODULES = {"aiohttp", "nio", "pydantic"}
+
+
+class TestStartup:
+    """Startup-cost regression tests for the quick commands."""
+
+    def _importtime(self, *argv):
+        """Run `python -X importtime -m vox ARGV`; return {module: cumulative µs}."""
+        vox_home = tempfile.mkdtemp()
+        Path(vox_home, "config.toml").write_text('vox_id = "vox_fast"\n')
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "vox", *argv],
+            env={**os.environ, "VOX_HOME": vox_home},
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+        modules = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, name = line[len("import time:"):].split("|")
+                if cumulative.strip().isdigit():
+                    modules[name.strip()] = int(cumulative)
+        return modules
+
+    @pytest.mark.parametrize("argv", [["whoami"], ["contact", "list"]])
+    def test_quick_commands_skip_network_stack(self, argv):
+        """Test whoami / contact list import neither aiohttp, nio nor pydantic."""
+        modules = self._importtime(*argv)
+
+        assert HEAVY_MODULES.isdisjoint(modules)
+        assert modules["vox.cli"] < CLI_IMPORT_BUDGET_US
@@ -0,0 +1,149 @@
+"""Tests for VoxClient."""
+
+import asyncio
+import tempfile
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from vox.client import VoxClient
+from vox.config import Config
+from vox.storage import Conversation, Message
+from vox.transport import create_session
+
+
+def _conversation(conversation_id, *bodies):
+    return Conversation(
+        conversation_id=conversation_id,
+        with_contact="alice",
+        messages=[
+            Message(
+                from_vox_id="vox_alice",
+                to_vox_id="vox_me",
+                timestamp=f"2025-01-01T12:00:0{i}Z",
+                conversation_id=conversation_id,
+                body=body,
+            )
+            for i, body in enumerate(bodies)
+        ],
+    )
+
+
+class TestVoxClient:
+    """Test cases for VoxClient (the Matrix backend is mocked out)."""
+
+    def setup_method(self):
+        """Set up a client with a mocked backend."""
+        self.client = VoxClient(Path(tempfile.mkdtemp()))
+        self.client.config = Config(vox_id="vox_me", access_token="tok")
+        self.backend = MagicMock()
+        self.backend.initialize = AsyncMock()
+        self.client.backend = self.backend
+
+    def test_inbox_passes_timeout(self):
+        """Test that a plain inbox call is a single sync with the given timeout."""
+        self.backend.get_inbox = AsyncMock(return_value=[])
+
+        assert asyncio.run(self.client.get_inbox(timeout=0)) == []
+        self.backend.get_inbox.assert_awaited_once_with(None, 0)
+
+    @patch("vox.client.MIN_SYNC_INTERVAL", 0)
+    def test_inbox_wait_until_min_messages(self):
+        """Test that --wait keeps syncing until enough messages arrive, then merges."""
+        self.backend.get_inbox = AsyncMock(side_effect=[
+            [_conversation("conv_a", "one")],
+            [],
+            [_conversation("conv_a", "two"), _conversation("conv_b", "three")],
+        ])
+
+        result = asyncio.run(self.client.get_inbox(wait=60, min_messages=3))
+
+        assert self.backend.get_inbox.await_count == 3
+        assert [c.conversation_id for c in result] == ["conv_a", "conv_b"]
+        assert [m.body for m in result[0].messages] == ["one", "two"]
+
+    def test_inbox_wait_deadline(self):
+        """Test that --wait returns what it has once the deadline passes."""
+        self.backend.get_inbox = AsyncMock(return_value=[])
+
+        assert asyncio.run(self.client.get_inbox(wait=0)) == []
+        self.backend.get_inbox.assert_awaited_once()
+
+    @patch("vox.client.MIN_SYNC_INTERVAL", 0)
+    def test_watch_yields_across_syncs(self):
+        """Test that watch keeps syncing and yields each new conversation."""
+        self.backend.get_inbox = AsyncMock(side_effect=[
+            [_conversation("conv_a", "one")],
+            [],
+            [_conversation("conv_b", "two")],
+        ])
+
+        async def collect():
+            seen = []
+            async for conv in self.client.watch():
+                seen.append(conv.conversation_id)
+                if len(seen) == 2:
+                    break
+            return seen
+
+        assert asyncio.run(collect()) == ["conv_a", "conv_b"]
+
+    def test_send_batch_maps_results(self):
+        """Test that batch results line up with records, including local errors."""
+        self.client.add_contact("bob", "vox_bob")
+        sent = Message(
+            from_vox_id="vox_me",
+            to_vox_id="vox_bob",
+            timestamp="2025-01-01T12:00:00Z",
+            conversation_id="conv_1",
+            body="hi",
+            event_id="$1",
+        )
+        self.backend.send_batch = AsyncMock(return_value=[sent, Exception("boom")])
+
+        results = asyncio.run(self.client.send_batch([
+            {"to": "bob", "body": "hi", "conv": "conv_1"},
+            {"to": "nobody", "body": "hi"},
+            {"to": "bob"},
+            {"to": "bob", "body": "again"},
+        ]))
+
+        self.backend.send_batch.assert_awaited_once_with(
+            [("vox_bob", "hi", "conv_1"), ("vox_bob", "again", None)], 8
+        )
+        assert results[0] == {"to": "bob", "ok": True, "conversation_id": "conv_1", "event_id": "$1"}
+        assert [r["ok"] for r in results] == [True, False, False, False]
+        assert "not found" in results[1]["error"]
+        assert results[3]["error"] == "boom"
+
+
+class TestVoxClientSession:
+    """Test cases for the shared HTTP connection pool."""
+
+    def setup_method(self):
+        """Set up a configured client without a backend."""
+        self.client = VoxClient(Path(tempfile.mkdtemp()))
+        self.client.config = Config(vox_id="vox_me", access_token="tok")
+
+    def test_backend_uses_client_pool(self):
+        """Test the Matrix backend shares the client's pool and close releases it."""
+        async def run():
+            backend = self.client._ensure_backend()
+            session = self.client._ensure_session()
+            assert backend.client.client_session is session
+            await self.client.close()
+            return session
+
+        assert asyncio.run(run()).closed
+
+    def test_caller_owned_pool_left_open(self):
+        """Test a pool passed in by the caller survives the client closing."""
+        async def run():
+            session = create_session(limit=4)
+            async with VoxClient(Path(tempfile.mkdtemp()), session=session) as client:
+                client.config = self.client.config
+                client._ensure_backend()
+            still_open = not session.closed
+            await session.close()
+            return still_open
+
+        assert asyncio.run(run())
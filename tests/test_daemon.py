@@ -0,0 +1,92 @@
+"""Tests for the Vox daemon."""
+
+import asyncio
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from vox import daemon
+from vox.client import VoxClient
+from vox.config import Config
+from vox.storage import Conversation, Message
+
+
+class TestDaemon:
+    """Test cases for the daemon socket API."""
+
+    def setup_method(self):
+        """Start a daemon with a stubbed Matrix backend on a background thread."""
+        self.vox_home = Path(tempfile.mkdtemp())
+        client = VoxClient(self.vox_home)
+        client.config = Config(vox_id="vox_daemon_test", access_token="tok")
+
+        conv = Conversation(
+            conversation_id="conv_abc",
+            with_contact="alice",
+            messages=[Message(
+                from_vox_id="vox_alice",
+                to_vox_id="vox_daemon_test",
+                timestamp="2025-01-01T12:00:00Z",
+                conversation_id="conv_abc",
+                body="hello",
+            )],
+        )
+        synced = []
+
+        async def get_inbox(from_contact=None, timeout=30.0):
+            if not synced:
+                synced.append(conv)
+                return [conv]
+            await asyncio.sleep(3600)
+
+        backend = MagicMock()
+        backend.initialize = AsyncMock()
+        backend.get_inbox = get_inbox
+        backend.close = AsyncMock()
+        client.backend = backend
+        client.send_message = AsyncMock(return_value="conv_sent")
+
+        self.server = daemon.VoxDaemon(client)
+        self.thread = threading.Thread(target=asyncio.run, args=(self.server.run(),))
+        self.thread.start()
+        for _ in range(100):
+            if self.server.socket_path.exists():
+                break
+            time.sleep(0.02)
+
+    def teardown_method(self):
+        """Shut the daemon down."""
+        if self.server.socket_path.exists():
+            daemon.call("shutdown", self.vox_home)
+        self.thread.join(timeout=5)
+
+    def test_serves_commands(self):
+        """Test send, inbox draining and ping over the socket."""
+        assert daemon.call("ping", self.vox_home)["vox_id"] == "vox_daemon_test"
+        assert daemon.call("send", self.vox_home, contact="alice", message="hi") == "conv_sent"
+
+        inbox = []
+        for _ in range(50):
+            inbox = daemon.call("inbox", self.vox_home, from_contact=None)
+            if inbox:
+                break
+            time.sleep(0.02)
+        assert [c["conversation_id"] for c in inbox] == ["conv_abc"]
+        assert daemon.call("inbox", self.vox_home, from_contact=None) == []
+
+    def test_errors_are_reraised(self):
+        """Test that daemon-side errors come back as the same exception type."""
+        with pytest.raises(ValueError):
+            daemon.call("no_such_command", self.vox_home)
+
+    def test_unavailable_after_shutdown(self):
+        """Test that callers fall back once the daemon has stopped."""
+        daemon.call("shutdown", self.vox_home)
+        self.thread.join(timeout=5)
+        assert not self.server.socket_path.exists()
+        with pytest.raises(daemon.DaemonUnavailable):
+            daemon.call("ping", self.vox_home)
@@ -0,0 +1,410 @@
+"""Tests for the Matrix backend."""
+
+import asyncio
+import tempfile
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from vox.config import Config
+from nio import (
+    JoinError,
+    JoinResponse,
+    RoomCreateResponse,
+    RoomMessagesError,
+    RoomMessagesResponse,
+    RoomMessageText,
+    RoomPutStateResponse,
+    RoomResolveAliasError,
+    RoomSendError,
+    RoomSendResponse,
+    SyncResponse,
+    UploadFilterResponse,
+)
+from nio.responses import RoomInfo, Rooms, Timeline
+
+from vox.matrix_backend import AGENT_EVENT_TYPE, BACKFILL_MAX_ERRORS, MatrixBackend
+from vox.storage import Storage
+
+
+class TestMatrixBackend:
+    """Test cases for MatrixBackend (the nio client is mocked out)."""
+
+    def setup_method(self):
+        """Set up a backend with a mocked nio client."""
+        self.storage = Storage(Path(tempfile.mkdtemp()))
+        self.config = Config(
+            vox_id="vox_me",
+            homeserver="https://matrix.example.org",
+            access_token="tok",
+            user_id="@vox_me:matrix.example.org",
+        )
+        self.backend = MatrixBackend(self.config, self.storage)
+        self.backend.client = MagicMock()
+        self.backend.client.sync = AsyncMock()
+        self.backend.client.room_send = AsyncMock(
+            return_value=RoomSendResponse("$sent", "!room:matrix.example.org")
+        )
+        self.backend.client.upload_filter = AsyncMock(
+            return_value=UploadFilterResponse(filter_id="f1")
+        )
+
+    def test_send_does_not_sync(self):
+        """Test that initialize + send with a cached room never syncs."""
+        self.storage.set_room("vox_bob", "!room:matrix.example.org")
+
+        async def run():
+            await self.backend.initialize()
+            return await self.backend.send_message("vox_bob", "hi", "conv_1")
+
+        assert asyncio.run(run()) == "conv_1"
+        self.backend.client.sync.assert_not_called()
+        self.backend.client.room_send.assert_awaited_once()
+        assert self.storage.get_conversation_room("conv_1") == ("!room:matrix.example.org", None)
+
+    def test_send_fails_when_room_cannot_be_created(self):
+        """Test a failed room creation raises instead of sending into a fake room."""
+        self.backend.client.room_resolve_alias = AsyncMock(return_value=RoomResolveAliasError("not found"))
+        self.backend.client.room_create = AsyncMock(side_effect=Exception("M_LIMIT_EXCEEDED"))
+
+        with pytest.raises(Exception, match="Room creation failed"):
+            asyncio.run(self.backend.send_message("vox_bob", "hi"))
+
+        self.backend.client.room_send.assert_not_called()
+        assert self.storage.get_room("vox_bob") is None
+
+    def test_inbox_sync_resumes_from_stored_token(self):
+        """Test that inbox syncs from the stored token with the inbox filter."""
+        self.storage.set_sync_token("s123")
+        self.backend.client.sync.return_value = MagicMock(
+            rooms=MagicMock(invite={}, join={}), next_batch="s124"
+        )
+
+        asyncio.run(self.backend.get_inbox())
+
+        kwargs = self.backend.client.sync.call_args.kwargs
+        assert kwargs["since"] == "s123"
+        assert kwargs["sync_filter"] == "f1"
+        assert self.storage.get_sync_token() == "s124"
+
+    def test_inbox_filter_uploaded_once(self):
+        """Test that the filter ID is cached and reused across syncs and instances."""
+        self.backend.client.sync.return_value = MagicMock(
+            rooms=MagicMock(invite={}, join={}), next_batch="s1"
+        )
+        asyncio.run(self.backend.get_inbox())
+
+        other = MatrixBackend(self.config, self.storage)
+        other.client = self.backend.client
+        asyncio.run(other.get_inbox())
+
+        self.backend.client.upload_filter.assert_awaited_once()
+        assert self.backend.client.sync.call_args.kwargs["sync_filter"] == "f1"
+
+    def test_send_batch_resolves_rooms_once_and_reports_errors(self):
+        """Test batch send: one room lookup per recipient, per-item errors, one flush."""
+        self.storage.add_contact("bob", "vox_bob")
+        self.backend._get_or_create_room = AsyncMock(side_effect=lambda to, new_rooms=None: f"!{to}:x")
+        self.backend.client.room_send = AsyncMock(side_effect=[
+            RoomSendResponse("$1", "!vox_bob:x"),
+            RoomSendError("rate limited"),
+            RoomSendResponse("$3", "!vox_carol:x"),
+        ])
+
+        results = asyncio.run(self.backend.send_batch([
+            ("vox_bob", "one", "conv_1"),
+            ("vox_bob", "two", "conv_1"),
+            ("vox_carol", "three", "conv_2"),
+        ], concurrency=1))
+
+        assert self.backend._get_or_create_room.await_count == 2
+        assert results[0].event_id == "$1"
+        assert isinstance(results[1], Exception)
+        assert results[2].event_id == "$3"
+        history = self.storage.get_history("conv_1")
+        assert history.with_contact == "bob"
+        assert [m.body for m in history.messages] == ["one"]
+
+    def test_send_batch_writes_new_rooms_once(self):
+        """Test rooms created for a batch are saved in one write, not one per recipient."""
+        self.backend.client.room_resolve_alias = AsyncMock(return_value=RoomResolveAliasError("not found"))
+        self.backend.client.room_create = AsyncMock(side_effect=[
+            RoomCreateResponse(f"!{n}:x") for n in ("bob", "carol", "dave")
+        ])
+        self.backend.client.room_invite = AsyncMock()
+        self.storage.set_room = MagicMock(wraps=self.storage.set_room)
+        self.storage.set_rooms = MagicMock(wraps=self.storage.set_rooms)
+
+        asyncio.run(self.backend.send_batch(
+            [(to, "hi", None) for to in ("vox_bob", "vox_carol", "vox_dave")], concurrency=1
+        ))
+
+        self.storage.set_room.assert_not_called()
+        self.storage.set_rooms.assert_called_once_with(
+            {"vox_bob": "!bob:x", "vox_carol": "!carol:x", "vox_dave": "!dave:x"}
+        )
+
+    def test_invites_joined_concurrently_with_limit(self, capsys):
+        """Test invites join in parallel up to the limit, failures are isolated."""
+        self.backend.join_concurrency = 2
+        in_flight = []
+        peak = []
+
+        async def join(room_id):
+            in_flight.append(room_id)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(room_id)
+            if room_id == "!bad:x":
+                return JoinError("forbidden")
+            return JoinResponse(room_id)
+
+        def invite(sender):
+            return MagicMock(invite_state=[MagicMock(sender=sender)])
+
+        self.backend.client.join = join
+        self.storage.set_rooms = MagicMock(wraps=self.storage.set_rooms)
+        invites = {
+            "!a:x": invite("@vox_a:x"),
+            "!bad:x": invite("@vox_bad:x"),
+            "!c:x": invite("@vox_c:x"),
+        }
+
+        asyncio.run(self.backend._join_invites(invites))
+
+        assert max(peak) == 2
+        assert self.backend.join_failures == {"!bad:x": "forbidden"}
+        self.storage.set_rooms.assert_called_once_with({"@vox_a:x": "!a:x", "@vox_c:x": "!c:x"})
+        # Progress goes to stderr so JSON output on stdout stays parseable
+        out, err = capsys.readouterr()
+        assert out == ""
+        assert "Auto-join failed for !bad:x" in err
+
+    def _text(self, n):
+        return RoomMessageText.from_dict({
+            "type": "m.room.message",
+            "event_id": f"$e{n}",
+            "sender": "@vox_bob:x",
+            "origin_server_ts": n,
+            "content": {
+                "msgtype": "m.text",
+                "body": f"m{n}",
+                "vox": {"conversation_id": "conv_1", "from": "vox_bob", "to": "vox_alice"},
+            },
+        })
+
+    def _limited_sync(self, next_batch, events):
+        room = RoomInfo(Timeline(events, True, "p1"), [], [], [])
+        return SyncResponse(
+            next_batch, Rooms({}, {"!room:x": room}, {}), MagicMock(), MagicMock(), [], []
+        )
+
+    def test_limited_timeline_backfilled_in_order(self):
+        """Test a limited timeline is backfilled from prev_batch back to the sync token."""
+        self.storage.set_sync_token("s1")
+        self.backend.client.sync.return_value = self._limited_sync("s2", [self._text(5)])
+        self.backend.client.room_messages = AsyncMock(side_effect=[
+            RoomMessagesResponse("!room:x", [self._text(4), self._text(3)], "p1", "p2"),
+            RoomMessagesResponse("!room:x", [self._text(2)], "p2", None),
+        ])
+
+        inbox = asyncio.run(self.backend.get_inbox())
+
+        assert [m.body for m in inbox[0].messages] == ["m2", "m3", "m4", "m5"]
+        calls = self.backend.client.room_messages.call_args_list
+        assert [c.kwargs["start"] for c in calls] == ["p1", "p2"]
+        assert all(c.kwargs["end"] == "s1" for c in calls)
+        assert self.storage.get_sync_token() == "s2"
+        assert self.storage.get_conversation_room("conv_1") == ("!room:x", "s2")
+
+    def test_inbox_groups_room_timeline_by_conversation(self):
+        """Test each thread in a room is saved and returned as its own conversation."""
+        events = [self._text(1), self._text(2), self._text(3)]
+        events[1].source["content"]["vox"]["conversation_id"] = "conv_2"
+        room = RoomInfo(Timeline(events, False, None), [], [], [])
+        self.backend.client.sync.return_value = SyncResponse(
+            "s2", Rooms({}, {"!room:x": room}, {}), MagicMock(), MagicMock(), [], []
+        )
+        self.storage.save_message_groups = MagicMock(wraps=self.storage.save_message_groups)
+
+        inbox = asyncio.run(self.backend.get_inbox())
+
+        assert {c.conversation_id: [m.body for m in c.messages] for c in inbox} == {
+            "conv_1": ["m1", "m3"], "conv_2": ["m2"],
+        }
+        self.storage.save_message_groups.assert_called_once()
+        assert [m.body for m in self.storage.get_history("conv_2").messages] == ["m2"]
+        assert self.storage.get_conversation_room("conv_2") == ("!room:x", "s2")
+
+    def test_conversation_miss_pages_indexed_room_only(self):
+        """Test a history miss pages the conversation's room instead of syncing."""
+        self.storage.index_conversations({"conv_1": "!room:x"}, "s9")
+        other = self._text(4)
+        other.source["content"]["vox"]["conversation_id"] = "conv_2"
+        self.backend.client.room_messages = AsyncMock(side_effect=[
+            RoomMessagesResponse("!room:x", [self._text(5), other], "s9", "p1"),
+            RoomMessagesResponse("!room:x", [self._text(3)], "p1", None),
+        ])
+
+        conv = asyncio.run(self.backend.get_conversation("conv_1"))
+
+        assert [m.body for m in conv.messages] == ["m3", "m5"]
+        calls = self.backend.client.room_messages.call_args_list
+        assert [(c.args[0], c.kwargs["start"]) for c in calls] == [("!room:x", "s9"), ("!room:x", "p1")]
+        self.backend.client.sync.assert_not_called()
+
+    def test_conversation_miss_pages_contact_room_only(self):
+        """Test an unindexed conversation is fetched from the contact's room, and nowhere else."""
+        self.storage.set_rooms({"vox_bob": "!room:x", "vox_carol": "!other:x"})
+        other = self._text(4)
+        other.source["content"]["vox"]["conversation_id"] = "conv_2"
+        self.backend.client.room_messages = AsyncMock(return_value=RoomMessagesResponse(
+            "!room:x", [self._text(5), other, self._text(3)], None, None,
+        ))
+
+        conv = asyncio.run(self.backend.get_conversation("conv_1", contact="vox_bob"))
+
+        assert [m.body for m in conv.messages] == ["m3", "m5"]
+        self.backend.client.room_messages.assert_awaited_once()
+        assert self.backend.client.room_messages.call_args.args[0] == "!room:x"
+        assert self.storage.get_conversation_room("conv_1") == ("!room:x", None)
+        self.backend.client.sync.assert_not_called()
+
+        assert asyncio.run(self.backend.get_conversation("conv_unknown")) is None
+        self.backend.client.room_messages.assert_awaited_once()
+
+    def _room_sync(self, next_batch, events=(), limited=False, prev_batch=None):
+        rooms = {}
+        if events:
+            rooms["!room:x"] = RoomInfo(Timeline(list(events), limited, prev_batch), [], [], [])
+        return SyncResponse(next_batch, Rooms({}, rooms, {}), MagicMock(), MagicMock(), [], [])
+
+    def test_backfill_gap_larger_than_cap_spans_syncs(self):
+        """Test a gap beyond the page cap is delivered in parts, resuming where it stopped."""
+        self.storage.set_sync_token("s1")
+        self.backend.client.sync.side_effect = [
+            self._room_sync("s2", [self._text(4)], limited=True, prev_batch="p3"),
+            self._room_sync("s3", [self._text(5)], prev_batch="p4"),
+        ]
+
+        async def room_messages(room_id, start, end, **kwargs):
+            assert end == "s1"
+            n = int(start[1:])
+            return RoomMessagesResponse(room_id, [self._text(n)], start, f"p{n - 1}" if n > 1 else None)
+
+        self.backend.client.room_messages = room_messages
+
+        with patch("vox.matrix_backend.BACKFILL_MAX_PAGES", 2):
+            first = asyncio.run(self.backend.get_inbox())
+            assert self.storage.get_backfill_gaps() == {
+                "!room:x": [{"start": "p1", "end": "s1", "errors": 0}]
+            }
+            second = asyncio.run(self.backend.get_inbox())
+
+        assert [m.body for m in first[0].messages] == ["m2", "m3", "m4"]
+        assert [m.body for m in second[0].messages] == ["m1", "m5"]
+        assert self.storage.get_backfill_gaps() == {}
+        assert self.storage.get_sync_token() == "s3"
+
+    def test_failed_backfill_delivers_timeline_and_gives_up(self):
+        """Test a gap that keeps failing is retried a bounded number of times."""
+        self.storage.set_sync_token("s1")
+        self.backend.client.sync.side_effect = [
+            self._room_sync("s2", [self._text(5)], limited=True, prev_batch="p1"),
+            self._room_sync("s3"),
+            self._room_sync("s4"),
+            self._room_sync("s5"),
+        ]
+        self.backend.client.room_messages = AsyncMock(return_value=RoomMessagesError("forbidden"))
+
+        inbox = asyncio.run(self.backend.get_inbox())
+        assert [m.body for m in inbox[0].messages] == ["m5"]
+        assert self.storage.get_backfill_gaps() == {
+            "!room:x": [{"start": "p1", "end": "s1", "errors": 1}]
+        }
+        for _ in range(3):
+            asyncio.run(self.backend.get_inbox())
+
+        assert self.storage.get_backfill_gaps() == {}
+        assert self.backend.client.room_messages.await_count == BACKFILL_MAX_ERRORS
+        assert self.storage.get_sync_token() == "s5"
+
+    def _directory_sync(self, next_batch, state=(), timeline=()):
+        def listing(user_id, content):
+            return MagicMock(source={
+                "type": AGENT_EVENT_TYPE, "state_key": user_id, "content": content,
+            })
+
+        room = RoomInfo(
+            timeline=Timeline([listing(*e) for e in timeline], False, None),
+            state=[listing(*e) for e in state],
+            ephemeral=[],
+            account_data=[],
+        )
+        return SyncResponse(
+            next_batch, Rooms({}, {"!dir:x": room}, {}), MagicMock(), MagicMock(), [], []
+        )
+
+    def test_advertise_creates_directory_and_lists_self(self):
+        """Test advertise creates the directory room once and writes our listing."""
+        self.backend.client.room_resolve_alias = AsyncMock(return_value=RoomResolveAliasError("not found"))
+        self.backend.client.room_create = AsyncMock(return_value=RoomCreateResponse("!dir:x"))
+        self.backend.client.join = AsyncMock(return_value=JoinResponse("!dir:x"))
+        self.backend.client.room_put_state = AsyncMock(return_value=RoomPutStateResponse("$s", "!dir:x"))
+
+        asyncio.run(self.backend.advertise_agent("Summarizes papers"))
+        asyncio.run(self.backend.advertise_agent("Summarizes papers and reports"))
+
+        self.backend.client.room_create.assert_awaited_once()
+        args = self.backend.client.room_put_state.call_args
+        assert args.args[:2] == ("!dir:x", AGENT_EVENT_TYPE)
+        assert args.kwargs["state_key"] == "@vox_me:matrix.example.org"
+        assert [e.description for e in self.storage.search_directory("report")] == [
+            "Summarizes papers and reports"
+        ]
+
+    def test_discover_refreshes_snapshot_incrementally(self):
+        """Test discover syncs only directory changes since the last refresh."""
+        self.storage.set_room("#vox-directory:matrix.example.org", "!dir:x")
+        self.backend.client.sync = AsyncMock(side_effect=[
+            self._directory_sync("d1", state=[
+                ("@vox_a:x", {"vox_id": "vox_a", "description": "Translates documents"}),
+                ("@vox_b:x", {"vox_id": "vox_b", "description": "Books travel"}),
+            ]),
+            self._directory_sync("d2", timeline=[
+                ("@vox_b:x", {}),
+                ("@vox_c:x", {"vox_id": "vox_c", "description": "Translation memory"}),
+            ]),
+        ])
+
+        assert [a["vox_id"] for a in asyncio.run(self.backend.discover_agents("book"))] == ["vox_b"]
+        found = asyncio.run(self.backend.discover_agents("transl"))
+
+        assert sorted(a["vox_id"] for a in found) == ["vox_a", "vox_c"]
+        assert asyncio.run(self.backend.discover_agents("book")) == []
+        since = [c.kwargs["since"] for c in self.backend.client.sync.call_args_list]
+        assert since[:2] == [None, "d1"]
+        assert self.storage.get_sync_token() is None
+
+    def test_first_directory_refresh_is_full_after_inbox_sync(self):
+        """Test the first refresh ignores, and keeps, the client's inbox token."""
+        backend = MatrixBackend(self.config, self.storage)
+        backend.client.next_batch = "inbox_tok"
+        self.storage.set_room("#vox-directory:matrix.example.org", "!dir:x")
+        paths = []
+
+        async def send(response_class, method, path, *args, **kwargs):
+            paths.append(path)
+            backend.client.next_batch = "d1"  # nio advances the token on every sync
+            return self._directory_sync("d1", state=[
+                ("@vox_a:x", {"vox_id": "vox_a", "description": "Translates documents"}),
+            ])
+
+        backend.client._send = send
+        found = asyncio.run(backend.discover_agents("transl"))
+
+        assert [a["vox_id"] for a in found] == ["vox_a"]
+        assert "since=" not in paths[0]
+        assert backend.client.next_batch == "inbox_tok"
+        assert self.storage.get_directory_sync_token() == "d1"
@@ -0,0 +1,119 @@
+"""Tests for VoxPool."""
+
+import asyncio
+import contextlib
+import os
+import tempfile
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from nio import SyncError, UploadFilterResponse
+
+from vox.config import Config
+from vox.pool import VoxPool
+from vox.storage import Conversation, Message
+
+
+def _identity(vox_id):
+    """Create an initialized Vox home for vox_id."""
+    vox_home = Path(tempfile.mkdtemp())
+    Config(vox_id=vox_id, access_token="tok").save(vox_home / "config.toml")
+    return vox_home
+
+
+def _conversation(vox_id):
+    return Conversation(
+        conversation_id=f"conv_{vox_id}",
+        with_contact="alice",
+        messages=[Message(
+            from_vox_id="vox_alice",
+            to_vox_id=vox_id,
+            timestamp="2025-01-01T12:00:00Z",
+            conversation_id=f"conv_{vox_id}",
+            body="hello",
+        )],
+    )
+
+
+class TestVoxPool:
+    """Test cases for VoxPool (Matrix backends are mocked out)."""
+
+    def setup_method(self):
+        """Create two initialized identities."""
+        self.homes = [_identity("vox_one"), _identity("vox_two")]
+
+    @patch.dict(os.environ, {"VOX_HOME": tempfile.mkdtemp()})
+    def test_identities_use_explicit_homes(self):
+        """Test each client reads its own home, not $VOX_HOME, and shares the pool."""
+        async def run():
+            async with VoxPool() as pool:
+                clients = [pool.add(home) for home in self.homes]
+                assert pool.add(self.homes[0]) is clients[0]
+                sessions = {c._ensure_session() for c in clients}
+                return [c.whoami() for c in clients], len(sessions)
+
+        assert asyncio.run(run()) == (["vox_one", "vox_two"], 1)
+
+    def test_watch_shares_sync_workers(self):
+        """Test a few workers sync every identity and tag results by client."""
+        in_flight = []
+        peak = []
+
+        def backend_for(vox_id):
+            synced = []
+
+            async def get_inbox(from_contact=None, timeout=30.0):
+                in_flight.append(vox_id)
+                peak.append(len(in_flight))
+                await asyncio.sleep(0.01)
+                in_flight.remove(vox_id)
+                if synced:
+                    return []
+                synced.append(vox_id)
+                return [_conversation(vox_id)]
+
+            backend = MagicMock()
+            backend.initialize = AsyncMock()
+            backend.get_inbox = get_inbox
+            backend.close = AsyncMock()
+            return backend
+
+        async def run():
+            async with VoxPool(sync_concurrency=2, poll_interval=0) as pool:
+                homes = self.homes + [_identity("vox_three")]
+                for home in homes:
+                    client = pool.add(home)
+                    client.backend = backend_for(client.whoami())
+                seen = []
+                async for client, conv in pool.watch():
+                    seen.append((client.whoami(), conv.conversation_id))
+                    if len(seen) == 3:
+                        break
+                return sorted(seen)
+
+        assert asyncio.run(run()) == [
+            ("vox_one", "conv_vox_one"),
+            ("vox_three", "conv_vox_three"),
+            ("vox_two", "conv_vox_two"),
+        ]
+        assert max(peak) == 2
+
+    def test_failed_sync_recorded_per_identity(self):
+        """Test a sync the homeserver rejects lands in sync_errors for that identity."""
+        async def run():
+            async with VoxPool(poll_interval=0) as pool:
+                client = pool.add(self.homes[0])
+                backend = client._ensure_backend()
+                backend.client.sync = AsyncMock(return_value=SyncError("Unknown token"))
+                backend.client.upload_filter = AsyncMock(
+                    return_value=UploadFilterResponse(filter_id="f1")
+                )
+                watch = pool.watch()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(watch.__anext__(), 0.2)
+                await watch.aclose()
+                return dict(pool.sync_errors), client.storage.get_sync_token()
+
+        errors, token = asyncio.run(run())
+        assert errors == {self.homes[0]: "Sync failed: Unknown token"}
+        assert token is None
@@ -0,0 +1,76 @@
+"""Tests for the request scheduler."""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import aiohttp
+import pytest
+
+from vox.scheduler import RequestScheduler
+
+
+def _response(status, body=None):
+    response = MagicMock(status=status, headers={})
+    response.json = AsyncMock(return_value=body or {})
+    return response
+
+
+class TestRequestScheduler:
+    """Test cases for RequestScheduler (the HTTP layer is mocked out)."""
+
+    def test_paces_requests_per_homeserver(self):
+        """Test requests beyond the burst wait for tokens, per homeserver."""
+        scheduler = RequestScheduler(rate=20, burst=1)
+        send = AsyncMock(return_value=_response(200))
+
+        async def run():
+            started = time.monotonic()
+            await asyncio.gather(*(scheduler.request("https://a", send) for _ in range(5)))
+            paced = time.monotonic() - started
+            started = time.monotonic()
+            await scheduler.request("https://b", send)
+            return paced, time.monotonic() - started
+
+        paced, other = asyncio.run(run())
+
+        assert paced >= 0.18
+        assert other < 0.05
+        assert scheduler.stats["paced"] == 4
+        assert scheduler.stats["requests"] == 6
+
+    def test_honors_retry_after_ms(self):
+        """Test a 429 waits retry_after_ms and retries, counting the throttle."""
+        scheduler = RequestScheduler(rate=0, backoff_base=0.01)
+        limited = _response(429, {"errcode": "M_LIMIT_EXCEEDED", "retry_after_ms": 100})
+        send = AsyncMock(side_effect=[limited, _response(200)])
+
+        async def run():
+            started = time.monotonic()
+            response = await scheduler.request("https://a", send, idempotent=False)
+            return response, time.monotonic() - started
+
+        response, elapsed = asyncio.run(run())
+
+        assert response.status == 200
+        assert elapsed >= 0.1
+        limited.release.assert_called_once()
+        assert scheduler.stats["throttled"] == 1
+        assert scheduler.stats["retries"] == 1
+
+    def test_transient_errors_retried_only_when_idempotent(self):
+        """Test connection errors and 5xx are retried for idempotent requests only."""
+        scheduler = RequestScheduler(rate=0, max_retries=2, backoff_base=0.01)
+        error = aiohttp.ClientConnectionError("reset")
+
+        send = AsyncMock(side_effect=[error, _response(502), _response(200)])
+        assert asyncio.run(scheduler.request("https://a", send)).status == 200
+
+        send = AsyncMock(side_effect=[error, _response(200)])
+        with pytest.raises(aiohttp.ClientConnectionError):
+            asyncio.run(scheduler.request("https://a", send, idempotent=False))
+
+        send = AsyncMock(return_value=_response(503))
+        assert asyncio.run(scheduler.request("https://a", send)).status == 503
+        assert send.await_count == 3
+        assert scheduler.stats["retries"] == 4
@@ -2,8 +2,11 @@
 
 import pytest
 import tempfile
+import threading
+import toml
+from unittest.mock import patch
 from pathlib import Path
-from vox.storage import Storage, Contact, Message, Conversation
+from vox.storage import Attachment, Storage, Contact, DirectoryEntry, Message, Conversation
 
 
 class TestStorage:
@@ -60,7 +63,20 @@ class TestStorage:
         self.storage.clear_sync_token()
         token = self.storage.get_sync_token()
         assert token is None
-    
+
+    def test_backfill_gaps(self):
+        """Test gaps awaiting a backfill are stored and replaced as a set."""
+        gaps = {
+            "!a:x": [{"start": "p1", "end": "s1", "errors": 0}, {"start": "p7", "end": "s5", "errors": 2}],
+            "!b:x": [{"start": "p3", "end": "s2", "errors": 1}],
+        }
+        assert self.storage.get_backfill_gaps() == {}
+        self.storage.set_backfill_gaps(gaps)
+        assert self.storage.get_backfill_gaps() == gaps
+        self.storage.set_backfill_gaps({})
+        assert self.storage.get_backfill_gaps() == {}
+        assert not self.storage.backfill_gaps_file.exists()
+
     def test_message_models(self):
         """Test message and conversation models."""
         message = Message(
@@ -85,3 +101,275 @@ class TestStorage:
         assert conversation.with_contact == "user2"
         assert len(conversation.messages) == 1
         assert conversation.messages[0].body == "Hello, world!"
+
+    def _message(self, body, timestamp, event_id=None, conversation_id="conv_abc123"):
+        return Message(
+            from_vox_id="vox_user1",
+            to_vox_id="vox_user2",
+            timestamp=timestamp,
+            conversation_id=conversation_id,
+            body=body,
+            event_id=event_id,
+        )
+
+    def test_save_messages_dedupes_on_event_id(self):
+        """Test that re-saving an event is a no-op while distinct events are kept."""
+        first = self._message("hi", "2025-01-01T12:00:00Z", event_id="$a")
+        repeat = self._message("hi", "2025-01-01T12:00:00Z", event_id="$b")
+        self.storage.save_messages("conv_abc123", "user2", [first, repeat])
+        self.storage.save_messages("conv_abc123", "user2", [first])
+
+        history = self.storage.get_history("conv_abc123")
+        assert [m.event_id for m in history.messages] == ["$a", "$b"]
+
+    def test_get_history_orders_by_timestamp(self):
+        """Test that history comes back in timestamp order."""
+        self.storage.save_messages("conv_abc123", "user2", [
+            self._message("second", "2025-01-01T12:00:02Z"),
+            self._message("first", "2025-01-01T12:00:01Z"),
+        ])
+        self.storage.save_messages("conv_other", "user3", [
+            self._message("elsewhere", "2025-01-01T12:00:00Z", conversation_id="conv_other"),
+        ])
+
+        history = self.storage.get_history("conv_abc123")
+        assert history.with_contact == "user2"
+        assert [m.body for m in history.messages] == ["first", "second"]
+        assert self.storage.get_history("conv_missing") is None
+        assert len(self.storage.get_all_conversations()) == 2
+
+    def test_migrates_legacy_history_toml(self):
+        """Test that an existing history.toml is imported on first use."""
+        vox_home = Path(tempfile.mkdtemp())
+        legacy = {"conversations": {"conv_old": {"with_contact": "alice", "messages": [
+            self._message("old", "2024-05-01T00:00:00Z", conversation_id="conv_old").model_dump(
+                exclude={"event_id"}
+            ),
+        ]}}}
+        with open(vox_home / "history.toml", "w") as f:
+            toml.dump(legacy, f)
+
+        storage = Storage(vox_home)
+        history = storage.get_history("conv_old")
+        assert history.with_contact == "alice"
+        assert [m.body for m in history.messages] == ["old"]
+        assert not (vox_home / "history.toml").exists()
+        assert (vox_home / "history.toml.migrated").exists()
+
+    def test_iter_history_pagination(self):
+        """Test limit and before/after cursors over timestamps and event IDs."""
+        self.storage.save_messages("conv_abc123", "user2", [
+            self._message(f"m{i}", f"2025-01-01T12:00:0{i}Z", event_id=f"$e{i}")
+            for i in range(6)
+        ])
+
+        def page(**kwargs):
+            return [m.body for m in self.storage.iter_history("conv_abc123", **kwargs)]
+
+        assert page(limit=2) == ["m4", "m5"]
+        assert page(limit=2, before="$e4") == ["m2", "m3"]
+        assert page(limit=2, after="$e1") == ["m2", "m3"]
+        assert page(after="2025-01-01T12:00:03Z") == ["m4", "m5"]
+        assert page(after="$e1", before="$e4") == ["m2", "m3"]
+        with pytest.raises(ValueError):
+            page(before="$missing")
+
+    def test_find_contact_name_normalizes_ids(self):
+        """Test reverse lookup across bare and full Matrix IDs."""
+        self.storage.add_contact("alice", "vox_alice")
+        self.storage.add_contact("bob", "@vox_bob:example.org")
+
+        assert self.storage.find_contact_name("vox_alice") == "alice"
+        assert self.storage.find_contact_name("@vox_alice:example.org", "example.org") == "alice"
+        assert self.storage.find_contact_name("vox_bob", "example.org") == "bob"
+        assert self.storage.find_contact_name("vox_bob", "other.org") is None
+        assert self.storage.find_contact_name("vox_carol", "example.org") is None
+
+        self.storage.remove_contact("alice")
+        assert self.storage.find_contact_name("vox_alice") is None
+
+    def test_contacts_cache_sees_external_writes(self):
+        """Test that edits to contacts.toml by another process invalidate the cache."""
+        self.storage.add_contact("alice", "vox_alice")
+        assert self.storage.get_contact("alice") == "vox_alice"
+
+        other = Storage(Path(self.temp_dir))
+        other.add_contact("bob", "vox_bob_with_a_longer_id")
+
+        assert self.storage.get_contact("bob") == "vox_bob_with_a_longer_id"
+        assert self.storage.find_contact_name("vox_bob_with_a_longer_id") == "bob"
+
+    def test_set_rooms_single_atomic_write(self):
+        """Test bulk room mappings land in one write and are served from cache."""
+        self.storage.set_room("vox_a", "!a:x")
+        self.storage.set_rooms({"vox_b": "!b:x", "vox_c": "!c:x"})
+
+        assert self.storage.get_room("vox_a") == "!a:x"
+        assert self.storage.get_room("vox_c") == "!c:x"
+        assert Storage(Path(self.temp_dir)).get_room("vox_b") == "!b:x"
+        assert not list(Path(self.temp_dir).glob(".rooms.toml.*"))
+
+        with patch("vox.storage._atomic_write_toml") as write:
+            self.storage.set_rooms({"vox_b": "!b:x"})
+            assert self.storage.get_room("vox_a") == "!a:x"
+            write.assert_not_called()
+
+    def test_local_echo_reconciles_with_server_copy(self):
+        """Test a sent message and its synced copy are stored once, gaining the event ID."""
+        echo = self._message("hi", "2025-01-01T12:00:00Z")
+        echo.txn_id = "txn1"
+        server_copy = self._message("hi", "2025-01-01T12:00:00Z", event_id="$srv")
+        server_copy.txn_id = "txn1"
+        same_second = self._message("hi", "2025-01-01T12:00:00Z", event_id="$other")
+
+        self.storage.save_messages("conv_abc123", "user2", [echo])
+        self.storage.save_messages("conv_abc123", "user2", [server_copy, same_second])
+
+        history = self.storage.get_history("conv_abc123")
+        assert [(m.event_id, m.txn_id) for m in history.messages] == [("$srv", "txn1"), ("$other", None)]
+
+    def test_upgrades_history_db_without_txn_id(self):
+        """Test a history.db created before transaction IDs gains the column."""
+        import sqlite3
+
+        vox_home = Path(tempfile.mkdtemp())
+        db = sqlite3.connect(str(vox_home / "history.db"))
+        db.executescript(
+            "CREATE TABLE messages (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "conversation_id TEXT NOT NULL, dedupe_key TEXT NOT NULL, event_id TEXT, "
+            "from_vox_id TEXT NOT NULL, to_vox_id TEXT NOT NULL, timestamp TEXT NOT NULL, "
+            "body TEXT NOT NULL, UNIQUE (conversation_id, dedupe_key));"
+        )
+        db.close()
+
+        storage = Storage(vox_home)
+        msg = self._message("hi", "2025-01-01T12:00:00Z", event_id="$a")
+        msg.txn_id = "txn1"
+        storage.save_messages("conv_abc123", "user2", [msg])
+        assert storage.get_history("conv_abc123").messages[0].txn_id == "txn1"
+
+    def test_orders_mixed_timestamp_formats(self):
+        """Test ISO timestamps and integer server timestamps sort chronologically."""
+        self.storage.save_messages("conv_abc123", "user2", [
+            self._message("third", "2025-01-01T12:00:02.500000Z"),
+            self._message("first", str(1735732800000)),  # 2025-01-01T12:00:00Z
+            self._message("second", "2025-01-01T12:00:01"),
+        ])
+
+        history = self.storage.get_history("conv_abc123")
+        assert [m.body for m in history.messages] == ["first", "second", "third"]
+        assert [m.body for m in self.storage.iter_history(
+            "conv_abc123", after="2025-01-01T12:00:00Z"
+        )] == ["second", "third"]
+
+    def test_rejects_unparseable_timestamp_filters(self):
+        """Test bad cursors and search bounds raise, while bad stored timestamps sort first."""
+        self.storage.save_messages("conv_abc123", "user2", [
+            self._message("garbled", "not a time"),
+            self._message("revenue", "2025-01-01T12:00:00Z"),
+        ])
+
+        assert [m.body for m in self.storage.get_history("conv_abc123").messages] == [
+            "garbled", "revenue"
+        ]
+        with pytest.raises(ValueError, match="Invalid timestamp"):
+            list(self.storage.iter_history("conv_abc123", before="yesterday"))
+        with pytest.raises(ValueError, match="Invalid timestamp"):
+            list(self.storage.iter_history("conv_abc123", after="2025-13-01"))
+        with pytest.raises(ValueError, match="Invalid timestamp"):
+            self.storage.search("revenue", since="last week")
+        with pytest.raises(ValueError, match="Invalid timestamp"):
+            self.storage.search("revenue", until="soon")
+
+    def test_search_ranks_filters_and_paginates(self):
+        """Test full-text search with contact, conversation and time filters."""
+        self.storage.save_messages("conv_abc123", "analyst", [
+            self._message("Q4 revenue is up", "2025-01-01T12:00:00Z"),
+            self._message("Q4 Q4 revenue revenue summary", "2025-01-02T12:00:00Z"),
+            self._message("lunch?", "2025-01-03T12:00:00Z"),
+        ])
+        self.storage.save_messages("conv_other", "writer", [
+            self._message("draft for Q4 revenue report", "2025-01-04T12:00:00Z", conversation_id="conv_other"),
+        ])
+
+        hits = self.storage.search("q4 revenue")
+        assert len(hits) == 3
+        assert hits[0].message.body == "Q4 Q4 revenue revenue summary"
+        assert hits[0].score >= hits[-1].score
+
+        assert [h.with_contact for h in self.storage.search("revenue", contact="writer")] == ["writer"]
+        assert len(self.storage.search("revenue", conversation_id="conv_abc123")) == 2
+        assert [h.message.body for h in self.storage.search(
+            "revenue", since="2025-01-02T00:00:00Z", until="2025-01-03T00:00:00Z"
+        )] == ["Q4 Q4 revenue revenue summary"]
+        page = self.storage.search("revenue", limit=2) + self.storage.search("revenue", limit=2, offset=2)
+        assert len({h.message.body for h in page}) == 3
+        assert self.storage.search("lunch?")[0].message.body == "lunch?"
+        with pytest.raises(ValueError):
+            self.storage.search("   ")
+
+    def test_search_indexes_existing_history(self):
+        """Test messages saved before the index existed are searchable."""
+        self.storage.save_messages("conv_abc123", "user2", [self._message("needle", "2025-01-01T12:00:00Z")])
+        self.storage.db.executescript("DROP TRIGGER messages_fts_insert; DROP TABLE messages_fts;")
+        self.storage.close()
+
+        assert [h.message.body for h in Storage(Path(self.temp_dir)).search("needle")] == ["needle"]
+
+    def test_directory_snapshot_prefix_search(self):
+        """Test directory upserts/removals and prefix matching over IDs and descriptions."""
+        self.storage.update_directory([
+            DirectoryEntry(user_id="@vox_analyst:x", vox_id="vox_analyst", description="Quarterly revenue reports"),
+            DirectoryEntry(user_id="@vox_writer:x", vox_id="vox_writer", description="Drafts blog posts"),
+        ])
+        self.storage.update_directory(
+            [DirectoryEntry(user_id="@vox_writer:x", vox_id="vox_writer", description="Drafts revenue memos")],
+            removed=["@vox_analyst:x"],
+        )
+
+        assert [e.vox_id for e in self.storage.search_directory("rev")] == ["vox_writer"]
+        assert [e.vox_id for e in self.storage.search_directory("writ memo")] == ["vox_writer"]
+        assert self.storage.search_directory("blog") == []
+        assert self.storage.search_directory("analyst") == []
+        assert len(self.storage.search_directory("")) == 1
+
+    def test_attachments_and_media_index(self):
+        """Test attachments round-trip and announced hashes never override verified ones."""
+        attachment = Attachment(url="mxc://x/a", name="a.csv", size=3, mimetype="text/csv", sha256="claimed")
+        msg = Message(
+            from_vox_id="vox_alice", to_vox_id="vox_bob", timestamp="2025-01-01T00:00:00Z",
+            conversation_id="conv_1", body="a.csv", event_id="$1", attachment=attachment,
+        )
+        self.storage.record_media("mxc://x/a", "real", 3, "text/csv", verified=True)
+        self.storage.save_messages("conv_1", "alice", [msg])
+
+        assert self.storage.get_history("conv_1").messages[0].attachment == attachment
+        assert self.storage.get_media_sha256("mxc://x/a") == "real"
+        assert self.storage.find_media_url("real") == "mxc://x/a"
+
+        self.storage.save_messages("conv_1", "alice", [msg.model_copy(update={
+            "event_id": "$2", "attachment": attachment.model_copy(update={"url": "mxc://x/b"}),
+        })])
+        assert self.storage.get_media_sha256("mxc://x/b") == "claimed"
+        assert self.storage.find_media_url("claimed") is None
+
+    def test_concurrent_writers_lose_nothing(self):
+        """Test separate Storage instances (as separate processes would) never drop updates."""
+        def writer(n):
+            storage = Storage(Path(self.temp_dir))
+            for i in range(20):
+                storage.add_contact(f"c{n}_{i}", f"vox_{n}_{i}")
+                storage.set_room(f"vox_{n}_{i}", f"!r{n}_{i}:x")
+                storage.set_sync_token(f"s{n}_{i}")
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        fresh = Storage(Path(self.temp_dir))
+        assert len(fresh.get_contacts()) == 120
+        assert all(fresh.get_room(f"vox_{n}_19") for n in range(6))
+        assert fresh.get_sync_token().startswith("s")
+        assert not list(Path(self.temp_dir).glob(".*.tmp"))
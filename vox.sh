@@ -260,22 +260,30 @@ EOF
     fi
 }
 
-cmd_inbox() {
-    load_config
-    local from_contact=""
-    while [[ $# -gt 0 ]]; do
-        case $1 in
-            --from) from_contact="$2"; shift 2;;
-            *) shift;;
-        esac
-    done
+# Same defaults as `vox inbox`: the server may hold a sync open for 30s,
+# and --wait without a value waits up to 300s.
+DEFAULT_INBOX_TIMEOUT=30
+DEFAULT_INBOX_WAIT=300
+
+is_seconds() {
+    [[ "$1" =~ ^[0-9]+([.][0-9]+)?$ ]]
+}
 
+require_seconds() {
+    if ! is_seconds "$2"; then
+        echo "❌ $1 expects a number of seconds, got '$2'" >&2
+        exit 3
+    fi
+}
+
+# One sync: join invites, save the token, print conversations as a JSON array.
+inbox_sync() {
     local sync_token=""
     if [ -f "$VOX_HOME/sync_token" ]; then
         sync_token=$(cat "$VOX_HOME/sync_token")
     fi
     
-    local endpoint="/_matrix/client/v3/sync?timeout=0"
+    local endpoint="/_matrix/client/v3/sync?timeout=$1"
     if [ -n "$sync_token" ]; then
         endpoint="$endpoint&since=$sync_token"
     fi
@@ -284,8 +292,8 @@ cmd_inbox() {
     local has_error=$(echo "$sync_res" | jq -r '.error // empty')
     
     if [ -n "$has_error" ]; then
-        echo "[]" 
-        exit 0
+        echo "[]"
+        return
     fi
 
     # Auto-join invites
@@ -323,7 +331,62 @@ cmd_inbox() {
                 }
             )
         ) catch []
-    ' | jq '.' || echo "[]"
+    ' || echo "[]"
+}
+
+cmd_inbox() {
+    load_config
+    local from_contact=""
+    local timeout="$DEFAULT_INBOX_TIMEOUT"
+    local wait=""
+    local min_messages=1
+    while [[ $# -gt 0 ]]; do
+        case $1 in
+            --from) from_contact="$2"; shift 2;;
+            --timeout) require_seconds --timeout "$2"; timeout="$2"; shift 2;;
+            --wait)
+                if is_seconds "$2"; then
+                    wait="$2"; shift 2
+                else
+                    wait="$DEFAULT_INBOX_WAIT"; shift
+                fi
+                ;;
+            --min-messages)
+                if ! [[ "$2" =~ ^[1-9][0-9]*$ ]]; then
+                    echo "❌ --min-messages expects a positive integer, got '$2'" >&2
+                    exit 3
+                fi
+                min_messages="$2"; shift 2
+                ;;
+            *) shift;;
+        esac
+    done
+
+    if [ -z "$wait" ]; then
+        inbox_sync "$(awk -v s="$timeout" 'BEGIN { printf "%d", s * 1000 }')" | jq '.'
+        return
+    fi
+
+    # Long-poll until enough messages arrive or the wait runs out
+    local deadline=$(awk -v s="$wait" -v now="$(date +%s)" 'BEGIN { printf "%d", now + s }')
+    local collected="[]"
+    while true; do
+        local started=$(date +%s)
+        local remaining=$(( deadline - started ))
+        [ "$remaining" -lt 0 ] && remaining=0
+        [ "$remaining" -gt "$DEFAULT_INBOX_TIMEOUT" ] && remaining="$DEFAULT_INBOX_TIMEOUT"
+        collected=$(jq -c -n --argjson a "$collected" --argjson b "$(inbox_sync $(( remaining * 1000 )))" '
+            $a + $b | group_by(.conversation_id)
+            | map(.[0] + {messages: (map(.messages) | add)})
+        ')
+        local count=$(echo "$collected" | jq '[.[].messages[]] | length')
+        if [ "$count" -ge "$min_messages" ] || [ "$(date +%s)" -ge "$deadline" ]; then
+            break
+        fi
+        # A failed sync returns at once; don't spin on it
+        [ "$(date +%s)" -eq "$started" ] && sleep 1
+    done
+    echo "$collected" | jq '.'
 }
 
 if ! command -v curl &> /dev/null || ! command -v jq &> /dev/null; then
@@ -347,7 +410,7 @@ case $1 in
         echo "  status                     Check connection"
         echo "  contact <add|list|remove>  Manage contacts"
         echo "  send <contact> <msg>       Send a message"
-        echo "  inbox [--from <contact>]   Check messages"
+        echo "  inbox [--from <contact>] [--timeout <s>] [--wait [s]] [--min-messages N]   Check messages"
         exit 1
         ;;
 esac